@@ -0,0 +1,382 @@
+"""
+视频流负载压测：N个摄像头 × 每个摄像头M个原始流观看者 × K个处理流
+
+在进程内启动回放摄像头（默认合成图片序列）和只包含摄像头路由的FastAPI应用，
+通过httpx并发拉取原始MJPEG流和处理后MJPEG流，统计：
+  - 每个客户端实际收到的帧率和数据量
+  - 采集到客户端的延迟分位数（根据MJPEG分段中的X-Timestamp采集时间计算）
+  - 每个采集线程和处理线程的CPU占用、进程总CPU占用
+  - 按类别统计的线程数
+结果输出为JSON报告，便于对比不同版本。
+
+用法（在项目根目录执行）:
+  python -m src.backend.benchmarks.stream_load --cameras 4 --viewers 8 --duration 30
+  python -m src.backend.benchmarks.stream_load --cameras 2 --operations 1,pipeline:3 --output report.json
+  python -m src.backend.benchmarks.stream_load --source "file:///data/line1.mp4?fps=25"
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import httpx
+import numpy as np
+import psutil
+import uvicorn
+from fastapi import FastAPI
+
+from ..routers import camera as camera_router
+from ..services.camera import camera_service
+
+# 线程名前缀到统计类别的映射，与CameraService中的线程命名一致
+THREAD_CATEGORIES = (
+    ('camera-stream-', 'capture'),
+    ('processed-stream-', 'processing'),
+    ('camera-supervisor', 'supervisor'),
+    ('camera-probe-', 'probe'),
+)
+
+
+def parse_operations(spec: str) -> List[Tuple[int, str]]:
+    """解析处理流列表，如 "1,pipeline:3" -> [(1, 'operation'), (3, 'pipeline')]"""
+    operations = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        operation_type, _, operation_id = item.rpartition(':')
+        operations.append((int(operation_id), operation_type or 'operation'))
+    return operations
+
+
+def create_synthetic_source(directory: str, resolution: Tuple[int, int], fps: float, frames: int = 30) -> str:
+    """生成带移动色块和噪声的合成图片序列，返回dir://回放源URL"""
+    width, height = resolution
+    rng = np.random.default_rng(0)
+    for i in range(frames):
+        image = rng.integers(0, 40, (height, width, 3), dtype=np.uint8)
+        x = int((width - width // 5) * i / max(1, frames - 1))
+        cv2.rectangle(image, (x, height // 3), (x + width // 5, 2 * height // 3), (40, 180, 240), -1)
+        cv2.putText(image, f"{i:04d}", (20, 60), cv2.FONT_HERSHEY_SIMPLEX, 2, (255, 255, 255), 3)
+        cv2.imwrite(os.path.join(directory, f"{i:04d}.jpg"), image)
+    return f"dir://{directory}?fps={fps:g}&loop=1&cache=1"
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {'count': 0}
+    data = np.asarray(values)
+    return {
+        'count': int(data.size),
+        'avg': round(float(data.mean()), 2),
+        'p50': round(float(np.percentile(data, 50)), 2),
+        'p95': round(float(np.percentile(data, 95)), 2),
+        'p99': round(float(np.percentile(data, 99)), 2),
+        'max': round(float(data.max()), 2),
+    }
+
+
+class StreamClient:
+    """一个MJPEG流观看客户端，解析分段并记录测量窗口内的帧数、字节数和延迟"""
+
+    def __init__(self, kind: str, camera_id: str, url: str, params: Dict):
+        self.kind = kind
+        self.camera_id = camera_id
+        self.url = url
+        self.params = params
+        self.frames = 0
+        self.bytes = 0
+        self.latencies_ms: List[float] = []
+        self.errors = 0
+        self.error: Optional[str] = None
+        self.measuring = False
+
+    def _on_frame(self, headers: Dict[str, str], body: bytes) -> None:
+        if not self.measuring:
+            return
+        capture_time = float(headers.get('x-timestamp', 0) or 0)
+        if not capture_time:
+            # 等待/错误提示帧不带采集时间
+            self.errors += 1
+            return
+        self.frames += 1
+        self.bytes += len(body)
+        self.latencies_ms.append((time.time() - capture_time) * 1000)
+
+    async def run(self, client: httpx.AsyncClient) -> None:
+        buffer = bytearray()
+        try:
+            async with client.stream('GET', self.url, params=self.params) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_raw():
+                    buffer += chunk
+                    while True:
+                        header_end = buffer.find(b'\r\n\r\n')
+                        if header_end < 0:
+                            break
+                        headers = {}
+                        for line in bytes(buffer[:header_end]).decode('latin-1').split('\r\n'):
+                            name, sep, value = line.partition(':')
+                            if sep:
+                                headers[name.strip().lower()] = value.strip()
+                        length = int(headers.get('content-length', -1))
+                        if length < 0:
+                            # 不带长度的提示帧，跳到下一个分段
+                            next_part = buffer.find(b'\r\n--', header_end + 4)
+                            if next_part < 0:
+                                break
+                            self._on_frame(headers, b'')
+                            del buffer[:next_part + 2]
+                            continue
+                        body_end = header_end + 4 + length
+                        if len(buffer) < body_end + 2:
+                            break
+                        self._on_frame(headers, bytes(buffer[header_end + 4:body_end]))
+                        del buffer[:body_end + 2]
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.error = str(e)
+
+    def report(self, duration: float) -> Dict:
+        return {
+            'kind': self.kind,
+            'camera_id': self.camera_id,
+            'params': self.params,
+            'fps': round(self.frames / duration, 2),
+            'frames': self.frames,
+            'kbps': round(self.bytes * 8 / 1000 / duration, 1),
+            'latency_ms': percentiles(self.latencies_ms),
+            'placeholder_frames': self.errors,
+            'error': self.error,
+        }
+
+
+def thread_category(name: str) -> str:
+    for prefix, category in THREAD_CATEGORIES:
+        if name.startswith(prefix):
+            return category
+    return 'other'
+
+
+def sample_threads(process: psutil.Process) -> Dict[int, Tuple[str, float]]:
+    """返回 本地线程ID -> (线程名, 累计CPU秒数)"""
+    names = {t.native_id: t.name for t in threading.enumerate()}
+    return {
+        t.id: (names.get(t.id, f"native-{t.id}"), t.user_time + t.system_time)
+        for t in process.threads()
+    }
+
+
+def summarize_clients(clients: List[StreamClient], duration: float) -> Dict:
+    summary = {}
+    for kind in ('raw', 'processed'):
+        group = [c for c in clients if c.kind == kind]
+        if not group:
+            continue
+        fps = [c.frames / duration for c in group]
+        latencies = [value for c in group for value in c.latencies_ms]
+        summary[kind] = {
+            'clients': len(group),
+            'failed_clients': sum(1 for c in group if c.error),
+            'fps': {
+                'avg': round(float(np.mean(fps)), 2),
+                'min': round(float(np.min(fps)), 2),
+                'max': round(float(np.max(fps)), 2),
+            },
+            'latency_ms': percentiles(latencies),
+        }
+    return summary
+
+
+def start_server(port: int) -> Tuple[uvicorn.Server, threading.Thread]:
+    app = FastAPI(title="camera stream benchmark")
+    app.include_router(camera_router.router)
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+    thread = threading.Thread(target=server.run, name='benchmark-server', daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("压测服务器启动失败")
+        time.sleep(0.05)
+    return server, thread
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def run_clients(clients: List[StreamClient], args, process: psutil.Process) -> Dict:
+    limits = httpx.Limits(max_connections=len(clients) + 8, max_keepalive_connections=0)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None), limits=limits) as http:
+        tasks = [asyncio.create_task(c.run(http)) for c in clients]
+        await asyncio.sleep(args.warmup)
+
+        # 测量窗口：只统计预热之后的帧和CPU
+        threads_before = sample_threads(process)
+        cpu_before = process.cpu_times()
+        wall_start = time.time()
+        for c in clients:
+            c.measuring = True
+        await asyncio.sleep(args.duration)
+        for c in clients:
+            c.measuring = False
+        duration = time.time() - wall_start
+        cpu_after = process.cpu_times()
+        threads_after = sample_threads(process)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    per_thread = []
+    categories: Dict[str, Dict] = {}
+    for tid, (name, cpu) in threads_after.items():
+        used = cpu - threads_before.get(tid, (name, 0.0))[1]
+        category = thread_category(name)
+        entry = categories.setdefault(category, {'threads': 0, 'cpu_percent': 0.0})
+        entry['threads'] += 1
+        entry['cpu_percent'] = round(entry['cpu_percent'] + used / duration * 100, 2)
+        if category in ('capture', 'processing'):
+            per_thread.append({'thread': name, 'cpu_percent': round(used / duration * 100, 2)})
+    process_cpu = (cpu_after.user + cpu_after.system) - (cpu_before.user + cpu_before.system)
+
+    return {
+        'duration': round(duration, 2),
+        'clients': [c.report(duration) for c in clients],
+        'summary': summarize_clients(clients, duration),
+        'cpu': {
+            'process_percent': round(process_cpu / duration * 100, 2),
+            'by_category': categories,
+            'per_stream': sorted(per_thread, key=lambda item: item['thread']),
+        },
+        'threads': {
+            'total': process.num_threads(),
+            'python': threading.active_count(),
+            'by_category': {k: v['threads'] for k, v in categories.items()},
+        },
+    }
+
+
+def run_benchmark(args) -> Dict:
+    operations = parse_operations(args.operations)
+    width, height = (int(v) for v in args.resolution.lower().split('x'))
+    needed_clients = args.viewers + len(operations) * args.processed_viewers
+    camera_service.max_clients_per_camera = max(camera_service.max_clients_per_camera, needed_clients)
+
+    workdir = None
+    source = args.source
+    if not source:
+        workdir = tempfile.mkdtemp(prefix='stream_load_')
+        source = create_synthetic_source(workdir, (width, height), args.fps)
+
+    camera_ids = [f"camera_bench{i}" for i in range(args.cameras)]
+    server = None
+    try:
+        for camera_id in camera_ids:
+            if not camera_service.open_camera(camera_id, source) or not camera_service.start_stream(camera_id):
+                raise RuntimeError(f"无法打开压测摄像头 {camera_id}: {source}")
+
+        port = args.port or free_port()
+        server, _ = start_server(port)
+        base_url = f"http://127.0.0.1:{port}/api/cameras"
+
+        clients = []
+        raw_params = {k: v for k, v in (('width', args.width), ('quality', args.quality)) if v}
+        for camera_id in camera_ids:
+            url = f"{base_url}/{camera_id}/stream"
+            clients += [StreamClient('raw', camera_id, url, dict(raw_params)) for _ in range(args.viewers)]
+            for operation_id, operation_type in operations:
+                params = {
+                    'operation_id': operation_id,
+                    'operation_type': operation_type,
+                    'backpressure': args.backpressure,
+                }
+                clients += [StreamClient('processed', camera_id, url, dict(params))
+                            for _ in range(args.processed_viewers)]
+
+        process = psutil.Process()
+        result = asyncio.run(run_clients(clients, args, process))
+
+        return {
+            'benchmark': 'stream_load',
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'config': {
+                'cameras': args.cameras,
+                'viewers_per_camera': args.viewers,
+                'operations': [{'operation_id': i, 'operation_type': t} for i, t in operations],
+                'processed_viewers': args.processed_viewers,
+                'source': source if args.source else 'synthetic',
+                'fps': args.fps,
+                'resolution': args.resolution,
+                'width': args.width,
+                'quality': args.quality,
+                'backpressure': args.backpressure,
+                'warmup': args.warmup,
+                'capture_mode': camera_service.capture_mode,
+            },
+            'system': {
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'cpu_count': os.cpu_count(),
+                'opencv': cv2.__version__,
+            },
+            **result,
+            'cameras': {camera_id: camera_service.get_camera_status(camera_id) for camera_id in camera_ids},
+        }
+    finally:
+        if server is not None:
+            server.should_exit = True
+        for camera_id in camera_ids:
+            camera_service.close_camera(camera_id)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="摄像头视频流负载压测")
+    parser.add_argument('--cameras', type=int, default=2, help="摄像头数量 N")
+    parser.add_argument('--viewers', type=int, default=4, help="每个摄像头的原始流观看者数量 M")
+    parser.add_argument('--operations', default='',
+                        help="每个摄像头的处理流列表 K，逗号分隔，如 1,pipeline:3（需数据库中存在）")
+    parser.add_argument('--processed-viewers', type=int, default=1, help="每个处理流的观看者数量")
+    parser.add_argument('--source', default=None,
+                        help="回放源URL（file://或dir://），默认生成合成图片序列")
+    parser.add_argument('--fps', type=float, default=25, help="合成源帧率")
+    parser.add_argument('--resolution', default='1280x720', help="合成源分辨率")
+    parser.add_argument('--width', type=int, default=None, help="原始流观看者请求的缩放宽度")
+    parser.add_argument('--quality', type=int, default=None, help="原始流观看者请求的JPEG质量")
+    parser.add_argument('--backpressure', default='latest', help="处理流背压策略")
+    parser.add_argument('--warmup', type=float, default=3.0, help="预热秒数，不计入统计")
+    parser.add_argument('--duration', type=float, default=20.0, help="测量秒数")
+    parser.add_argument('--port', type=int, default=0, help="压测服务器端口，默认随机")
+    parser.add_argument('--output', default=None, help="报告输出路径，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        summary = report['summary']
+        for kind, item in summary.items():
+            print(f"{kind}: {item['clients']} 个客户端, 平均 {item['fps']['avg']} FPS, "
+                  f"延迟 p50 {item['latency_ms'].get('p50')}ms / p95 {item['latency_ms'].get('p95')}ms")
+        print(f"进程CPU: {report['cpu']['process_percent']}%, 线程数: {report['threads']['total']}")
+        print(f"报告已保存到 {args.output}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -75,8 +75,12 @@ def auto_detect_cameras():
     
     try:
         print("Starting camera detection...")
-        # 检测可用摄像头
-        detected_cameras = camera_service.detect_cameras()
+        # 检测可用摄像头（并发探测，耗时约为单个探测的超时时间）
+        # 网络摄像头由update_camera_urls按设备配置连接，这里只自动注册本地摄像头
+        detected_cameras = [
+            camera for camera in camera_service.detect_cameras(refresh=True)
+            if isinstance(camera['device_id'], int)
+        ]
         
         if detected_cameras:
             print(f"检测到 {len(detected_cameras)} 个摄像头")
@@ -145,6 +149,10 @@ def auto_detect_cameras():
                                     for device in matching_devices:
                                         settings_service.update_device_status(device.id, "online")
                                         print(f"已更新设备 {device.name} (ID: {device.id}) 状态为online")
+                                        # 按设备配置启动巡检任务
+                                        jobs = camera_service.start_device_inspections(camera_id, device.config, device.id)
+                                        if jobs:
+                                            print(f"启动巡检任务: {device.name} ({jobs} 个)")
                             else:
                                 print(f"无法启动摄像头流: {camera['name']}")
                     except Exception as cam_e:
@@ -166,7 +174,7 @@ def auto_detect_cameras():
 
 
 def update_camera_urls():
-    """更新所有摄像头的RTSP/HTTP流URL"""
+    """更新所有摄像头的RTSP/HTTP流URL和回放源(file:// 视频文件, dir:// 图片文件夹)"""
     # 等待应用启动完成
     time.sleep(3)
     
@@ -191,16 +199,20 @@ def update_camera_urls():
                         
                     # 检查配置是否包含URL
                     source = device.config.get('source', '')
-                    if source and (source.startswith('rtsp://') or source.startswith('http://')):
+                    if source and source.startswith(('rtsp://', 'http://', 'file://', 'dir://')):
                         print(f"更新摄像头URL: {device.name} ({source})")
                         camera_id = f"camera_{device.id}"
                         
                         # 尝试打开并启动流
-                        if camera_service.open_camera(camera_id, source):
+                        if camera_service.open_camera(camera_id, source, device.config):
                             if camera_service.start_stream(camera_id):
                                 print(f"成功连接到摄像头流: {device.name}")
                                 # 更新设备状态
                                 settings_service.update_device_status(device.id, "online")
+                                # 按设备配置启动巡检任务
+                                jobs = camera_service.start_device_inspections(camera_id, device.config, device.id)
+                                if jobs:
+                                    print(f"启动巡检任务: {device.name} ({jobs} 个)")
                             else:
                                 print(f"无法启动摄像头流: {device.name}")
                                 settings_service.update_device_status(device.id, "offline")
@@ -273,10 +285,9 @@ def preload_all_models():
 async def startup_event():
     print("应用启动中...")
     # 在后台线程中运行摄像头检测
-    auto_detect_cameras()
+    threading.Thread(target=auto_detect_cameras, daemon=True).start()
     update_camera_urls()
     preload_all_models()
-    # threading.Thread(target=auto_detect_cameras, daemon=True).start()
     
     # # 添加一个任务更新所有摄像头URL
     # threading.Thread(target=update_camera_urls, daemon=True).start()
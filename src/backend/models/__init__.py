@@ -4,7 +4,7 @@ from datetime import datetime
 from enum import Enum as PyEnum
 from .base import Base, engine
 from typing import Any, List, Dict, Optional
-from typing_extensions import TypedDict
+from typing_extensions import NotRequired, TypedDict
 
 class DatasetType(PyEnum):
     TEXT_REGION = 'text_region'  # 文本区域数据集
@@ -56,6 +56,7 @@ class ParamConfig(TypedDict):
     description: str        # 参数描述
     default: Any           # 默认值
     required: bool         # 是否必需
+    decode_scale: NotRequired[Optional[int]]  # 图像参数的缩小解码比例（1/2/4/8），处理前按该比例解码或缩小输入帧
 
 class NodeType(PyEnum):
     START = 'start'         # 开始节点
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, Response, Request, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Response, Request, UploadFile, File, Form, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from typing import List, Dict, Optional, Any
 from pydantic import BaseModel
-from ..services.camera import camera_service
+from ..services.camera import camera_service, ProcessedStream, InspectionJob
 from ..services.settings import SettingsService
 from sqlalchemy.orm import Session
 from ..dependencies import get_db
@@ -10,6 +11,9 @@ import logging
 import numpy as np
 import cv2
 import base64
+import json
+import struct
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -19,33 +23,151 @@ class ProcessingRequest(BaseModel):
     operation_id: int                    # 操作ID
     operation_type: str = "operation"    # 操作类型：'operation' 或 'pipeline'
 
+# 巡检任务请求模型
+class InspectionJobRequest(BaseModel):
+    operation_id: int                    # 操作ID或流水线ID
+    operation_type: str = "operation"    # 操作类型：'operation' 或 'pipeline'
+    trigger: str = "continuous"          # 触发策略：'continuous'、'interval' 或 'change'
+    interval: float = 1.0                # 'interval'策略下的处理间隔（秒）
+    backpressure: str = "latest"         # 处理流背压策略
+    queue_size: int = 2                  # 'queue'策略下最多积压的帧数
+
 router = APIRouter(
     prefix="/api/cameras",
     tags=["cameras"]
 )
 
 @router.get("/detect", response_model=List[Dict])
-def detect_cameras():
-    """检测系统中可用的摄像头"""
-    return camera_service.detect_cameras()
+def detect_cameras(refresh: bool = False):
+    """
+    检测系统中可用的摄像头（本地摄像头和已配置的网络摄像头）
+    默认返回缓存的检测结果（过期时在后台刷新），refresh=true时重新扫描
+    """
+    return camera_service.detect_cameras(refresh=refresh)
+
+@router.get("/inspections")
+def list_inspection_jobs(camera_id: Optional[str] = None):
+    """获取巡检任务列表及其状态，可按摄像头过滤"""
+    if camera_id and not camera_id.startswith("camera_") and camera_id.isdigit():
+        camera_id = f"camera_{camera_id}"
+    return camera_service.get_inspection_jobs(camera_id)
+
+@router.get("/inspections/{job_id}")
+def get_inspection_job(job_id: str):
+    """获取巡检任务状态"""
+    jobs = [job for job in camera_service.get_inspection_jobs() if job["job_id"] == job_id]
+    if not jobs:
+        raise HTTPException(status_code=404, detail=f"未找到巡检任务 {job_id}")
+    return jobs[0]
+
+@router.get("/inspections/{job_id}/results")
+async def get_inspection_results(job_id: str, since: int = 0, timeout: float = 0.0):
+    """获取巡检任务的处理结果
+    
+    参数:
+    - since: 只返回结果序号大于since的结果，客户端以上次返回的seq增量读取
+    - timeout: 可选，没有新结果时最多等待的秒数（长轮询，最大30秒），默认立即返回
+    
+    返回 {"seq": 最新结果序号, "results": [...]}，每条结果包含源帧采集时间、处理耗时和操作的非图像输出；
+    结果通道只保留最近的结果，读取间隔过长时较早的结果会丢失
+    """
+    # 注册表锁可能在启动处理流期间被持有，查找放到线程池中执行
+    job = await run_in_threadpool(camera_service.get_inspection_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"未找到巡检任务 {job_id}")
+    seq, results = await job.wait_for_results_async(since, min(max(timeout, 0.0), 30.0))
+    return {"seq": seq, "active": job.active, "results": results}
+
+@router.delete("/inspections/{job_id}")
+def stop_inspection_job(job_id: str):
+    """停止巡检任务，仍在观看该处理流的客户端不受影响"""
+    if not camera_service.stop_inspection_job(job_id):
+        raise HTTPException(status_code=404, detail=f"未找到巡检任务 {job_id}")
+    return {"status": "success", "message": f"已停止巡检任务 {job_id}"}
+
+def _prepare_stream(camera_id: str, operation_id: Optional[int], operation_type: str, db: Session,
+                    backpressure: str = "latest", queue_size: int = 2) -> None:
+    """打开摄像头并校验处理参数，涉及阻塞的摄像头和数据库操作，在线程池中执行"""
+    # 确保摄像头是打开的（打开过程不持有摄像头注册表锁，已打开时立即返回）
+    device_id = camera_id.replace("camera_", "")
+    try:
+        device_id = int(device_id)
+    except ValueError:
+        device_id = device_id  # 保持字符串格式
+        
+    if not camera_service.open_camera(camera_id, device_id):
+        logger.error(f"Failed to open camera {camera_id}")
+        raise HTTPException(status_code=404, detail=f"无法打开摄像头 {camera_id}")
+    
+    # 确保摄像头在流式传输（已在流式传输时直接返回）
+    if not camera_service.start_stream(camera_id):
+        logger.error(f"Failed to start camera stream {camera_id}")
+        raise HTTPException(status_code=500, detail=f"无法启动摄像头流 {camera_id}")
+    
+    # 普通流 - 无操作参数
+    if operation_id is None:
+        return
+    
+    # 处理流 - 验证操作参数
+    if not isinstance(operation_id, int) or operation_id <= 0:
+        raise HTTPException(status_code=422, detail=f"无效的操作ID: {operation_id}")
+        
+    if operation_type not in ["operation", "pipeline"]:
+        raise HTTPException(status_code=422, detail=f"无效的操作类型: {operation_type}")
+    
+    if backpressure not in ProcessedStream.BACKPRESSURE_POLICIES:
+        raise HTTPException(status_code=422, detail=f"无效的背压策略: {backpressure}")
+    
+    if queue_size < 1:
+        raise HTTPException(status_code=422, detail=f"无效的队列长度: {queue_size}")
+        
+    # 验证操作是否存在
+    if operation_type == "operation":
+        from ..services.cv_operation import CVOperationService
+        operation_service = CVOperationService(db)
+        operation = operation_service.get_operation(operation_id)
+        if not operation:
+            raise HTTPException(status_code=404, detail=f"未找到指定的操作 (ID: {operation_id})")
+    elif operation_type == "pipeline":
+        from ..services.pipeline import PipelineService
+        pipeline_service = PipelineService(db)
+        pipeline = pipeline_service.get_pipeline(operation_id)
+        if not pipeline:
+            raise HTTPException(status_code=404, detail=f"未找到指定的流水线 (ID: {operation_id})")
+    
+    # 获取或启动处理流
+    if camera_service.get_or_create_processed_stream(camera_id, operation_id, operation_type, db,
+                                                     backpressure, queue_size) is None:
+        raise HTTPException(status_code=500, detail="无法启动处理流")
 
 @router.get("/{camera_id}/stream")
-def stream_camera(
+async def stream_camera(
     camera_id: str,
     operation_id: Optional[int] = None,
     operation_type: str = "operation",
+    backpressure: str = "latest",
+    queue_size: int = 2,
+    width: Optional[int] = None,
+    quality: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
     """
     统一的摄像头流端点，支持普通流和处理流
+    流由异步生成器提供，观看客户端不占用线程池线程
     
     参数:
     - camera_id: 摄像头ID（数字或格式为camera_X）
     - operation_id: 可选，操作或流水线ID。如果提供则返回处理流，否则返回普通流
     - operation_type: 'operation'(默认) 或 'pipeline'，仅当operation_id存在时有效
+    - backpressure: 处理流背压策略，'latest'(默认，只处理最新帧) 或 'queue'(按顺序处理)，仅在新建处理流时生效
+    - queue_size: 'queue'策略下最多积压的帧数，默认2
+    - width: 可选，输出宽度（像素，只缩小不放大，保持宽高比），用于缩略图等场景
+    - quality: 可选，输出JPEG质量 (1-100)
+    请求相同width/quality的客户端共享同一份编码结果，每帧每种变体只编码一次
     
     返回:
     - 摄像头的MJPEG流（原始或经过处理）
+    - 超过每个摄像头的最大观看客户端数时返回503
     """
     try:
         # 规范化摄像头ID
@@ -54,65 +176,30 @@ def stream_camera(
         
         logger.info(f"Stream request - camera: {camera_id}, operation: {operation_id}, type: {operation_type}")
         
-        # 确保摄像头是打开的
-        with camera_service._cameras_lock:
-            if camera_id not in camera_service._cameras:
-                device_id = camera_id.replace("camera_", "")
-                try:
-                    device_id = int(device_id)
-                except ValueError:
-                    device_id = device_id  # 保持字符串格式
-                    
-                if not camera_service.open_camera(camera_id, device_id):
-                    logger.error(f"Failed to open camera {camera_id}")
-                    raise HTTPException(status_code=404, detail=f"无法打开摄像头 {camera_id}")
-            
-            # 确保摄像头在流式传输
-            if not camera_service._cameras[camera_id].is_streaming:
-                if not camera_service.start_stream(camera_id):
-                    logger.error(f"Failed to start camera stream {camera_id}")
-                    raise HTTPException(status_code=500, detail=f"无法启动摄像头流 {camera_id}")
+        if width is not None and width <= 0:
+            raise HTTPException(status_code=422, detail=f"无效的输出宽度: {width}")
+        if quality is not None and not 1 <= quality <= 100:
+            raise HTTPException(status_code=422, detail=f"无效的JPEG质量: {quality}")
+        
+        if not camera_service.can_accept_viewer(camera_id):
+            raise HTTPException(status_code=503, detail=f"摄像头 {camera_id} 观看客户端数已达上限")
+        
+        await run_in_threadpool(_prepare_stream, camera_id, operation_id, operation_type, db, backpressure, queue_size)
         
         # 普通流 - 无操作参数
         if operation_id is None:
             logger.info(f"Providing regular stream for camera {camera_id}")
             return StreamingResponse(
-                camera_service.get_mjpeg_frame_generator(camera_id),
+                camera_service.get_async_mjpeg_frame_generator(camera_id, width, quality),
                 media_type="multipart/x-mixed-replace; boundary=frame"
             )
         
-        # 处理流 - 验证操作参数
-        if not isinstance(operation_id, int) or operation_id <= 0:
-            raise HTTPException(status_code=422, detail=f"无效的操作ID: {operation_id}")
-            
-        if operation_type not in ["operation", "pipeline"]:
-            raise HTTPException(status_code=422, detail=f"无效的操作类型: {operation_type}")
-            
-        # 验证操作是否存在
-        if operation_type == "operation":
-            from ..services.cv_operation import CVOperationService
-            operation_service = CVOperationService(db)
-            operation = operation_service.get_operation(operation_id)
-            if not operation:
-                raise HTTPException(status_code=404, detail=f"未找到指定的操作 (ID: {operation_id})")
-        elif operation_type == "pipeline":
-            from ..services.pipeline import PipelineService
-            pipeline_service = PipelineService(db)
-            pipeline = pipeline_service.get_pipeline(operation_id)
-            if not pipeline:
-                raise HTTPException(status_code=404, detail=f"未找到指定的流水线 (ID: {operation_id})")
-        
-        # 获取或启动处理流
-        stream_key = camera_service.get_processed_stream_key(camera_id, operation_id, operation_type)
-        with camera_service._streams_lock:
-            if stream_key not in camera_service._processed_streams:
-                if not camera_service.start_processed_stream(camera_id, operation_id, operation_type, db):
-                    raise HTTPException(status_code=500, detail="无法启动处理流")
-        
         # 返回处理后的流
         logger.info(f"Providing processed stream for camera {camera_id} with operation {operation_id}")
         return StreamingResponse(
-            camera_service.get_processed_mjpeg_frame_generator(camera_id, operation_id, operation_type, db),
+            camera_service.get_async_processed_mjpeg_frame_generator(
+                camera_id, operation_id, operation_type, db, backpressure, queue_size, width, quality
+            ),
             media_type="multipart/x-mixed-replace; boundary=processedframe"
         )
     except HTTPException:
@@ -121,6 +208,111 @@ def stream_camera(
         logger.exception(f"Stream error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"视频流错误: {str(e)}")
 
+@router.post("/{camera_id}/inspections")
+def start_inspection_job(camera_id: str, request: InspectionJobRequest, db: Session = Depends(get_db)):
+    """启动巡检任务：在后台持续对摄像头应用操作或流水线，不需要观看客户端
+    
+    任务已存在时更新其触发策略。观看 /stream 或 /ws 的同一操作处理流的客户端直接附加到任务的输出，
+    处理结果通过 /api/cameras/inspections/{job_id}/results 读取
+    """
+    if not camera_id.startswith("camera_") and camera_id.isdigit():
+        camera_id = f"camera_{camera_id}"
+    
+    if request.trigger not in InspectionJob.TRIGGERS:
+        raise HTTPException(status_code=422, detail=f"无效的触发策略: {request.trigger}")
+    if request.trigger == "interval" and request.interval <= 0:
+        raise HTTPException(status_code=422, detail=f"无效的触发间隔: {request.interval}")
+    
+    # 打开摄像头、校验操作参数并启动处理流
+    _prepare_stream(camera_id, request.operation_id, request.operation_type, db,
+                    request.backpressure, request.queue_size)
+    
+    # 与按设备配置启动的任务一样关联到摄像头对应的设备
+    device_id = camera_service.get_camera_device_id(camera_id, db)
+    job, error = camera_service.start_inspection_job(
+        camera_id, request.operation_id, request.operation_type, request.trigger, request.interval,
+        request.backpressure, request.queue_size, device_id
+    )
+    if error:
+        raise HTTPException(status_code=500, detail=f"无法启动巡检任务: {error}")
+    return job.get_stats()
+
+@router.websocket("/{camera_id}/ws")
+async def stream_camera_websocket(
+    websocket: WebSocket,
+    camera_id: str,
+    operation_id: Optional[int] = None,
+    operation_type: str = "operation",
+    backpressure: str = "latest",
+    queue_size: int = 2,
+    width: Optional[int] = None,
+    quality: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    WebSocket视频流，带客户端确认的流量控制，参数与/stream相同
+    
+    每帧为一条二进制消息: 4字节大端头部长度 + UTF-8 JSON头部 + JPEG数据
+    头部: {"seq": 帧序号, "timestamp": 采集时间, "detections": 处理产生的非图像输出或null}
+    客户端每收到一帧后发送任意消息（如"ack"）确认，服务端收到确认后才发送当时的最新帧，
+    慢客户端自动获得较低的帧率，服务端不为其积压帧
+    """
+    # 规范化摄像头ID
+    if not camera_id.startswith("camera_") and camera_id.isdigit():
+        camera_id = f"camera_{camera_id}"
+    
+    await websocket.accept()
+    if width is not None and width <= 0:
+        await websocket.close(code=1008, reason=f"无效的输出宽度: {width}")
+        return
+    if quality is not None and not 1 <= quality <= 100:
+        await websocket.close(code=1008, reason=f"无效的JPEG质量: {quality}")
+        return
+    if not camera_service.can_accept_viewer(camera_id):
+        await websocket.close(code=1013, reason=f"摄像头 {camera_id} 观看客户端数已达上限")
+        return
+    
+    try:
+        await run_in_threadpool(_prepare_stream, camera_id, operation_id, operation_type, db, backpressure, queue_size)
+        frames = camera_service.get_async_frame_iterator(
+            camera_id, operation_id, operation_type, db, backpressure, queue_size, width, quality
+        )
+    except HTTPException as e:
+        await websocket.close(code=1008 if e.status_code < 500 else 1011, reason=str(e.detail))
+        return
+    
+    stream_key = (camera_service.get_processed_stream_key(camera_id, operation_id, operation_type)
+                  if operation_id is not None else camera_id)
+    logger.info(f"WebSocket stream - camera: {camera_id}, operation: {operation_id}, type: {operation_type}")
+    try:
+        async for frame in frames:
+            header = json.dumps({
+                "seq": frame.seq,
+                "timestamp": frame.timestamp,
+                "detections": frame.detections
+            }, ensure_ascii=False).encode('utf-8')
+            send_started = camera_service.record_delivery(stream_key, frame.timestamp)
+            await websocket.send_bytes(struct.pack('>I', len(header)) + header + frame.frame)
+            camera_service.record_stage(stream_key, 'send', time.perf_counter() - send_started)
+            
+            # 等待客户端确认后再取下一帧
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            camera_service.record_stage(stream_key, 'ack', time.perf_counter() - send_started)
+    except RuntimeError as e:
+        # 登记客户端失败（如摄像头不存在、客户端数已满）
+        logger.warning(f"WebSocket stream error - camera: {camera_id}: {str(e)}")
+        try:
+            await websocket.close(code=1011, reason=str(e))
+        except RuntimeError:
+            pass
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await frames.aclose()
+        logger.info(f"WebSocket stream closed - camera: {camera_id}")
+
 @router.get("/{camera_id}/snapshot")
 def get_camera_snapshot(
     camera_id: str, 
@@ -135,7 +327,11 @@ def get_camera_snapshot(
     - camera_id: 摄像头ID
     - operation_id: 可选，操作ID或流水线ID
     - operation_type: 操作类型，'operation'(默认)或'pipeline'
-    - return_json: 是否返回JSON格式数据，包含识别文字和置信度
+    - return_json: 是否返回JSON格式数据（图像为base64），默认直接返回image/jpeg二进制数据
+    
+    指定操作时，如果同一操作的处理流正在运行且有未过期的处理帧，直接返回该帧而不再处理；
+    二进制响应头 X-Snapshot-Source 表示来源：stream（处理流）、cache（上次快照结果）、processed（本次处理），
+    X-Sequence / X-Timestamp 为帧序号和源帧采集时间
     """
     try:
         # 规范化摄像头ID
@@ -144,25 +340,22 @@ def get_camera_snapshot(
         
         logger.info(f"快照请求 - 摄像头: {camera_id}, 操作: {operation_id}, 类型: {operation_type}, 返回JSON: {return_json}")
         
-        # 确保摄像头是打开的
-        with camera_service._cameras_lock:
-            if camera_id not in camera_service._cameras:
-                device_id = camera_id.replace("camera_", "")
-                try:
-                    device_id = int(device_id)
-                except ValueError:
-                    pass  # 保持原始字符串
-                    
-                if not camera_service.open_camera(camera_id, device_id):
-                    raise HTTPException(status_code=404, detail="无法打开摄像头")
-        
-        # 获取帧
-        success, frame_data = camera_service.get_frame(camera_id)
-        if not success or not frame_data:
-            raise HTTPException(status_code=500, detail="无法获取摄像头帧")
+        # 确保摄像头是打开的（打开过程不持有摄像头注册表锁，已打开时立即返回）
+        device_id = camera_id.replace("camera_", "")
+        try:
+            device_id = int(device_id)
+        except ValueError:
+            pass  # 保持原始字符串
+            
+        if not camera_service.open_camera(camera_id, device_id):
+            raise HTTPException(status_code=404, detail="无法打开摄像头")
         
         # 如果未指定操作，直接返回原始帧
         if operation_id is None:
+            success, frame_data = camera_service.get_frame(camera_id)
+            if not success or not frame_data:
+                raise HTTPException(status_code=500, detail="无法获取摄像头帧")
+            
             if return_json:
                 # 将原始帧转为base64
                 base64_data = base64.b64encode(frame_data).decode('utf-8')
@@ -182,67 +375,108 @@ def get_camera_snapshot(
         if operation_type not in ["operation", "pipeline"]:
             raise HTTPException(status_code=422, detail=f"无效的操作类型: {operation_type}")
         
-        # 如果需要返回JSON格式，但请求处理后的数据
-        if return_json:
-            try:
-                # 使用camera_service处理帧以避免线程问题
-                # 注意这里直接使用已有的apply_operation_to_frame方法处理图像，这是已经适配多线程的
-                processed_frame = camera_service.apply_operation_to_frame(frame_data, operation_id, operation_type, db)
-                
-                if not processed_frame:
-                    # 处理失败，返回原始图像
-                    base64_data = base64.b64encode(frame_data).decode('utf-8')
-                    return {
-                        "image": f"data:image/jpeg;base64,{base64_data}",
-                        "text": "",
-                        "confidence": 0,
-                        "passed": False,
-                        "error": "处理图像失败"
-                    }
-                
-                # 将处理后的图像转为base64
-                base64_data = base64.b64encode(processed_frame).decode('utf-8')
-                
-                # 简化的响应数据，不尝试提取文本和置信度
-                # 这样可以避免在此API中使用可能导致线程问题的代码
-                return {
-                    "image": f"data:image/jpeg;base64,{base64_data}",
-                    "text": "",  # 当前版本不支持提取文本
-                    "confidence": 0,  # 当前版本不支持提取置信度
-                    "passed": False  # 当前版本不支持判断通过状态
-                }
-                
-            except Exception as e:
-                logger.error(f"JSON处理图像失败: {str(e)}")
-                # 处理失败，返回原始图像和错误信息
+        # 优先复用同一操作的处理流已产生的处理帧，否则对最新帧处理一次（源帧未更新时复用上次结果）
+        processed_frame, info = camera_service.get_processed_snapshot(camera_id, operation_id, operation_type, db)
+        if not processed_frame:
+            logger.warning(f"操作处理失败，返回原始帧 - 摄像头: {camera_id}, 操作: {operation_id}")
+            frame_data = camera_service.get_frame(camera_id)[1]
+            if not frame_data:
+                raise HTTPException(status_code=500, detail="无法获取摄像头帧")
+            if return_json:
                 base64_data = base64.b64encode(frame_data).decode('utf-8')
                 return {
                     "image": f"data:image/jpeg;base64,{base64_data}",
                     "text": "",
                     "confidence": 0,
                     "passed": False,
-                    "error": str(e)
+                    "error": "处理图像失败"
                 }
-                
-        # 使用原有的处理流程返回图像数据
-        processed_frame = camera_service.apply_operation_to_frame(frame_data, operation_id, operation_type, db)
-        if not processed_frame:
-            logger.warning(f"操作处理失败，返回原始帧 - 摄像头: {camera_id}, 操作: {operation_id}")
             return Response(content=frame_data, media_type="image/jpeg")
         
-        logger.info(f"成功应用操作到快照 - 摄像头: {camera_id}, 操作: {operation_id}")
-        return Response(content=processed_frame, media_type="image/jpeg")
+        if return_json:
+            # 简化的响应数据，不尝试提取文本和置信度
+            base64_data = base64.b64encode(processed_frame).decode('utf-8')
+            return {
+                "image": f"data:image/jpeg;base64,{base64_data}",
+                "text": "",  # 当前版本不支持提取文本
+                "confidence": 0,  # 当前版本不支持提取置信度
+                "passed": False,  # 当前版本不支持判断通过状态
+                "source": info['source'],
+                "seq": info['seq'],
+                "capture_time": info['capture_time']
+            }
+        
+        # 二进制模式：直接返回JPEG，快照来源和源帧信息放在响应头中
+        return Response(
+            content=processed_frame,
+            media_type="image/jpeg",
+            headers={
+                "X-Snapshot-Source": info['source'],
+                "X-Sequence": str(info['seq']),
+                "X-Timestamp": f"{info['capture_time']:.6f}",
+                "Cache-Control": "no-store"
+            }
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"获取快照错误: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取快照错误: {str(e)}")
 
+@router.get("/{camera_id}/frame")
+def get_buffered_frame(
+    camera_id: str,
+    seq: Optional[int] = None,
+    at: Optional[float] = None
+):
+    """从帧历史缓冲区获取一帧JPEG图像，用于触发前取证
+    
+    参数:
+    - seq: 可选，帧序号
+    - at: 可选，Unix时间戳，返回该时刻摄像头的帧
+    - 都未指定时返回最新帧
+    """
+    if not camera_id.startswith("camera_") and camera_id.isdigit():
+        camera_id = f"camera_{camera_id}"
+    
+    result = camera_service.get_buffered_frame(camera_id, seq=seq, at=at)
+    if result is None:
+        raise HTTPException(status_code=404, detail="帧缓冲区中没有匹配的帧")
+    
+    frame, jpg_bytes = result
+    return Response(
+        content=jpg_bytes,
+        media_type="image/jpeg",
+        headers={
+            "X-Frame-Sequence": str(frame.seq),
+            "X-Frame-Timestamp": f"{frame.timestamp:.6f}"
+        }
+    )
+
 @router.get("/{camera_id}/status")
 def get_camera_status(camera_id: str):
-    """获取摄像头状态"""
+    """获取摄像头状态，包括各处理流的帧率、丢帧数和采集到输出延迟"""
+    # 规范化摄像头ID
+    if not camera_id.startswith("camera_") and camera_id.isdigit():
+        camera_id = f"camera_{camera_id}"
     return camera_service.get_camera_status(camera_id)
 
+@router.get("/{camera_id}/metrics")
+def get_camera_metrics(camera_id: str, reset: bool = False):
+    """获取摄像头及其处理流各阶段的耗时直方图
+    
+    阶段包括采集(capture)、编码(encode/encode_variant)、解码(decode)、等待处理(queue)、
+    处理(process，流水线另有各节点node:*)、处理结果编码(process_encode)、采集到发送(delivery)、发送(send)
+    以及WebSocket流从发送到收到客户端确认(ack)
+    
+    参数:
+    - reset: 可选，读取后清空直方图，便于按时间段观察
+    """
+    # 规范化摄像头ID
+    if not camera_id.startswith("camera_") and camera_id.isdigit():
+        camera_id = f"camera_{camera_id}"
+    return camera_service.get_metrics(camera_id, reset=reset)
+
 @router.post("/{camera_id}/stop-stream")
 def stop_camera_stream(camera_id: str):
     """停止摄像头流处理"""
@@ -251,19 +485,7 @@ def stop_camera_stream(camera_id: str):
         camera_id = f"camera_{camera_id}"
         
     try:
-        # 首先收集需要停止的流
-        streams_to_stop = []
-        with camera_service._streams_lock:
-            # 找到与该摄像头相关的所有处理流
-            for stream_key, stream in list(camera_service._processed_streams.items()):
-                if stream.camera_id == camera_id:
-                    streams_to_stop.append((stream.operation_id, stream.operation_type))
-        
-        # 在锁外停止收集到的流
-        success = False
-        for operation_id, operation_type in streams_to_stop:
-            if camera_service.stop_processed_stream(camera_id, operation_id, operation_type):
-                success = True
+        success = camera_service.stop_processed_streams(camera_id) > 0
         
         if success:
             return {"status": "success", "message": "成功停止视频流处理"}
@@ -285,6 +507,8 @@ def get_camera_urls(request: Request, camera_id: Optional[str] = None):
             "stream_url": f"{base_url}/api/cameras/{camera_id}/stream",
             "snapshot_url": f"{base_url}/api/cameras/{camera_id}/snapshot",
             "status_url": f"{base_url}/api/cameras/{camera_id}/status",
+            "metrics_url": f"{base_url}/api/cameras/{camera_id}/metrics",
+            "websocket_url": f"{base_url.replace('http', 'ws', 1)}/api/cameras/{camera_id}/ws",
             # 带操作的URL示例
             "with_operation": {
                 "stream": f"{base_url}/api/cameras/{camera_id}/stream?operation_id=1&operation_type=operation",
@@ -292,7 +516,11 @@ def get_camera_urls(request: Request, camera_id: Optional[str] = None):
             },
             "parameters": {
                 "operation_id": "操作或流水线的ID (可选)",
-                "operation_type": "操作类型: 'operation' (默认) 或 'pipeline'"
+                "operation_type": "操作类型: 'operation' (默认) 或 'pipeline'",
+                "backpressure": "处理流背压策略: 'latest' (默认，只处理最新帧) 或 'queue' (按顺序处理)",
+                "queue_size": "'queue'策略下最多积压的帧数，默认2",
+                "width": "输出宽度 (可选，用于缩略图)",
+                "quality": "输出JPEG质量 1-100 (可选)"
             }
         }
         return config
@@ -23,6 +23,7 @@ class ParamConfigBase(CamelModel):
     description: Optional[str] = Field(None, description="参数描述")
     default: Optional[Union[str, int, float, bool, dict, list]] = Field(None, description="默认值")
     required: bool = Field(False, description="是否必需")
+    decode_scale: Optional[int] = Field(None, description="图像参数的缩小解码比例（1、2、4、8分别表示原尺寸、1/2、1/4、1/8）")
 
     @validator('name')
     def validate_name(cls, v):
@@ -37,6 +38,12 @@ class ParamConfigBase(CamelModel):
             raise ValueError(f"参数类型必须是以下之一: {', '.join(valid_types)}")
         return v
 
+    @validator('decode_scale')
+    def validate_decode_scale(cls, v):
+        if v is not None and v not in (1, 2, 4, 8):
+            raise ValueError("解码比例必须是1、2、4或8")
+        return v
+
     @validator('default')
     def validate_default(cls, v, values):
         if v is None:
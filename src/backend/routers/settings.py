@@ -3,6 +3,7 @@ from typing import List, Dict, Optional, Any
 from sqlalchemy.orm import Session
 from ..dependencies import get_db
 from ..services.settings import SettingsService
+from ..services.camera import camera_service
 from pydantic import BaseModel, Field
 
 router = APIRouter(
@@ -103,28 +104,44 @@ def get_device(device_id: int, db: Session = Depends(get_db)):
 @router.post("/devices", response_model=DeviceResponse)
 def create_device(device: DeviceCreate, db: Session = Depends(get_db)):
     service = SettingsService(db)
-    return service.create_device(
+    created = service.create_device(
         name=device.name,
         type=device.type,
         model=device.model,
         config=device.config
     )
+    # 设备变更后重新加载摄像头状态写入器的视频源索引
+    camera_service.status_writer.invalidate_index()
+    return created
 
 @router.put("/devices/{device_id}", response_model=DeviceResponse)
 def update_device(device_id: int, device: DeviceUpdate, db: Session = Depends(get_db)):
     service = SettingsService(db)
     # Convert to dict and filter out None values
     device_dict = {k: v for k, v in device.dict().items() if v is not None}
-    return service.update_device(device_id, device_dict)
+    updated = service.update_device(device_id, device_dict)
+    if "config" in device_dict or "type" in device_dict:
+        # 视频源可能变化，重新加载设备索引
+        camera_service.status_writer.invalidate_index()
+    elif "status" in device_dict:
+        camera_service.status_writer.forget_device(device_id)
+    if updated.type == "camera" and "config" in device_dict and updated.config:
+        # 已打开的摄像头立即使用新的采集设置
+        camera_service.update_capture_settings(updated.config.get('source', ''), updated.config)
+    return updated
 
 @router.delete("/devices/{device_id}")
 def delete_device(device_id: int, db: Session = Depends(get_db)):
     service = SettingsService(db)
     if not service.delete_device(device_id):
         raise HTTPException(status_code=404, detail="Device not found")
+    camera_service.status_writer.invalidate_index()
     return {"message": "Device deleted successfully"}
 
 @router.put("/devices/{device_id}/status")
 def update_device_status(device_id: int, status: str, db: Session = Depends(get_db)):
     service = SettingsService(db)
-    return service.update_device_status(device_id, status) 
\ No newline at end of file
+    updated = service.update_device_status(device_id, status)
+    # 只修改状态不影响视频源索引，只需忘记该设备已写入的状态
+    camera_service.status_writer.forget_device(device_id)
+    return updated 
\ No newline at end of file
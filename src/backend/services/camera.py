@@ -1,15 +1,26 @@
 import cv2
+import asyncio
+import ctypes
 import threading
 import time
 import logging
+import weakref
+import math
 import os
 import platform
-from typing import List, Dict, Optional, Tuple, Union
+import random
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, List, Dict, NamedTuple, Optional, Tuple, Union
 import numpy as np
 from sqlalchemy.orm import Session
 from threading import RLock, Condition
 from dataclasses import dataclass
 from threading import Event
+from .camera_capture import (
+    HttpMjpegCapture, MjpegPassthroughCapture, PassthroughCapture, ReplayCapture, SharedMemoryCapture,
+    is_replay_source, jpeg_dimensions
+)
 
 logger = logging.getLogger(__name__)
 
@@ -18,26 +29,354 @@ if platform.system() == 'Darwin':  # Check if running on macOS
     os.environ['OPENCV_AVFOUNDATION_SKIP_AUTH'] = '1'
     print("Running on macOS: Set OPENCV_AVFOUNDATION_SKIP_AUTH=1 for camera access")
 
+# 缩小解码比例（分母）对应的OpenCV读取模式，JPEG直接按1/2、1/4、1/8解码比全尺寸解码后再缩小快数倍
+REDUCED_DECODE_MODES = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+def decode_scale_for_width(source_width: int, target_width: int) -> int:
+    """解码后宽度仍不小于target_width的最大缩小比例，target_width为0表示原始宽度"""
+    if target_width > 0:
+        for scale in (8, 4, 2):
+            if -(-source_width // scale) >= target_width:
+                return scale
+    return 1
+
 @dataclass
 class CameraInfo:
     """摄像头信息的数据类"""
     device_id: Union[int, str]
-    cap: cv2.VideoCapture
+    cap: Optional[cv2.VideoCapture]  # 打开或重连过程中为None
     is_streaming: bool = False
     thread: Optional[threading.Thread] = None
     last_frame: Optional[bytes] = None
     last_error: Optional[str] = None
     clients: int = 0
-    status: str = 'online'
+    status: str = 'online'  # 连接状态：connecting / online / degraded（读帧失败） / reconnecting / finished（回放结束）
     source_type: str = 'local'
+    closed: bool = False  # 已从注册表移除，由仍在运行的流线程退出时释放cap
+    capture_settings: Optional['CaptureSettings'] = None
+    frame_pool: Optional['FramePool'] = None  # 采集线程复用的预分配帧缓冲区
+
+    def is_open(self) -> bool:
+        """是否有可用的摄像头连接"""
+        return self.cap is not None and self.cap.isOpened()
+
+    def is_connecting(self) -> bool:
+        """是否正在打开或重新连接"""
+        return self.status in ('connecting', 'reconnecting')
+
+    def is_alive(self) -> bool:
+        """连接可用或正在（重新）连接，用于判断摄像头是否应被清理"""
+        return self.is_connecting() or self.is_open()
+
+class CaptureSettings:
+    """
+    摄像头采集设置，来自设备配置（Device.config）：
+    resolution（"1280x720"或[1280, 720]）和fps在打开摄像头时设置；
+    roi（[x, y, w, h]或{"x", "y", "width", "height"}，原始画面坐标）、rotate（0/90/180/270，顺时针）
+    和color（"bgr"或"gray"）在采集线程中依次应用，下游的编码、缓存和处理都使用变换后的帧；
+    passthrough为true时直接转发摄像头自身的MJPEG数据（本地摄像头或HTTP MJPEG流），只在需要像素时解码，
+    与ROI、旋转和颜色转换同时配置时这些变换优先，回退到解码采集；
+    fps同时是采集线程的节拍（0表示不限速，按视频源自身速度采集），
+    sync_group相同的摄像头共享节拍，在同一时刻grab
+    """
+    ROTATIONS = {
+        90: cv2.ROTATE_90_CLOCKWISE,
+        180: cv2.ROTATE_180,
+        270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    }
+    COLORS = ('bgr', 'gray')
+
+    def __init__(self, width: int = 640, height: int = 480, fps: float = 30,
+                 roi: Optional[Tuple[int, int, int, int]] = None, rotate: int = 0, color: str = 'bgr',
+                 passthrough: bool = False, sync_group: Optional[str] = None):
+        if rotate % 360 not in (0, *self.ROTATIONS):
+            raise ValueError(f"无效的旋转角度: {rotate}")
+        if color not in self.COLORS:
+            raise ValueError(f"无效的颜色转换: {color}")
+        if roi is not None and (roi[2] <= 0 or roi[3] <= 0):
+            raise ValueError(f"无效的ROI: {roi}")
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.roi = roi
+        self.rotate = rotate % 360
+        self.color = color
+        self.passthrough = passthrough
+        self.sync_group = sync_group
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'CaptureSettings':
+        """解析设备配置，缺省项使用默认值，配置无效时记录日志并使用默认设置"""
+        config = config or {}
+        kwargs = {}
+        try:
+            resolution = config.get('resolution')
+            if isinstance(resolution, str) and 'x' in resolution:
+                kwargs['width'], kwargs['height'] = (int(v) for v in resolution.lower().split('x', 1))
+            elif isinstance(resolution, (list, tuple)) and len(resolution) == 2:
+                kwargs['width'], kwargs['height'] = int(resolution[0]), int(resolution[1])
+            if config.get('fps') is not None:
+                kwargs['fps'] = max(0.0, float(config['fps']))
+            roi = config.get('roi')
+            if isinstance(roi, dict):
+                kwargs['roi'] = (int(roi['x']), int(roi['y']), int(roi['width']), int(roi['height']))
+            elif isinstance(roi, (list, tuple)) and len(roi) == 4:
+                kwargs['roi'] = tuple(int(v) for v in roi)
+            if config.get('rotate') is not None:
+                kwargs['rotate'] = int(config['rotate'])
+            if config.get('color'):
+                kwargs['color'] = str(config['color']).lower()
+            if config.get('sync_group'):
+                kwargs['sync_group'] = str(config['sync_group'])
+            if config.get('passthrough'):
+                kwargs['passthrough'] = str(config['passthrough']).lower() not in ('0', 'false', 'no')
+            return cls(**kwargs)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"摄像头采集设置无效，使用默认设置: {str(e)}")
+            return cls()
+
+    @property
+    def has_transform(self) -> bool:
+        return self.roi is not None or self.rotate != 0 or self.color != 'bgr'
+
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        """对采集到的帧依次裁剪、旋转和转换颜色；ROI超出画面时裁剪到画面范围内"""
+        if self.roi is not None:
+            x, y, w, h = self.roi
+            cropped = frame[max(0, y):y + h, max(0, x):x + w]
+            if cropped.size > 0:
+                frame = cropped
+        if self.rotate:
+            frame = cv2.rotate(frame, self.ROTATIONS[self.rotate])
+        if self.color == 'gray' and frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return frame
+
+    def to_dict(self) -> Dict:
+        return {
+            'resolution': f"{self.width}x{self.height}",
+            'fps': self.fps,
+            'roi': list(self.roi) if self.roi is not None else None,
+            'rotate': self.rotate,
+            'color': self.color,
+            'passthrough': self.passthrough,
+            'sync_group': self.sync_group,
+        }
+
+class FramePacer:
+    """
+    基于单调时钟的采集节拍器：第k个节拍位于 epoch + k * period，按绝对时刻等待，误差不累积；
+    落后超过一个周期时跳到当前时刻之后的节拍，不连续补拍
+    同一同步组的摄像头共享一个节拍器，在相同的节拍上grab，各摄像头的帧接近同步
+    """
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.epoch = time.monotonic()
+
+    def wait(self, last_tick: int = -1) -> int:
+        """等待序号为last_tick的节拍之后的下一个节拍，返回该节拍的序号"""
+        now = time.monotonic()
+        current = math.floor((now - self.epoch) / self.period)  # 不晚于当前时刻的最后一个节拍
+        tick = last_tick + 1
+        if tick < current or tick > current + 1:
+            # 落后超过一个周期，或节拍序号来自其它节拍器
+            tick = current + 1
+        delay = self.epoch + tick * self.period - now
+        if delay > 0:
+            time.sleep(delay)
+        return tick
+
+class FramePool:
+    """
+    摄像头的预分配帧缓冲池：采集线程通过cap.retrieve(image=buf)把帧直接解码到池中的缓冲区，不为每帧分配新数组
+    acquire()为一块空闲缓冲区发放租约，返回的数组及其所有视图（帧缓存槽位、消费者持有的帧快照、ROI裁剪）
+    都经由base链引用该租约；最后一个视图被回收时租约由weakref.finalize显式归还缓冲区，
+    因此缓冲区只会在没有任何数组引用它时才被复用；缓冲区全部被租出或视频源不支持写入给定数组时本帧另行分配（计为未命中）
+    帧缓存的槽位直接引用池中的缓冲区而不另行复制，池就是帧缓存的存储，size为缓冲区数的上限：
+    缓冲区在没有空闲缓冲区时才按需分配，数量稳定在帧缓存容量加上消费者同时持有的帧数
+    视频源连续size次不写入给定的数组（每帧自行分配）时，缓冲池停止发放租约并释放缓冲区，避免与视频源的分配叠加
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self.shape: Optional[Tuple[int, ...]] = None
+        self.dtype = np.dtype(np.uint8)
+        self._nbytes = 0
+        self._buffers: List[bytearray] = []
+        self._free: deque = deque()  # 空闲缓冲区的下标
+        self._generation = 0  # 每次按新格式重新分配时递增，旧租约归还时直接丢弃
+        self._lock = threading.Lock()  # 租约可能在任意线程中归还
+        self._ignored = 0  # 视频源连续未写入给定缓冲区的次数
+        self.bypassed = False
+        self.hits = 0
+        self.misses = 0
+        self.allocations = 0
+        self.reallocations = 0
+
+    def _reset(self, shape: Tuple[int, ...], dtype) -> None:
+        """按新的帧格式清空缓冲池；仍被租出的旧缓冲区由其租约持有，归还时被丢弃"""
+        with self._lock:
+            self.shape = tuple(shape)
+            self.dtype = np.dtype(dtype)
+            self._nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+            self._buffers = []
+            self._free = deque()
+            self._generation += 1
+            self.reallocations += 1
+
+    def _release(self, generation: int, index: int) -> None:
+        """租约的所有数组都被回收后归还缓冲区"""
+        with self._lock:
+            if generation == self._generation:
+                self._free.append(index)
+
+    def acquire(self) -> Optional[np.ndarray]:
+        """
+        租出一个空闲缓冲区并返回覆盖它的可写数组，没有空闲缓冲区且未达上限时分配一块新的；
+        帧格式未知、缓冲池已停用或缓冲区全部被租出时返回None
+        """
+        with self._lock:
+            if self.shape is None or self.bypassed:
+                return None
+            if self._free:
+                index = self._free.popleft()
+            elif len(self._buffers) < self.size:
+                index = len(self._buffers)
+                self._buffers.append(bytearray(self._nbytes))
+                self.allocations += 1
+            else:
+                return None
+            buffer, generation = self._buffers[index], self._generation
+        # 每个租约是一个独立的缓冲区导出对象，数组的视图无论如何切片都会保持其存活
+        lease = (ctypes.c_uint8 * len(buffer)).from_buffer(buffer)
+        weakref.finalize(lease, self._release, generation, index)
+        return np.frombuffer(lease, self.dtype).reshape(self.shape)
+
+    def record(self, frame: np.ndarray, buffer: Optional[np.ndarray]) -> None:
+        """
+        记录一次取帧的结果：帧写入了取得的缓冲区时计为命中，否则计为未命中；
+        帧格式与缓冲区不同（首帧或分辨率变化）时按新格式重建缓冲池；
+        视频源连续size次忽略格式相同的缓冲区时停用缓冲池
+        """
+        if buffer is not None and frame is buffer:
+            self.hits += 1
+            self._ignored = 0
+            return
+        if self.bypassed:
+            return
+        if frame.shape != self.shape or frame.dtype != self.dtype:
+            self._reset(frame.shape, frame.dtype)
+            return
+        self.misses += 1
+        if buffer is None:
+            return
+        self._ignored += 1
+        if self._ignored >= self.size:
+            logger.info(f"视频源未写入预分配的帧缓冲区（连续{self._ignored}次），停用帧缓冲池")
+            with self._lock:
+                self.bypassed = True
+                self._buffers = []
+                self._free = deque()
+                self._generation += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            size, free = len(self._buffers), len(self._free)
+        total = self.hits + self.misses
+        return {
+            'size': size,
+            'capacity': self.size,
+            'in_use': size - free,
+            'free': free,
+            'shape': list(self.shape) if self.shape else None,
+            'bypassed': self.bypassed,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total > 0 else 0,
+            'allocations': self.allocations,
+            'reallocations': self.reallocations,
+        }
+
+class ChangeGate:
+    """
+    处理前的画面变化门控：场景静止时跳过处理，复用上一次的处理结果
+    将帧缩小为灰度缩略图，与上一次实际处理的帧逐像素比较，
+    灰度差超过PIXEL_DELTA的像素比例不低于threshold时视为有变化；
+    距上次处理超过max_staleness秒时无论是否变化都处理一次
+    """
+    PIXEL_DELTA = 25
+    THUMBNAIL_WIDTH = 64
+
+    def __init__(self, threshold: float = 0.01, max_staleness: float = 2.0):
+        self.threshold = threshold
+        self.max_staleness = max_staleness
+        self._reference: Optional[np.ndarray] = None
+        self._reference_time = 0.0
+        self.processed = 0
+        self.skipped = 0
+
+    def _thumbnail(self, image: np.ndarray) -> np.ndarray:
+        height = max(1, round(image.shape[0] * self.THUMBNAIL_WIDTH / image.shape[1]))
+        small = cv2.resize(image, (self.THUMBNAIL_WIDTH, height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def should_process(self, image: np.ndarray, now: float, force: bool = False) -> bool:
+        """判断该帧是否需要处理；需要处理时以该帧作为新的比较基准，force为True时总是处理"""
+        thumbnail = self._thumbnail(image)
+        changed = (
+            force
+            or self._reference is None
+            or self._reference.shape != thumbnail.shape
+            or now - self._reference_time >= self.max_staleness
+            or np.count_nonzero(cv2.absdiff(thumbnail, self._reference) > self.PIXEL_DELTA)
+            >= self.threshold * thumbnail.size
+        )
+        if changed:
+            self._reference = thumbnail
+            self._reference_time = now
+            self.processed += 1
+        else:
+            self.skipped += 1
+        return changed
+
+    def reset(self) -> None:
+        """清除比较基准，下一帧必定处理"""
+        self._reference = None
+
+    def get_stats(self) -> Dict:
+        total = self.processed + self.skipped
+        return {
+            'threshold': self.threshold,
+            'max_staleness': self.max_staleness,
+            'processed': self.processed,
+            'skipped': self.skipped,
+            'hit_ratio': self.skipped / total if total > 0 else 0
+        }
 
 class ProcessedStream:
-    """处理流的封装类，用于管理处理流的状态和资源"""
-    def __init__(self, camera_id: str, operation_id: int, operation_type: str, db: Session):
+    """
+    处理流的封装类，用于管理处理流的状态和资源
+    每个处理流拥有一个后台工作线程，对每个摄像头新帧只处理一次，
+    结果发布到帧缓存的处理帧槽位，所有客户端共享
+    """
+    # 背压策略：latest - 只处理最新帧（丢弃处理期间到达的旧帧）；queue - 按顺序处理，最多积压queue_size帧，超出时丢弃最旧的帧
+    BACKPRESSURE_POLICIES = ('latest', 'queue')
+
+    def __init__(self, camera_id: str, operation_id: int, operation_type: str, db: Session,
+                 backpressure: str = 'latest', queue_size: int = 2, change_gate: Optional[ChangeGate] = None,
+                 decode_scale: int = 1):
         self.camera_id = camera_id
         self.operation_id = operation_id
         self.operation_type = operation_type
         self.is_streaming = True
+        self.thread: Optional[threading.Thread] = None
         self.last_frame = None
         self.last_error = None
         self._clients = 0
@@ -48,6 +387,25 @@ class ProcessedStream:
         self._frame_lock = threading.Lock()
         self.last_frame_time = time.time()
         self._stop_event = Event()
+        
+        # 背压策略与丢帧/延迟统计
+        self.backpressure = backpressure if backpressure in self.BACKPRESSURE_POLICIES else 'latest'
+        self.queue_size = max(1, queue_size)
+        self.dropped_frames = 0
+        self.last_latency = 0.0  # 采集到输出的延迟（秒）
+        self.avg_latency = 0.0
+        self.max_latency = 0.0
+        self.last_processing_time = 0.0
+        self.avg_processing_time = 0.0
+        self.last_lag_frames = 0  # 输出时该帧落后摄像头最新帧的帧数
+        self.max_lag_frames = 0
+        
+        # 画面变化门控，None表示每帧都处理
+        self.change_gate = change_gate
+        # 操作/流水线声明的缩小解码比例，处理的是1/decode_scale尺寸的帧
+        self.decode_scale = decode_scale
+        # 绑定的巡检任务，绑定期间没有观看客户端也不停止
+        self.job: Optional['InspectionJob'] = None
 
     def increment_clients(self) -> int:
         """增加客户端计数，返回新的计数值"""
@@ -67,12 +425,36 @@ class ProcessedStream:
         with self._clients_lock:
             return self._clients
 
-    def update_frame(self, frame: bytes):
-        """更新最后处理的帧"""
+    def update_frame(self, frame: bytes, capture_time: Optional[float] = None,
+                     processing_time: float = 0.0, lag_frames: int = 0):
+        """
+        更新最后处理的帧
+        capture_time: 源帧的采集时间，用于计算采集到输出的延迟
+        processing_time: 本帧的处理耗时（秒）
+        lag_frames: 输出时源帧落后摄像头最新帧的帧数
+        """
         with self._frame_lock:
             self.last_frame = frame
             self.frame_count += 1
             self.last_frame_time = time.time()
+            
+            # 指数移动平均，平滑系数0.1
+            if capture_time is not None:
+                latency = self.last_frame_time - capture_time
+                self.last_latency = latency
+                self.avg_latency = latency if self.frame_count == 1 else 0.9 * self.avg_latency + 0.1 * latency
+                self.max_latency = max(self.max_latency, latency)
+            self.last_processing_time = processing_time
+            self.avg_processing_time = (processing_time if self.frame_count == 1
+                                        else 0.9 * self.avg_processing_time + 0.1 * processing_time)
+            self.last_lag_frames = lag_frames
+            self.max_lag_frames = max(self.max_lag_frames, lag_frames)
+
+    def record_dropped(self, count: int):
+        """记录因背压策略被跳过的源帧数"""
+        if count > 0:
+            with self._frame_lock:
+                self.dropped_frames += count
 
     def get_stats(self):
         """获取流统计信息"""
@@ -80,23 +462,259 @@ class ProcessedStream:
         with self._frame_lock:
             duration = current_time - self.start_time
             fps = self.frame_count / duration if duration > 0 else 0
+            total_frames = self.frame_count + self.dropped_frames
             return {
                 'clients': self.clients,
                 'frame_count': self.frame_count,
                 'fps': fps,
                 'duration': duration,
-                'last_frame_age': current_time - self.last_frame_time
+                'last_frame_age': current_time - self.last_frame_time,
+                'backpressure': self.backpressure,
+                'queue_size': self.queue_size if self.backpressure == 'queue' else None,
+                'dropped_frames': self.dropped_frames,
+                'drop_rate': self.dropped_frames / total_frames if total_frames > 0 else 0,
+                'latency_ms': {
+                    'last': self.last_latency * 1000,
+                    'avg': self.avg_latency * 1000,
+                    'max': self.max_latency * 1000
+                },
+                'processing_ms': {
+                    'last': self.last_processing_time * 1000,
+                    'avg': self.avg_processing_time * 1000
+                },
+                'lag_frames': {
+                    'last': self.last_lag_frames,
+                    'max': self.max_lag_frames
+                },
+                'change_gate': self.change_gate.get_stats() if self.change_gate else None,
+                'decode_scale': self.decode_scale,
+                'inspection': self.job.job_id if self.job else None
             }
 
-    def cleanup(self):
-        """清理资源"""
-        self._stop_event.set()
+    @property
+    def stopped(self) -> bool:
+        """处理流是否已被要求停止"""
+        return self._stop_event.is_set()
+
+    def close_session(self):
+        """关闭处理流独占的数据库会话"""
         if self.db_session:
             try:
                 self.db_session.close()
             except Exception as e:
                 logger.error(f"Error closing db session: {str(e)}")
+            self.db_session = None
+
+    def cleanup(self):
+        """清理资源"""
+        self._stop_event.set()
         self.is_streaming = False
+        # 工作线程仍在运行时由其退出时关闭会话，避免在处理过程中关闭正在使用的会话
+        if not (self.thread and self.thread.is_alive()):
+            self.close_session()
+
+    @property
+    def idle(self) -> bool:
+        """没有观看客户端且没有绑定巡检任务，可以停止"""
+        return self.clients <= 0 and self.job is None
+
+class InspectionJob:
+    """
+    巡检任务：绑定摄像头、操作/流水线和触发策略，不依赖观看客户端，在后台持续处理
+    处理由同键处理流的工作线程完成，观看客户端只附加到该处理流的输出；
+    每次实际处理的非图像输出作为一条结果发布到任务的结果通道（有界队列），按结果序号增量读取
+    """
+    # 触发策略：continuous - 每个新帧都处理（受背压策略约束）；interval - 每隔interval秒处理一帧；
+    # change - 画面变化时才处理（使用画面变化门控）
+    TRIGGERS = ('continuous', 'interval', 'change')
+
+    def __init__(self, job_id: str, camera_id: str, operation_id: int, operation_type: str,
+                 trigger: str = 'continuous', interval: float = 1.0, backpressure: str = 'latest',
+                 queue_size: int = 2, max_results: int = 100, device_id: Optional[int] = None):
+        self.job_id = job_id
+        self.camera_id = camera_id
+        self.operation_id = operation_id
+        self.operation_type = operation_type
+        self.trigger = trigger
+        self.interval = interval
+        # 任务处理流的背压策略，处理流重启时沿用
+        self.backpressure = backpressure
+        self.queue_size = queue_size
+        self.device_id = device_id
+        self.active = True
+        self.started_at = time.time()
+        self.restarts = 0
+        self.processed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_error = None
+        self._last_trigger = 0.0
+        self._results = deque(maxlen=max(1, max_results))
+        self._result_seq = 0
+        self._results_condition = Condition()
+        # 异步读取方（HTTP长轮询）在事件循环中等待，不占用线程池线程
+        self._async_notifier = AsyncFrameNotifier()
+
+    def should_trigger(self, now: float) -> bool:
+        """按触发策略判断是否处理当前帧，now为单调时钟"""
+        if self.trigger == 'interval' and now - self._last_trigger < self.interval:
+            self.skipped += 1
+            return False
+        self._last_trigger = now
+        return True
+
+    def publish_result(self, frame_seq: int, capture_time: float, outputs: Optional[Dict],
+                       processing_time: float, error: Optional[str] = None) -> int:
+        """发布一条处理结果并唤醒等待的读取方，返回结果序号"""
+        with self._results_condition:
+            self._result_seq += 1
+            self.processed += 1
+            if error:
+                self.errors += 1
+                self.last_error = error
+            self._results.append({
+                'seq': self._result_seq,
+                'frame_seq': frame_seq,
+                'capture_time': capture_time,
+                'timestamp': time.time(),
+                'processing_ms': processing_time * 1000,
+                'outputs': outputs or {},
+                'error': error
+            })
+            self._results_condition.notify_all()
+            result_seq = self._result_seq
+        self._async_notifier.notify(self.job_id)
+        return result_seq
+
+    def get_results(self, since: int = 0) -> Tuple[int, List[Dict]]:
+        """返回(最新结果序号, 序号大于since且仍在队列中的结果)"""
+        with self._results_condition:
+            return self._result_seq, [result for result in self._results if result['seq'] > since]
+
+    def wait_for_results(self, since: int = 0, timeout: float = 0.0) -> Tuple[int, List[Dict]]:
+        """阻塞等待序号大于since的新结果，最多等待timeout秒，任务停止时立即返回"""
+        with self._results_condition:
+            if timeout > 0:
+                self._results_condition.wait_for(lambda: self._result_seq > since or not self.active, timeout)
+            return self.get_results(since)
+
+    async def wait_for_results_async(self, since: int = 0, timeout: float = 0.0) -> Tuple[int, List[Dict]]:
+        """wait_for_results的异步版本，在事件循环中等待新结果，不占用线程"""
+        if timeout > 0:
+            # 先登记再检查序号，避免检查与登记之间发布的结果被漏掉
+            future = self._async_notifier.get_future(self.job_id)
+            if self._result_seq <= since and self.active:
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return self.get_results(since)
+
+    def stop(self) -> None:
+        """停止任务并唤醒等待结果的读取方"""
+        with self._results_condition:
+            self.active = False
+            self._results_condition.notify_all()
+        self._async_notifier.notify(self.job_id)
+
+    def get_stats(self) -> Dict:
+        with self._results_condition:
+            return {
+                'job_id': self.job_id,
+                'camera_id': self.camera_id,
+                'operation_id': self.operation_id,
+                'operation_type': self.operation_type,
+                'device_id': self.device_id,
+                'trigger': self.trigger,
+                'interval': self.interval if self.trigger == 'interval' else None,
+                'active': self.active,
+                'uptime': time.time() - self.started_at,
+                'restarts': self.restarts,
+                'processed': self.processed,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'result_seq': self._result_seq
+            }
+
+class StageHistogram:
+    """
+    单个阶段耗时的直方图（毫秒），桶边界固定，记录一次只做一次二分查找
+    分位数按桶上界估算，精度取决于桶划分
+    """
+    BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value_ms: float) -> None:
+        self.counts[bisect_left(self.BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def percentile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.BUCKETS_MS[i], self.max) if i < len(self.BUCKETS_MS) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict:
+        return {
+            'count': self.count,
+            'avg_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': self.max,
+            'buckets': {
+                **{str(le): n for le, n in zip(self.BUCKETS_MS, self.counts)},
+                '+Inf': self.counts[-1]
+            }
+        }
+
+class StageMetrics:
+    """
+    摄像头或处理流各处理阶段的耗时直方图
+    阶段: capture（读帧）、encode（JPEG编码）、encode_variant（缩放变体编码）、decode（解码处理帧以生成变体）、
+    queue（采集到开始处理）、gate（画面变化判断）、copy/decode_input（处理输入准备）、process（操作）/ node:<节点>（流水线各节点）、
+    process_encode（处理结果编码）、delivery（采集到发送给客户端）、send（发送耗时）、ack（WebSocket发送到客户端确认）
+    """
+
+    def __init__(self):
+        self._histograms: Dict[str, StageHistogram] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = StageHistogram()
+            histogram.record(seconds * 1000)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'since': self.started_at,
+                'stages': {stage: h.snapshot() for stage, h in self._histograms.items()}
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self.started_at = time.time()
 
 class FrameProcessor:
     """帧处理器类，用于处理图像操作和转换"""
@@ -122,8 +740,8 @@ class FrameProcessor:
             self._pipeline_service = PipelineService(self.db)
         return self._pipeline_service
 
-    def decode_frame(self, frame_data: bytes) -> Optional[np.ndarray]:
-        """将JPEG帧数据解码为numpy数组"""
+    def decode_frame(self, frame_data: bytes, scale: int = 1) -> Optional[np.ndarray]:
+        """将JPEG帧数据解码为numpy数组，scale为2/4/8时直接按1/scale的尺寸解码"""
         if not frame_data or len(frame_data) == 0:
             logger.error("解码帧失败: 空的帧数据")
             return None
@@ -134,7 +752,7 @@ class FrameProcessor:
                 logger.error("解码帧失败: 帧数据为空数组")
                 return None
                 
-            img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+            img = cv2.imdecode(img_array, REDUCED_DECODE_MODES.get(scale, cv2.IMREAD_COLOR))
             if img is None:
                 logger.error(f"无法解码输入图像，数据大小: {len(frame_data)} 字节")
                 return None
@@ -184,6 +802,32 @@ class FrameProcessor:
             logger.error(f"编码帧失败: {str(e)}")
             return None
 
+    @classmethod
+    def to_jsonable(cls, value):
+        """将处理输出转换为可JSON序列化的值，图像返回None"""
+        if isinstance(value, np.ndarray):
+            if value.ndim == 3 or (value.ndim == 2 and value.dtype == np.uint8):
+                return None
+            return value.tolist()
+        if isinstance(value, np.generic):
+            return value.item()
+        if isinstance(value, dict):
+            return {str(k): cls.to_jsonable(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [cls.to_jsonable(v) for v in value]
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return str(value)
+
+    def _collect_outputs(self, result: Dict, outputs: Optional[Dict]) -> None:
+        """收集处理结果中的非图像输出（如检测框、识别文字）"""
+        if outputs is None or not isinstance(result, dict):
+            return
+        for name, value in result.items():
+            value = self.to_jsonable(value)
+            if value is not None:
+                outputs[name] = value
+
     def get_image_param_name(self, params: List[Dict], default: str = 'image') -> str:
         """从参数列表中获取图像参数名"""
         for param in params:
@@ -191,8 +835,30 @@ class FrameProcessor:
                 return param['name']
         return params[0]['name'] if params else default
 
-    def process_operation(self, img: np.ndarray, operation_id: int) -> Optional[np.ndarray]:
-        """处理单个CV操作"""
+    @staticmethod
+    def get_input_decode_scale(params: List[Dict]) -> int:
+        """操作/流水线的图像输入参数声明的缩小解码比例（decode_scale），未声明或无效时为1"""
+        for param in params or []:
+            if param.get('type') == 'image':
+                scale = param.get('decode_scale')
+                return scale if scale in REDUCED_DECODE_MODES else 1
+        return 1
+
+    def get_decode_scale(self, operation_id: int, operation_type: str) -> int:
+        """获取操作或流水线声明的缩小解码比例"""
+        try:
+            if operation_type == 'pipeline':
+                target = self.pipeline_service.get_pipeline(operation_id)
+            else:
+                target = self.cv_operation_service.get_operation(operation_id)
+            return self.get_input_decode_scale(target.input_params) if target else 1
+        except Exception as e:
+            logger.error(f"获取解码比例失败: {str(e)}")
+            return 1
+
+    def process_operation(self, img: np.ndarray, operation_id: int,
+                          outputs: Optional[Dict] = None) -> Optional[np.ndarray]:
+        """处理单个CV操作，outputs不为None时写入操作的非图像输出"""
         try:
             operation = self.cv_operation_service.get_operation(operation_id)
             if not operation:
@@ -201,6 +867,7 @@ class FrameProcessor:
 
             input_param_name = self.get_image_param_name(operation.input_params)
             result = self.cv_operation_service.apply_operation(operation_id, {input_param_name: img})
+            self._collect_outputs(result, outputs)
 
             # 查找输出图像
             if operation.output_params:
@@ -218,8 +885,9 @@ class FrameProcessor:
             logger.error(f"处理操作失败: {str(e)}")
             return None
 
-    def process_pipeline(self, img: np.ndarray, pipeline_id: int) -> Optional[np.ndarray]:
-        """处理Pipeline操作"""
+    def process_pipeline(self, img: np.ndarray, pipeline_id: int, timings: Optional[Dict[str, float]] = None,
+                         outputs: Optional[Dict] = None) -> Optional[np.ndarray]:
+        """处理Pipeline操作，timings不为None时写入各节点的耗时（秒），outputs不为None时写入非图像输出"""
         try:
             pipeline = self.pipeline_service.get_pipeline(pipeline_id)
             if not pipeline:
@@ -228,8 +896,12 @@ class FrameProcessor:
 
             input_param_name = self.get_image_param_name(pipeline.input_params)
             result = self.pipeline_service.apply_pipeline(pipeline_id, {input_param_name: img})
+            if timings is not None:
+                for node_id, timing in (result.get('timings') or {}).items():
+                    timings[f"node:{timing['name']}#{node_id}"] = timing['seconds']
 
             output_params = result.get('outputParams', {})
+            self._collect_outputs(output_params, outputs)
             if pipeline.output_params:
                 output_param_name = self.get_image_param_name(pipeline.output_params)
                 if output_param_name in output_params:
@@ -245,38 +917,70 @@ class FrameProcessor:
             logger.error(f"处理Pipeline失败: {str(e)}")
             return None
 
-    def process_frame(self, frame_data: bytes, operation_id: int, operation_type: str) -> bytes:
-        """处理单帧并返回处理后的JPEG数据"""
+    def _fallback_frame(self, frame_data: Union[bytes, np.ndarray]) -> bytes:
+        """处理失败时返回原始帧的JPEG数据"""
+        if isinstance(frame_data, np.ndarray):
+            return self.encode_frame(frame_data) or b''
+        return frame_data
+
+    def process_frame(self, frame_data: Union[bytes, np.ndarray], operation_id: int, operation_type: str,
+                      timings: Optional[Dict[str, float]] = None, outputs: Optional[Dict] = None,
+                      decode_scale: Optional[int] = None) -> bytes:
+        """
+        处理单帧并返回处理后的JPEG数据
+        frame_data 可以是JPEG数据，也可以是帧缓存中已解码的只读BGR图像（无需再解码，按原样处理）
+        decode_scale 为JPEG输入的缩小解码比例，None时使用操作/流水线图像输入参数声明的比例
+        timings 不为None时写入各阶段耗时（秒）：copy/decode_input、process或各流水线节点、process_encode
+        outputs 不为None时写入操作/流水线的非图像输出（如检测结果）
+        """
         try:
-            # 解码输入帧
-            img = self.decode_frame(frame_data)
+            started = time.perf_counter()
+            if isinstance(frame_data, np.ndarray):
+                # 帧缓存中的图像是只读且共享的，操作可能原地修改输入，因此复制一份
+                img = frame_data.copy()
+                stage = 'copy'
+            else:
+                # 解码输入帧，操作声明了缩小解码比例时直接按缩小的尺寸解码
+                if decode_scale is None:
+                    decode_scale = self.get_decode_scale(operation_id, operation_type)
+                started = time.perf_counter()
+                img = self.decode_frame(frame_data, decode_scale)
+                stage = 'decode_input'
+            if timings is not None:
+                timings[stage] = time.perf_counter() - started
             if img is None:
                 logger.warning(f"无法解码输入帧，返回原始帧数据")
                 return frame_data
 
             # 根据操作类型处理图像
             processed_img = None
+            started = time.perf_counter()
             try:
                 if operation_type == 'operation':
                     logger.debug(f"应用操作 {operation_id} 到帧")
-                    processed_img = self.process_operation(img, operation_id)
+                    processed_img = self.process_operation(img, operation_id, outputs)
                     if processed_img is None:
                         logger.warning(f"操作 {operation_id} 处理返回空结果，回退到原始帧")
                 elif operation_type == 'pipeline':
                     logger.debug(f"应用流水线 {operation_id} 到帧")
-                    processed_img = self.process_pipeline(img, operation_id)
+                    processed_img = self.process_pipeline(img, operation_id, timings, outputs)
                     if processed_img is None:
                         logger.warning(f"流水线 {operation_id} 处理返回空结果，回退到原始帧")
                 else:
                     logger.warning(f"未知的操作类型: {operation_type}，回退到原始帧")
             except Exception as e:
                 logger.error(f"处理帧时发生错误: {str(e)}，回退到原始帧")
-                return frame_data
+                return self._fallback_frame(frame_data)
+            if timings is not None:
+                timings['process'] = time.perf_counter() - started
 
             # 如果处理成功，编码并返回结果
             if processed_img is not None:
                 try:
+                    started = time.perf_counter()
                     result = self.encode_frame(processed_img)
+                    if timings is not None:
+                        timings['process_encode'] = time.perf_counter() - started
                     if result is not None:
                         logger.debug(f"成功处理并编码帧 ({len(result)} 字节)")
                         return result
@@ -287,153 +991,974 @@ class FrameProcessor:
 
             # 处理失败时返回原始帧
             logger.debug("处理流程未产生有效结果，返回原始帧")
-            return frame_data
+            return self._fallback_frame(frame_data)
         except Exception as e:
             logger.exception(f"处理帧失败: {str(e)}")
             # 确保在任何错误情况下都返回原始帧
-            return frame_data
+            return self._fallback_frame(frame_data)
+
+def _resolve_future(future: asyncio.Future) -> None:
+    """在事件循环线程中完成future"""
+    if not future.done():
+        future.set_result(None)
+
+class AsyncFrameNotifier:
+    """
+    将采集/处理线程发布的新帧通知桥接到asyncio事件循环
+    每个(帧键, 事件循环)只登记一个共享future，发布线程每帧对每个事件循环只调度一次唤醒
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, Dict[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+
+    def get_future(self, key: str) -> asyncio.Future:
+        """获取当前事件循环中等待指定帧键下一次发布的future，需在事件循环中调用"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            loop_waiters = self._waiters.setdefault(key, {})
+            future = loop_waiters.get(loop)
+            if future is None or future.done():
+                future = loop.create_future()
+                loop_waiters[loop] = future
+            return future
+
+    def notify(self, key: str) -> None:
+        """从任意线程唤醒等待指定帧键的所有异步客户端"""
+        with self._lock:
+            loop_waiters = self._waiters.pop(key, None)
+        if not loop_waiters:
+            return
+        for loop, future in loop_waiters.items():
+            try:
+                loop.call_soon_threadsafe(_resolve_future, future)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+class BufferedFrame(NamedTuple):
+    """从帧缓存读取的一帧的快照"""
+    seq: int                        # 帧序号（按摄像头/处理流单调递增）
+    timestamp: float                # 发布时间
+    image: Optional[np.ndarray]     # 只读BGR图像（处理帧为None）
+    frame: Optional[bytes]          # JPEG数据（原始帧按需编码，可能为None）
+    valid: bool                     # 采集阶段的校验结果
+    width: int
+    height: int
+    capture_time: float             # 采集时间（原始帧同发布时间，处理帧为其源帧的采集时间）
+    metadata: Optional[Dict]        # 处理帧附带的非图像输出（如检测结果），原始帧为None
+
+class StreamFrame(NamedTuple):
+    """帧迭代器产出的一帧（如WebSocket推送）"""
+    seq: int
+    timestamp: float                # 采集时间（处理帧为源帧的采集时间）
+    frame: bytes                    # JPEG数据（或请求的变体）
+    detections: Optional[Dict]      # 处理帧附带的非图像输出，原始帧为None
+
+class _FrameSlot:
+    """环形缓冲区的预分配槽位，写入时原地覆盖，不为每帧分配新对象"""
+    __slots__ = ('seq', 'timestamp', 'image', 'frame', 'valid', 'width', 'height', 'capture_time', 'metadata',
+                 'variants', 'scaled')
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.seq = 0
+        self.timestamp = 0.0
+        self.image = None
+        self.frame = None
+        self.valid = False
+        self.width = 0
+        self.height = 0
+        self.capture_time = 0.0
+        self.metadata = None
+        self.variants = None  # (宽度, JPEG质量) -> 该帧缩放/重编码后的JPEG，按需创建
+        self.scaled = None  # 缩小比例 -> 该帧缩小解码（或缩小）后的只读图像，按需创建
+
+    def snapshot(self) -> BufferedFrame:
+        return BufferedFrame(self.seq, self.timestamp, self.image, self.frame,
+                             self.valid, self.width, self.height, self.capture_time, self.metadata)
+
+class _FrameRing:
+    """
+    固定容量的帧环形缓冲区，槽位在创建时预分配
+    序号为seq的帧位于槽位 (seq - 1) % capacity，按序号查找为O(1)
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._slots = [_FrameSlot() for _ in range(self.capacity)]
+        self.latest_seq = 0  # 不随clear重置，保证等待中的客户端序号单调
+
+    def push(self, image: Optional[np.ndarray], frame: Optional[bytes], valid: bool,
+             width: int, height: int, timestamp: float, capture_time: Optional[float] = None,
+             metadata: Optional[Dict] = None) -> int:
+        seq = self.latest_seq + 1
+        slot = self._slots[(seq - 1) % self.capacity]
+        slot.seq = seq
+        slot.timestamp = timestamp
+        slot.image = image
+        slot.frame = frame
+        slot.valid = valid
+        slot.width = width
+        slot.variants = None
+        slot.scaled = None
+        slot.height = height
+        slot.capture_time = capture_time or timestamp
+        slot.metadata = metadata
+        self.latest_seq = seq
+        return seq
+
+    def get(self, seq: int) -> Optional[_FrameSlot]:
+        """按序号获取槽位，帧已被覆盖或不存在时返回None"""
+        if seq <= 0 or seq > self.latest_seq:
+            return None
+        slot = self._slots[(seq - 1) % self.capacity]
+        return slot if slot.seq == seq else None
+
+    def latest(self) -> Optional[_FrameSlot]:
+        return self.get(self.latest_seq)
+
+    def since(self, seq: int) -> List[_FrameSlot]:
+        """按时间顺序返回序号大于seq且仍在缓冲区中的槽位"""
+        first = max(seq + 1, self.latest_seq - self.capacity + 1, 1)
+        slots = []
+        for s in range(first, self.latest_seq + 1):
+            slot = self.get(s)
+            if slot is not None:
+                slots.append(slot)
+        return slots
+
+    def at(self, timestamp: float) -> Optional[_FrameSlot]:
+        """返回时间戳不晚于timestamp的最新槽位"""
+        for s in range(self.latest_seq, max(0, self.latest_seq - self.capacity), -1):
+            slot = self.get(s)
+            if slot is None:
+                break
+            if slot.timestamp <= timestamp:
+                return slot
+        return None
+
+    def clear(self):
+        """释放所有槽位中的帧数据，保留序号计数"""
+        for slot in self._slots:
+            slot.clear()
 
 class FrameBuffer:
-    """帧缓存管理器，用于优化帧的存储和访问"""
+    """
+    帧缓存管理器，用于优化帧的存储和访问
+    每个摄像头和每个处理流各有一个预分配的环形缓冲区，保留最近max_size帧的历史，
+    可按"最新"、"某序号之后"或"某时刻"读取；超过max_age秒的帧在读取时视为过期
+    客户端请求的缩放/质量变体按(宽度, JPEG质量)缓存在帧所在槽位中，每帧每种变体只编码一次
+    """
+    
+    MIN_VARIANT_WIDTH = 16
+    MAX_VARIANT_WIDTH = 4096
     
-    def __init__(self, max_size: int = 30):
+    def __init__(self, max_size: int = 30, max_age: float = 1.0):
         self.max_size = max_size
-        self._frames: Dict[str, Dict] = {}  # camera_id -> {'frame': bytes, 'timestamp': float}
-        self._processed_frames: Dict[str, Dict] = {}  # stream_key -> {'frame': bytes, 'timestamp': float}
-        self._frames_lock = RLock()  # 保护原始帧字典
-        self._processed_frames_lock = RLock()  # 保护处理后帧字典
-        self._cleanup_event = Event()
-        self._start_cleanup_thread()
+        self.max_age = max_age
+        self.jpeg_quality = 80  # 原始帧按需编码时的JPEG质量
+        self._frames: Dict[str, _FrameRing] = {}  # camera_id -> 原始帧环形缓冲区（图像 + 懒编码的JPEG）
+        self._processed_frames: Dict[str, _FrameRing] = {}  # stream_key -> 处理帧环形缓冲区（JPEG）
+        self._frames_lock = RLock()  # 保护原始帧缓冲区
+        self._processed_frames_lock = RLock()  # 保护处理后帧缓冲区
+        # 阶段耗时记录回调 (摄像头ID或处理流键, 阶段, 秒)，由CameraService设置，None表示不记录
+        self.stage_recorder: Optional[Callable[[str, str, float], None]] = None
 
-    def _start_cleanup_thread(self):
-        """启动清理线程"""
-        def cleanup():
-            while not self._cleanup_event.is_set():
-                try:
-                    self._cleanup_old_frames()
-                except Exception as e:
-                    logger.error(f"Frame buffer cleanup error: {str(e)}")
-                time.sleep(5)  # 每5秒清理一次
+    def _get_ring(self, rings: Dict[str, _FrameRing], key: str) -> _FrameRing:
+        """获取（必要时创建）环形缓冲区，需持有对应的锁"""
+        ring = rings.get(key)
+        if ring is None:
+            ring = _FrameRing(self.max_size)
+            rings[key] = ring
+        return ring
 
-        thread = threading.Thread(target=cleanup, daemon=True)
-        thread.start()
+    def _is_fresh(self, slot: Optional[_FrameSlot]) -> bool:
+        return (slot is not None and slot.valid
+                and time.time() - slot.timestamp <= self.max_age)
 
-    def _cleanup_old_frames(self):
-        """清理过期的帧"""
-        current_time = time.time()
+    def normalize_variant(self, width: Optional[int] = None,
+                          quality: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """
+        将客户端请求的宽度和JPEG质量规范化为变体键(宽度, 质量)
+        都未指定时返回None，表示原始尺寸、默认质量的帧；宽度为0表示保持原始宽度
+        """
+        if not width and not quality:
+            return None
+        width = min(max(int(width), self.MIN_VARIANT_WIDTH), self.MAX_VARIANT_WIDTH) if width else 0
+        quality = min(max(int(quality), 10), 95) if quality else self.jpeg_quality
+        return width, quality
+
+    @staticmethod
+    def _encode_variant(image: np.ndarray, variant: Tuple[int, int]) -> bytes:
+        """按变体缩放（只缩小不放大，保持宽高比）并编码为JPEG"""
+        width, quality = variant
+        if 0 < width < image.shape[1]:
+            height = max(1, round(image.shape[0] * width / image.shape[1]))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        success, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buffer.tobytes() if success else b''
+
+    def _get_variant(self, rings: Dict[str, _FrameRing], lock: RLock, key: str,
+                     seq: int, variant: Tuple[int, int]) -> bytes:
+        """
+        获取某一帧的变体JPEG，首次请求时在锁外编码并缓存到槽位中，帧已被覆盖时返回b''
+        槽位中没有图像（处理帧只保存JPEG）时先解码一次并缓存解码结果，供其它变体复用
+        """
+        with lock:
+            ring = rings.get(key)
+            slot = ring.get(seq) if ring else None
+            if slot is None:
+                return b''
+            if slot.variants and variant in slot.variants:
+                return slot.variants[variant]
+            image, frame = slot.image, slot.frame
+        
+        recorder = self.stage_recorder
+        scale = 1
+        if image is None:
+            if not frame:
+                return b''
+            # 缩略图只需按能覆盖目标宽度的最小尺寸解码
+            size = jpeg_dimensions(frame)
+            scale = decode_scale_for_width(size[0], variant[0]) if size else 1
+            started = time.perf_counter()
+            image = cv2.imdecode(np.frombuffer(frame, np.uint8), REDUCED_DECODE_MODES[scale])
+            if image is None:
+                return b''
+            image.flags.writeable = False
+            if recorder:
+                recorder(key, 'decode' if scale == 1 else 'decode_reduced', time.perf_counter() - started)
+        started = time.perf_counter()
+        data = self._encode_variant(image, variant)
+        if recorder:
+            recorder(key, 'encode_variant', time.perf_counter() - started)
+        
+        with lock:
+            slot = ring.get(seq)
+            if slot is not None:
+                if slot.image is None and scale == 1:
+                    slot.image = image
+                if slot.variants is None:
+                    slot.variants = {}
+                # 并发请求时保留先完成的编码结果
+                return slot.variants.setdefault(variant, data)
+        return data
+
+    # --- 原始帧 ---
+
+    def update_frame(self, camera_id: str, image: Optional[np.ndarray], valid: bool = True,
+                     width: int = 0, height: int = 0, timestamp: Optional[float] = None,
+                     jpeg: Optional[bytes] = None) -> int:
+        """
+        更新摄像头原始帧（BGR图像），返回新帧的序号
+        图像以只读方式缓存，JPEG数据在首次被请求时才编码并缓存
+        valid/width/height 由采集阶段对原始图像校验一次后给出，读取时无需再解码校验
+        timestamp 为视频源给出的采集时间戳（如回放源的确定性时间戳），未给出时使用当前时间
+        直通采集时只给出摄像头自身的JPEG数据（image为None），图像在首次需要像素时才解码
+        """
+        if image is not None:
+            image.flags.writeable = False
+        with self._frames_lock:
+            return self._get_ring(self._frames, camera_id).push(
+                image, jpeg, valid, width, height, timestamp or time.time()
+            )
+
+    def ensure_image(self, camera_id: str, frame: BufferedFrame) -> BufferedFrame:
+        """返回带BGR图像的帧；直通采集的帧只有JPEG数据，首次需要像素时解码一次并缓存到槽位"""
+        if frame.image is not None or not frame.frame:
+            return frame
+        started = time.perf_counter()
+        image = cv2.imdecode(np.frombuffer(frame.frame, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return frame
+        image.flags.writeable = False
+        if self.stage_recorder:
+            self.stage_recorder(camera_id, 'decode', time.perf_counter() - started)
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            slot = ring.get(frame.seq) if ring else None
+            if slot is not None:
+                # 并发解码时保留先完成的结果
+                if slot.image is None:
+                    slot.image = image
+                image = slot.image
+        return frame._replace(image=image)
+
+    def get_scaled_image(self, camera_id: str, frame: BufferedFrame, scale: int = 1) -> Optional[np.ndarray]:
+        """
+        获取按1/scale缩小的只读BGR图像，同一帧同一比例只生成一次，供多个处理流共享
+        帧已有解码图像时缩小该图像；只有JPEG数据（直通采集）时直接用IMREAD_REDUCED_*按缩小的尺寸解码
+        """
+        if scale not in REDUCED_DECODE_MODES or scale == 1:
+            return self.ensure_image(camera_id, frame).image
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            slot = ring.get(frame.seq) if ring else None
+            if slot is not None and slot.scaled and scale in slot.scaled:
+                return slot.scaled[scale]
+            source = slot.image if slot is not None and slot.image is not None else frame.image
+        
+        started = time.perf_counter()
+        if source is not None:
+            height, width = source.shape[:2]
+            image = cv2.resize(source, (-(-width // scale), -(-height // scale)), interpolation=cv2.INTER_AREA)
+            stage = 'resize_input'
+        elif frame.frame:
+            image = cv2.imdecode(np.frombuffer(frame.frame, np.uint8), REDUCED_DECODE_MODES[scale])
+            stage = 'decode_reduced'
+        else:
+            return None
+        if image is None:
+            return None
+        image.flags.writeable = False
+        if self.stage_recorder:
+            self.stage_recorder(camera_id, stage, time.perf_counter() - started)
         
-        # 清理原始帧
         with self._frames_lock:
-            for camera_id in list(self._frames.keys()):
-                if current_time - self._frames[camera_id]['timestamp'] > 1.0:  # 1秒过期
-                    del self._frames[camera_id]
+            slot = ring.get(frame.seq) if ring else None
+            if slot is not None:
+                if slot.scaled is None:
+                    slot.scaled = {}
+                # 并发生成时保留先完成的结果
+                return slot.scaled.setdefault(scale, image)
+        return image
+
+    def _ensure_encoded(self, camera_id: str, frame: BufferedFrame) -> bytes:
+        """返回帧的JPEG数据，首次请求时在锁外编码，并在槽位未被覆盖时缓存结果"""
+        if frame.frame is not None:
+            return frame.frame
         
-        # 清理处理后的帧
-        with self._processed_frames_lock:
-            for stream_key in list(self._processed_frames.keys()):
-                if current_time - self._processed_frames[stream_key]['timestamp'] > 1.0:
-                    del self._processed_frames[stream_key]
+        started = time.perf_counter()
+        _, buffer = cv2.imencode('.jpg', frame.image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        jpg_bytes = buffer.tobytes()
+        if self.stage_recorder:
+            self.stage_recorder(camera_id, 'encode', time.perf_counter() - started)
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            slot = ring.get(frame.seq) if ring else None
+            if slot is not None:
+                # 并发请求时保留先完成的编码结果
+                if slot.frame is None:
+                    slot.frame = jpg_bytes
+                return slot.frame
+        return jpg_bytes
 
-    def update_frame(self, camera_id: str, frame: bytes) -> None:
-        """更新摄像头原始帧"""
+    def get_latest(self, camera_id: str) -> Optional[BufferedFrame]:
+        """获取摄像头最新的帧（不检查有效性和是否过期）"""
         with self._frames_lock:
-            self._frames[camera_id] = {
-                'frame': frame,
-                'timestamp': time.time()
-            }
+            ring = self._frames.get(camera_id)
+            slot = ring.latest() if ring else None
+            return slot.snapshot() if slot else None
+
+    def get_frames_since(self, camera_id: str, seq: int) -> List[BufferedFrame]:
+        """按时间顺序获取序号大于seq且仍在缓冲区中的所有帧，用于慢速消费者和触发前取证"""
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            return [slot.snapshot() for slot in ring.since(seq)] if ring else []
+
+    def get_frame_at(self, camera_id: str, timestamp: float) -> Optional[BufferedFrame]:
+        """获取在指定时刻摄像头的帧，即时间戳不晚于timestamp的最新帧"""
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            slot = ring.at(timestamp) if ring else None
+            return slot.snapshot() if slot else None
+
+    def get_frame_jpeg(self, camera_id: str, frame: BufferedFrame,
+                       variant: Optional[Tuple[int, int]] = None) -> bytes:
+        """获取缓冲区中某一帧的JPEG数据（按需编码），可指定缩放/质量变体"""
+        if frame.image is None and frame.frame is None:
+            return b''
+        if variant is not None:
+            return self._get_variant(self._frames, self._frames_lock, camera_id, frame.seq, variant)
+        return self._ensure_encoded(camera_id, frame)
 
     def get_frame(self, camera_id: str) -> Tuple[bool, bytes]:
-        """获取摄像头原始帧"""
+        """获取摄像头原始帧的JPEG数据，仅返回采集时校验有效的帧"""
         with self._frames_lock:
-            frame_data = self._frames.get(camera_id)
-            if frame_data and time.time() - frame_data['timestamp'] <= 1.0:
-                return True, frame_data['frame']
-        return False, b''
+            ring = self._frames.get(camera_id)
+            slot = ring.latest() if ring else None
+            if not self._is_fresh(slot):
+                return False, b''
+            frame = slot.snapshot()
+        return True, self._ensure_encoded(camera_id, frame)
+
+    def get_image(self, camera_id: str) -> Tuple[bool, Optional[np.ndarray]]:
+        """获取摄像头原始帧的只读BGR图像，无需解码（直通采集的帧首次读取时解码）"""
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            slot = ring.latest() if ring else None
+            if not self._is_fresh(slot):
+                return False, None
+            frame = slot.snapshot()
+        image = self.ensure_image(camera_id, frame).image
+        return image is not None, image
+
+    def get_frame_info(self, camera_id: str) -> Optional[Dict]:
+        """获取摄像头最新帧的元数据（序号、时间戳、有效性和尺寸），不包含帧数据"""
+        frame = self.get_latest(camera_id)
+        if frame is None:
+            return None
+        return {
+            'seq': frame.seq,
+            'timestamp': frame.timestamp,
+            'valid': frame.valid,
+            'width': frame.width,
+            'height': frame.height
+        }
+
+    def get_sequence(self, camera_id: str) -> int:
+        """获取摄像头最新帧的序号，没有帧时返回0"""
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            return ring.latest_seq if ring else 0
+
+    def get_latest_since(self, camera_id: str, last_seq: int) -> Tuple[int, Optional[BufferedFrame]]:
+        """
+        获取序号大于last_seq的最新有效帧，没有更新的帧时返回(last_seq, None)
+        最新帧无效或已过期时返回(最新序号, None)，避免调用方反复等待同一帧
+        """
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            if not ring or ring.latest_seq <= last_seq:
+                return last_seq, None
+            slot = ring.latest()
+            if not self._is_fresh(slot):
+                return ring.latest_seq, None
+            return slot.seq, slot.snapshot()
+
+    def get_frame_since(self, camera_id: str, last_seq: int,
+                        variant: Optional[Tuple[int, int]] = None) -> Tuple[int, bytes]:
+        """获取序号大于last_seq的最新原始帧JPEG数据（可指定变体），没有可用的新帧时帧数据为b''"""
+        seq, frame = self.get_latest_since(camera_id, last_seq)
+        if frame is None:
+            return seq, b''
+        return seq, self.get_frame_jpeg(camera_id, frame, variant)
+
+    def get_image_since(self, camera_id: str, last_seq: int) -> Tuple[int, Optional[np.ndarray]]:
+        """获取序号大于last_seq的最新原始帧图像，没有可用的新帧时图像为None"""
+        seq, frame = self.get_latest_since(camera_id, last_seq)
+        if frame is None:
+            return seq, None
+        return seq, self.ensure_image(camera_id, frame).image
 
-    def update_processed_frame(self, stream_key: str, frame: bytes) -> None:
-        """更新处理后的帧"""
+    def clear_frames(self, camera_id: str) -> None:
+        """释放摄像头缓冲区中的帧，保留序号计数"""
+        with self._frames_lock:
+            ring = self._frames.get(camera_id)
+            if ring:
+                ring.clear()
+
+    # --- 处理帧 ---
+
+    def update_processed_frame(self, stream_key: str, frame: bytes, capture_time: Optional[float] = None,
+                               metadata: Optional[Dict] = None) -> int:
+        """
+        更新处理后的帧，返回新帧的序号
+        capture_time为源帧的采集时间，用于统计端到端延迟；metadata为处理产生的非图像输出
+        """
         with self._processed_frames_lock:
-            self._processed_frames[stream_key] = {
-                'frame': frame,
-                'timestamp': time.time()
-            }
+            return self._get_ring(self._processed_frames, stream_key).push(
+                None, frame, True, 0, 0, time.time(), capture_time, metadata
+            )
 
     def get_processed_frame(self, stream_key: str) -> Tuple[bool, bytes]:
         """获取处理后的帧"""
         with self._processed_frames_lock:
-            frame_data = self._processed_frames.get(stream_key)
-            if frame_data and time.time() - frame_data['timestamp'] <= 1.0:
-                return True, frame_data['frame']
+            ring = self._processed_frames.get(stream_key)
+            slot = ring.latest() if ring else None
+            if self._is_fresh(slot):
+                return True, slot.frame
         return False, b''
 
+    def repeat_processed_frame(self, stream_key: str, capture_time: Optional[float] = None) -> int:
+        """
+        以新序号重新发布最新的处理帧（画面未变化时复用处理结果），返回新序号，没有可复用的帧时返回0
+        JPEG、附带输出以及已编码的变体一并复用，不重新编码
+        """
+        with self._processed_frames_lock:
+            ring = self._processed_frames.get(stream_key)
+            previous = ring.latest() if ring else None
+            if previous is None or not previous.frame:
+                return 0
+            image, frame, metadata = previous.image, previous.frame, previous.metadata
+            variants = dict(previous.variants) if previous.variants else None
+            seq = ring.push(None, frame, True, 0, 0, time.time(), capture_time, metadata)
+            slot = ring.get(seq)
+            slot.image = image
+            slot.variants = variants
+            return seq
+
+    def get_latest_processed(self, stream_key: str) -> Optional[BufferedFrame]:
+        """获取处理流最新的未过期处理帧，没有时返回None"""
+        with self._processed_frames_lock:
+            ring = self._processed_frames.get(stream_key)
+            slot = ring.latest() if ring else None
+            return slot.snapshot() if self._is_fresh(slot) else None
+
+    def get_processed_sequence(self, stream_key: str) -> int:
+        """获取处理流最新帧的序号，没有帧时返回0"""
+        with self._processed_frames_lock:
+            ring = self._processed_frames.get(stream_key)
+            return ring.latest_seq if ring else 0
+
+    def get_processed_frame_since(self, stream_key: str, last_seq: int,
+                                  variant: Optional[Tuple[int, int]] = None) -> Tuple[int, bytes]:
+        """获取序号大于last_seq的最新处理帧（可指定变体），没有更新的帧时返回(last_seq, b'')"""
+        with self._processed_frames_lock:
+            ring = self._processed_frames.get(stream_key)
+            if not ring or ring.latest_seq <= last_seq:
+                return last_seq, b''
+            slot = ring.latest()
+            if not self._is_fresh(slot):
+                return ring.latest_seq, b''
+            if variant is None:
+                return slot.seq, slot.frame
+            seq = slot.seq
+        return seq, self._get_variant(self._processed_frames, self._processed_frames_lock,
+                                      stream_key, seq, variant)
+
+    def get_processed_metadata(self, stream_key: str, seq: int) -> Optional[Dict]:
+        """获取处理流指定序号帧附带的非图像输出，没有或帧已被覆盖时返回None"""
+        with self._processed_frames_lock:
+            ring = self._processed_frames.get(stream_key)
+            slot = ring.get(seq) if ring else None
+            return slot.metadata if slot else None
+
+    def get_capture_time(self, key: str, seq: int, processed: bool = False) -> float:
+        """获取摄像头（或处理流）指定序号帧的采集时间，帧已被覆盖时返回0"""
+        rings, lock = ((self._processed_frames, self._processed_frames_lock) if processed
+                       else (self._frames, self._frames_lock))
+        with lock:
+            ring = rings.get(key)
+            slot = ring.get(seq) if ring else None
+            return slot.capture_time if slot else 0.0
+
+    def remove_processed_frame(self, stream_key: str) -> None:
+        """释放处理流缓冲区中的帧，保留序号计数"""
+        with self._processed_frames_lock:
+            ring = self._processed_frames.get(stream_key)
+            if ring:
+                ring.clear()
+
     def cleanup(self):
         """清理资源"""
-        self._cleanup_event.set()
         with self._frames_lock:
-            self._frames.clear()
+            for ring in self._frames.values():
+                ring.clear()
         with self._processed_frames_lock:
-            self._processed_frames.clear()
+            for ring in self._processed_frames.values():
+                ring.clear()
 
-class CameraService:
-    def __init__(self):
-        # 细粒度锁
-        self._cameras_lock = RLock()  # 用于保护cameras字典
-        self._streams_lock = RLock()  # 用于保护processed_streams字典
-        self._processors_lock = RLock()  # 用于保护frame_processors字典
-        
-        # 条件变量，用于帧更新通知
-        self._frame_condition = Condition()
-        
-        # 受保护的资源
-        self._cameras: Dict[str, CameraInfo] = {}
-        self._processed_streams: Dict[str, ProcessedStream] = {}
-        self._frame_processors: Dict[int, 'FrameProcessor'] = {}
-        
-        # 帧缓冲
-        self.frame_buffer = FrameBuffer()
-        
-        # 启动清理线程
-        self._cleanup_event = Event()
-        self._start_cleanup_thread()
+class CameraSupervisor:
+    """
+    摄像头重连监督器
+    流线程读取失败达到上限后把摄像头交给监督器，由监督器按指数退避（带随机抖动）重试重连，
+    同时进行的重连数受限，失效的视频源只占用有限且可预期的资源；每个摄像头记录重连统计
+    """
 
-    def _start_cleanup_thread(self):
-        """启动清理线程，定期检查和清理无效的流和资源"""
-        def cleanup():
-            while True:
-                try:
-                    self._cleanup_resources()
-                except Exception as e:
-                    logger.error(f"Resource cleanup error: {str(e)}")
-                time.sleep(5)  # 每5秒清理一次
+    def __init__(self, service: 'CameraService'):
+        self._service = service
+        self.base_delay = float(os.environ.get('CAMERA_RECONNECT_BASE_DELAY', '1.0'))
+        self.max_delay = float(os.environ.get('CAMERA_RECONNECT_MAX_DELAY', '60'))
+        self.max_attempts = int(os.environ.get('CAMERA_RECONNECT_MAX_ATTEMPTS', '0'))  # 0表示不限次数
+        self.max_concurrent = max(1, int(os.environ.get('CAMERA_MAX_CONCURRENT_RECONNECTS', '2')))
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._condition = Condition()
+        self._due: Dict[str, float] = {}  # camera_id -> 下次重连时间（time.monotonic）
+        self._in_progress: set = set()
+        self._stats: Dict[str, Dict] = {}
+        self._thread: Optional[threading.Thread] = None
 
-        thread = threading.Thread(target=cleanup, daemon=True)
-        thread.start()
+    def _backoff_delay(self, failures: int) -> float:
+        """第failures次失败后的等待时间：指数增长，上限max_delay，并乘以0.5~1.5的随机抖动避免同时重连"""
+        delay = min(self.max_delay, self.base_delay * (2 ** min(failures, 16)))
+        return delay * random.uniform(0.5, 1.5)
 
-    def _cleanup_resources(self):
-        """清理无效的摄像头和处理流"""
-        with self._cameras_lock:
-            # 清理无效的摄像头
-            for camera_id in list(self._cameras.keys()):
-                try:
-                    camera = self._cameras[camera_id]
-                    if not camera.cap.isOpened():
-                        logger.warning(f"Found dead camera {camera_id}, cleaning up")
-                        self._force_cleanup_camera(camera_id)
-                except Exception as e:
-                    logger.error(f"Error checking camera {camera_id}: {str(e)}")
-                    self._force_cleanup_camera(camera_id)
+    def _get_stats(self, camera_id: str) -> Dict:
+        """获取（必要时创建）摄像头的重连统计，需持有_condition"""
+        stats = self._stats.get(camera_id)
+        if stats is None:
+            stats = {
+                'attempts': 0,
+                'successes': 0,
+                'failures': 0,
+                'consecutive_failures': 0,
+                'last_attempt': None,
+                'last_success': None,
+                'last_error': None,
+            }
+            self._stats[camera_id] = stats
+        return stats
+
+    def request_reconnect(self, camera_id: str) -> None:
+        """请求重连摄像头，已在等待或重连中时忽略"""
+        with self._condition:
+            if camera_id in self._due or camera_id in self._in_progress:
+                return
+            stats = self._get_stats(camera_id)
+            self._due[camera_id] = time.monotonic() + self._backoff_delay(stats['consecutive_failures'])
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="camera-supervisor", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def cancel(self, camera_id: str) -> None:
+        """摄像头被关闭时取消尚未开始的重连并清除统计"""
+        with self._condition:
+            self._due.pop(camera_id, None)
+            self._stats.pop(camera_id, None)
+
+    def is_pending(self, camera_id: str) -> bool:
+        with self._condition:
+            return camera_id in self._due or camera_id in self._in_progress
+
+    def get_stats(self, camera_id: str) -> Optional[Dict]:
+        """获取摄像头的重连统计，包括距下次重试的秒数"""
+        with self._condition:
+            stats = self._stats.get(camera_id)
+            if stats is None:
+                return None
+            result = dict(stats)
+            due = self._due.get(camera_id)
+            result['in_progress'] = camera_id in self._in_progress
+            result['next_attempt_in'] = max(0.0, due - time.monotonic()) if due is not None else None
+            return result
+
+    def _run(self) -> None:
+        """调度线程：等待最早到期的重连，占用一个并发名额后交给工作线程执行"""
+        while True:
+            with self._condition:
+                while True:
+                    now = time.monotonic()
+                    ready = [camera_id for camera_id, due in self._due.items() if due <= now]
+                    if ready:
+                        break
+                    timeout = min(self._due.values()) - now if self._due else None
+                    self._condition.wait(timeout)
+            
+            for camera_id in ready:
+                self._slots.acquire()
+                with self._condition:
+                    if self._due.pop(camera_id, None) is None:
+                        # 等待名额期间已被取消
+                        self._slots.release()
+                        continue
+                    self._in_progress.add(camera_id)
+                threading.Thread(target=self._attempt, args=(camera_id,),
+                                 name=f"camera-reconnect-{camera_id}", daemon=True).start()
+
+    def _attempt(self, camera_id: str) -> None:
+        """执行一次重连，失败时按退避时间重新排期，超过最大次数时放弃并关闭摄像头"""
+        try:
+            with self._condition:
+                stats = self._get_stats(camera_id)
+                stats['attempts'] += 1
+                stats['last_attempt'] = time.time()
+            
+            try:
+                result = self._service._reopen_camera(camera_id)
+                error = None if result else "无法打开摄像头"
+            except Exception as e:
+                logger.error(f"重连摄像头 {camera_id} 出错: {str(e)}")
+                result, error = False, str(e)
+            
+            give_up = False
+            with self._condition:
+                stats = self._get_stats(camera_id)
+                if result is None:
+                    # 摄像头已被关闭，不再重连
+                    self._stats.pop(camera_id, None)
+                elif result:
+                    stats['successes'] += 1
+                    stats['consecutive_failures'] = 0
+                    stats['last_success'] = time.time()
+                    stats['last_error'] = None
+                    logger.info(f"摄像头 {camera_id} 重连成功 (累计尝试 {stats['attempts']} 次)")
+                else:
+                    stats['failures'] += 1
+                    stats['consecutive_failures'] += 1
+                    stats['last_error'] = error
+                    if self.max_attempts and stats['consecutive_failures'] >= self.max_attempts:
+                        give_up = True
+                    else:
+                        delay = self._backoff_delay(stats['consecutive_failures'])
+                        self._due[camera_id] = time.monotonic() + delay
+                        self._condition.notify()
+                        logger.warning(
+                            f"摄像头 {camera_id} 重连失败 ({stats['consecutive_failures']} 次)，{delay:.1f}秒后重试"
+                        )
+            
+            if give_up:
+                logger.error(f"摄像头 {camera_id} 连续 {self.max_attempts} 次重连失败，放弃并关闭摄像头")
+                self._service._force_cleanup_camera(camera_id)
+        finally:
+            with self._condition:
+                self._in_progress.discard(camera_id)
+            self._slots.release()
+
+class DeviceStatusWriter:
+    """
+    设备状态写入器：摄像头状态变化时发布事件，由后台线程合并后批量写入Device.status
+    同一设备在一个刷新周期内的多次变化只写入最后一次，与数据库已一致的状态不重复写入；
+    视频源到设备ID的索引只在首次使用、设备配置变更或未命中时加载，单次状态变化为O(1)
+    """
+
+    # 摄像头连接状态 -> 设备状态（connecting不对应设备状态，不发布）
+    STATUS_MAP = {
+        'online': 'online',
+        'degraded': 'online',
+        'reconnecting': 'error',
+        'finished': 'offline',
+        'offline': 'offline',
+    }
+
+    def __init__(self):
+        self.flush_interval = float(os.environ.get('CAMERA_STATUS_FLUSH_INTERVAL', '0.5'))
+        self.index_reload_interval = float(os.environ.get('CAMERA_STATUS_INDEX_RELOAD_INTERVAL', '30'))
+        self._condition = Condition()
+        self._pending: Dict[str, str] = {}  # 视频源键 -> 待写入的设备状态
+        self._index: Optional[Dict[str, List[int]]] = None  # 视频源键 -> 设备ID列表
+        self._index_loaded_at = 0.0
+        self._last_written: Dict[int, str] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def source_key(source: Union[int, str]) -> str:
+        """统一视频源表示：本地摄像头索引为device:N，网络流和回放源为URL本身"""
+        if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+            return f"device:{source}"
+        return str(source)
+
+    def publish(self, source: Union[int, str], status: str) -> None:
+        """发布摄像头状态变化，立即返回，由后台线程合并写入"""
+        device_status = self.STATUS_MAP.get(status)
+        if device_status is None:
+            return
+        with self._condition:
+            self._pending[self.source_key(source)] = device_status
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="device-status-writer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def invalidate_index(self) -> None:
+        """设备增删或视频源配置变更后调用：下次写入时重新加载索引，并忘记已写入的状态"""
+        with self._condition:
+            self._index = None
+            self._last_written.clear()
+
+    def forget_device(self, device_id: int) -> None:
+        """设备状态被直接修改后调用：下次写入时不再认为该设备的状态已与数据库一致，索引保持不变"""
+        with self._condition:
+            self._last_written.pop(device_id, None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            # 等待一个刷新周期，合并期间的状态变化
+            time.sleep(self.flush_interval)
+            with self._condition:
+                pending, self._pending = self._pending, {}
+            try:
+                self._flush(pending)
+            except Exception as e:
+                logger.error(f"写入设备状态出错: {str(e)}")
+
+    def _load_index(self, db: Session) -> Dict[str, List[int]]:
+        """一次查询加载所有摄像头设备的视频源索引"""
+        from ..models import Device
+        index: Dict[str, List[int]] = {}
+        for device_id, config in db.query(Device.id, Device.config).filter(Device.type == 'camera'):
+            source = config.get('source') if config else None
+            if source:
+                index.setdefault(self.source_key(source), []).append(device_id)
+        return index
+
+    def _flush(self, pending: Dict[str, str]) -> None:
+        """将合并后的状态按状态分组，在一个事务中批量更新"""
+        from ..models import Device
+        from ..models.base import SessionLocal
+        from datetime import datetime
+        db = SessionLocal()
+        try:
+            with self._condition:
+                index = self._index
+                index_stale = time.monotonic() - self._index_loaded_at >= self.index_reload_interval
+            # 未加载，或有视频源未命中且距上次加载已足够久（可能是新添加的设备）时重新加载
+            if index is None or (index_stale and any(key not in index for key in pending)):
+                index = self._load_index(db)
+                with self._condition:
+                    self._index = index
+                    self._index_loaded_at = time.monotonic()
+            
+            by_status: Dict[str, List[int]] = {}
+            with self._condition:
+                for key, status in pending.items():
+                    for device_id in index.get(key, ()):
+                        if self._last_written.get(device_id) != status:
+                            by_status.setdefault(status, []).append(device_id)
+            if not by_status:
+                return
+            
+            now = datetime.utcnow()
+            for status, device_ids in by_status.items():
+                db.query(Device).filter(Device.id.in_(device_ids)).update(
+                    {Device.status: status, Device.updated_at: now}, synchronize_session=False
+                )
+            db.commit()
+            with self._condition:
+                for status, device_ids in by_status.items():
+                    for device_id in device_ids:
+                        self._last_written[device_id] = status
+            logger.info(f"已更新设备状态: {by_status}")
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+class CameraService:
+    def __init__(self):
+        # 细粒度锁
+        self._cameras_lock = RLock()  # 用于保护cameras字典
+        self._streams_lock = RLock()  # 用于保护processed_streams字典
+        self._processors_lock = RLock()  # 用于保护frame_processors字典
+        # 每个摄像头的打开锁：打开/重连在_cameras_lock之外进行，同一摄像头的打开按此锁串行
+        self._open_locks: Dict[str, threading.Lock] = {}
+        self._open_locks_lock = threading.Lock()
+        
+        # 帧发布/订阅总线：每个摄像头（或处理流）一个条件变量，用于新帧通知
+        self._frame_conditions: Dict[str, Condition] = {}
+        self._frame_conditions_lock = threading.Lock()
+        # 异步客户端的新帧通知
+        self._async_notifier = AsyncFrameNotifier()
+        # 每个摄像头（或处理流）当前客户端请求的帧变体及其客户端数，None表示原始尺寸、默认质量
+        self._variant_refs: Dict[str, Dict[Optional[Tuple[int, int]], int]] = {}
+        self._variant_refs_lock = threading.Lock()
+        
+        # 每个摄像头的最大并发观看客户端数（原始流与处理流合计）
+        self.max_clients_per_camera = int(os.environ.get('CAMERA_MAX_CLIENTS', '64'))
+        
+        # 处理流画面变化门控：开关、变化像素比例阈值和最长复用时间（秒）
+        self.change_gate_enabled = os.environ.get('CAMERA_CHANGE_GATE', '0') == '1'
+        self.change_gate_threshold = float(os.environ.get('CAMERA_CHANGE_THRESHOLD', '0.01'))
+        self.change_gate_max_staleness = float(os.environ.get('CAMERA_CHANGE_MAX_STALENESS', '2.0'))
+        # 每个巡检任务结果通道保留的最近结果数
+        self.inspection_max_results = int(os.environ.get('CAMERA_INSPECTION_MAX_RESULTS', '100'))
+        
+        # 采集模式：thread - 在本进程的线程中采集（默认）；process - 每个摄像头在独立子进程中采集，
+        # 帧经共享内存传回并复制到帧缓冲池，采集不受本进程GIL影响
+        self.capture_mode = os.environ.get('CAMERA_CAPTURE_MODE', 'thread')
+        if self.capture_mode not in ('thread', 'process'):
+            logger.warning(f"未知的采集模式 {self.capture_mode}，使用thread模式")
+            self.capture_mode = 'thread'
+        
+        # 受保护的资源
+        self._cameras: Dict[str, CameraInfo] = {}
+        self._processed_streams: Dict[str, ProcessedStream] = {}
+        # 巡检任务（键与其处理流相同），由_streams_lock保护
+        self._inspection_jobs: Dict[str, InspectionJob] = {}
+        # 有处理流的摄像头，处理流增删时在_streams_lock内整体替换，采集线程每帧无锁读取
+        self._streamed_cameras: frozenset = frozenset()
+        self._frame_processors: Dict[int, 'FrameProcessor'] = {}
+        
+        # 帧缓冲
+        self.frame_buffer = FrameBuffer()
+        # 没有处理流时按需处理的快照结果：stream_key -> (摄像头ID, 源帧序号, 源帧采集时间, JPEG)
+        # 源帧未更新时重复的快照请求直接复用，不再处理
+        self._snapshot_cache: Dict[str, Tuple[str, int, float, bytes]] = {}
+        self._snapshot_cache_lock = threading.Lock()
+        
+        # 各阶段耗时直方图（摄像头ID或处理流键 -> StageMetrics），CAMERA_METRICS=0时关闭
+        self.metrics_enabled = os.environ.get('CAMERA_METRICS', '1') != '0'
+        self._metrics: Dict[str, StageMetrics] = {}
+        self._metrics_lock = threading.Lock()
+        if self.metrics_enabled:
+            self.frame_buffer.stage_recorder = self.record_stage
+        
+        # 摄像头重连监督器
+        self.supervisor = CameraSupervisor(self)
+        # 设备状态写入器：摄像头状态变化时发布，后台合并批量写入数据库
+        self.status_writer = DeviceStatusWriter()
+        # 采集线程：没有客户端和处理流时只grab不解码，但每隔该时间（秒）仍取一帧，保证快照能取到新帧；0表示每帧都取
+        self.idle_retrieve_interval = float(os.environ.get('CAMERA_IDLE_RETRIEVE_INTERVAL', '0.5'))
+        # 每个摄像头帧缓冲池的缓冲区上限：帧缓存槽位直接引用池中的缓冲区，上限为帧缓存的历史帧数
+        # 加上消费者同时持有的帧数；缓冲区按需分配，CAMERA_FRAME_POOL=0时关闭
+        self.frame_pool_enabled = os.environ.get('CAMERA_FRAME_POOL', '1') != '0'
+        self.frame_pool_size = self.frame_buffer.max_size + int(os.environ.get('CAMERA_FRAME_POOL_EXTRA', '4'))
+        # 同步组名 -> 组内摄像头共享的采集节拍器
+        self._sync_pacers: Dict[str, FramePacer] = {}
+        self._sync_pacers_lock = threading.Lock()
+        # 摄像头检测：并发探测的本地索引数、单个探测超时（秒）和检测结果缓存时间（秒）
+        self.detect_max_index = int(os.environ.get('CAMERA_DETECT_MAX_INDEX', '16'))
+        self.probe_timeout = float(os.environ.get('CAMERA_PROBE_TIMEOUT', '3.0'))
+        self.detect_cache_ttl = float(os.environ.get('CAMERA_DETECT_CACHE_TTL', '60'))
+        self._detected_cameras: Optional[List[Dict]] = None
+        self._detected_at = 0.0
+        self._detect_refreshing = False
+        self._pending_probes = set()  # 尚未结束（可能已超时）的探测源
+        self._detect_lock = threading.Lock()
+        self._detect_scan_lock = threading.Lock()
+        
+        # 共享内存槽位数：帧在grab后立即复制出共享内存，槽位只需覆盖子进程写入与主进程复制之间的间隔
+        self.shm_slots = int(os.environ.get('CAMERA_SHM_SLOTS', '4'))
+        
+        # 启动清理线程
+        self._cleanup_event = Event()
+        self._start_cleanup_thread()
+
+    def _start_cleanup_thread(self):
+        """启动清理线程，定期检查和清理无效的流和资源"""
+        def cleanup():
+            while True:
+                try:
+                    self._cleanup_resources()
+                except Exception as e:
+                    logger.error(f"Resource cleanup error: {str(e)}")
+                time.sleep(5)  # 每5秒清理一次
+
+        thread = threading.Thread(target=cleanup, daemon=True)
+        thread.start()
+
+    def _cleanup_resources(self):
+        """清理无效的摄像头和处理流"""
+        with self._cameras_lock:
+            # 清理无效的摄像头
+            for camera_id in list(self._cameras.keys()):
+                try:
+                    camera = self._cameras[camera_id]
+                    if not camera.is_alive():
+                        logger.warning(f"Found dead camera {camera_id}, cleaning up")
+                        self._force_cleanup_camera(camera_id)
+                except Exception as e:
+                    logger.error(f"Error checking camera {camera_id}: {str(e)}")
+                    self._force_cleanup_camera(camera_id)
 
             # 清理无效的处理流
             for stream_key in list(self._processed_streams.keys()):
                 try:
                     stream = self._processed_streams[stream_key]
-                    if not stream.is_streaming or stream.clients <= 0:
+                    if not stream.is_streaming or stream.idle:
                         logger.warning(f"Found dead stream {stream_key}, cleaning up")
                         self._force_cleanup_stream(stream_key)
                 except Exception as e:
                     logger.error(f"Error checking stream {stream_key}: {str(e)}")
                     self._force_cleanup_stream(stream_key)
 
+            # 处理流因摄像头关闭或出错停止的巡检任务，在摄像头恢复后重新启动（在锁外启动）
+            restart_jobs = []
+            with self._streams_lock:
+                for job in self._inspection_jobs.values():
+                    if job.job_id not in self._processed_streams:
+                        camera = self._cameras.get(job.camera_id)
+                        if camera is not None and camera.is_alive() and not camera.is_connecting():
+                            restart_jobs.append(job)
+
             # 清理过期的帧处理器
             current_time = time.time()
             for db_id in list(self._frame_processors.keys()):
@@ -442,24 +1967,38 @@ class CameraService:
                     processor.last_used = current_time
                 elif current_time - processor.last_used > 300:  # 5分钟未使用
                     del self._frame_processors[db_id]
+        
+        # 启动处理流需要查询数据库并可能启动摄像头流，不能持有摄像头和处理流注册表锁
+        for job in restart_jobs:
+            if job.active:
+                logger.info(f"重新启动巡检任务 {job.job_id}")
+                job.restarts += 1
+                self._attach_inspection_job(job)
 
-    def _force_cleanup_camera(self, camera_id: str):
-        """强制清理摄像头资源"""
+    def _force_cleanup_camera(self, camera_id: str) -> Optional[threading.Thread]:
+        """
+        强制清理摄像头资源：从注册表移除并停止流，不等待流线程
+        流线程仍在运行时由其退出时释放cap（避免与正在进行的读取并发释放），返回该线程供调用方按需等待
+        """
         try:
             with self._cameras_lock:
-                if camera_id in self._cameras:
-                    camera = self._cameras[camera_id]
-                    if camera.is_streaming:
-                        camera.is_streaming = False
-                    if camera.thread and camera.thread.is_alive():
-                        camera.thread.join(timeout=0.5)
-                    camera.cap.release()
-                    del self._cameras[camera_id]
+                camera = self._cameras.pop(camera_id, None)
+                if camera is None:
+                    return None
+                camera.is_streaming = False
+                camera.closed = True
+                self.supervisor.cancel(camera_id)
+                if camera.status != 'connecting':
+                    self.status_writer.publish(camera.device_id, 'offline')
+                thread = camera.thread
+                if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+                    return thread
+                cap, camera.cap = camera.cap, None
+            if cap is not None:
+                cap.release()
         except Exception as e:
             logger.error(f"Error during force cleanup of camera {camera_id}: {str(e)}")
-        finally:
-            if camera_id in self._cameras:
-                del self._cameras[camera_id]
+        return None
 
     def _force_cleanup_stream(self, stream_key: str):
         """强制清理处理流资源"""
@@ -477,18 +2016,7 @@ class CameraService:
                         
                         logger.info(f"清理处理流: camera={camera_id}, operation_id={operation_id}, type={operation_type}")
                         
-                        # 清理流资源
-                        stream.is_streaming = False
-                        
-                        # 关闭数据库会话
-                        try:
-                            if hasattr(stream, 'db_session') and stream.db_session:
-                                stream.db_session.close()
-                                logger.info(f"已关闭流 {stream_key} 的数据库会话")
-                        except Exception as e:
-                            logger.error(f"关闭流 {stream_key} 的数据库会话时出错: {str(e)}")
-                        
-                        # 清理其它资源
+                        # 停止工作线程并清理资源（数据库会话由工作线程退出时关闭）
                         stream.cleanup()
                         
                         # 从字典中删除
@@ -501,14 +2029,14 @@ class CameraService:
                             del self._processed_streams[stream_key]
                 else:
                     logger.warning(f"找不到要清理的处理流: {stream_key}")
+                self._refresh_streamed_cameras()
             
-            # 清理相关的帧缓存
+            # 清理相关的帧缓存，并唤醒仍在等待该处理流的客户端
             try:
-                # 使用正确的锁来清理处理流的帧缓存
-                with self.frame_buffer._processed_frames_lock:
-                    if stream_key in self.frame_buffer._processed_frames:
-                        del self.frame_buffer._processed_frames[stream_key]
-                        logger.info(f"已清理处理流 {stream_key} 的帧缓存")
+                self.frame_buffer.remove_processed_frame(stream_key)
+                self._remove_metrics(stream_key)
+                self._notify_frame(stream_key)
+                logger.info(f"已清理处理流 {stream_key} 的帧缓存")
             except Exception as e:
                 logger.error(f"清理流 {stream_key} 的帧缓存时出错: {str(e)}")
                 
@@ -518,62 +2046,186 @@ class CameraService:
             try:
                 if stream_key in self._processed_streams:
                     del self._processed_streams[stream_key]
+                self._refresh_streamed_cameras()
             except:
                 pass
 
-    def detect_cameras(self) -> List[Dict]:
+    def _probe_source(self, source: Union[int, str]) -> Optional[Dict]:
         """
-        检测系统中可用的摄像头
+        探测单个视频源（本地摄像头索引或网络URL），能打开并读到帧时返回摄像头信息
         """
-        detected_cameras = []
+        is_local = isinstance(source, int)
+        print(f"Attempting to detect camera at {'index ' if is_local else ''}{source}...")
+        cap = cv2.VideoCapture(source)
+        try:
+            if not cap.isOpened():
+                print(f"Camera {source} couldn't be opened")
+                return None
+            
+            # 获取摄像头信息
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            fps = int(cap.get(cv2.CAP_PROP_FPS))
+            
+            # 读取一帧以确认摄像头工作正常
+            ret, frame = cap.read()
+            if not ret:
+                print(f"Failed to read frame from camera {source}")
+                return None
+            if not width or not height:
+                height, width = frame.shape[:2]
+            
+            print(f"Successfully read frame from camera {source}")
+            return {
+                'device_id': source,
+                'name': f'Camera {source}' if is_local else source,
+                'type': 'camera',
+                'model': 'USB Camera' if is_local else 'IP Camera',
+                'status': 'online',
+                'config': {
+                    'resolution': f'{width}x{height}',
+                    'fps': fps,
+                    'format': 'MJPEG',
+                    'source': f'device:{source}' if is_local else source
+                }
+            }
+        finally:
+            cap.release()
+
+    def _get_configured_camera_urls(self) -> List[str]:
+        """获取设备设置中配置的RTSP/HTTP摄像头URL"""
+        try:
+            from .settings import SettingsService
+            from ..models.base import SessionLocal
+            db = SessionLocal()
+            try:
+                devices = SettingsService(db).get_devices()
+                urls = []
+                for device in devices:
+                    source = device.config.get('source') if device.type == 'camera' and device.config else None
+                    if source and source.startswith(('rtsp://', 'http://', 'https://')) and source not in urls:
+                        urls.append(source)
+                return urls
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"读取已配置的摄像头URL出错: {str(e)}")
+            return []
+
+    def _get_open_camera_info(self, device_id: Union[int, str]) -> Optional[Dict]:
+        """已被本服务打开的视频源不再重复探测，直接根据当前状态返回摄像头信息"""
+        with self._cameras_lock:
+            for camera in self._cameras.values():
+                if str(camera.device_id) != str(device_id) or not camera.is_open():
+                    continue
+                is_local = isinstance(device_id, int)
+                return {
+                    'device_id': device_id,
+                    'name': f'Camera {device_id}' if is_local else device_id,
+                    'type': 'camera',
+                    'model': 'USB Camera' if is_local else 'IP Camera',
+                    'status': 'online',
+                    'config': {
+                        'resolution': f'{int(camera.cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x'
+                                      f'{int(camera.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}',
+                        'fps': int(camera.cap.get(cv2.CAP_PROP_FPS)),
+                        'format': 'MJPEG',
+                        'source': f'device:{device_id}' if is_local else device_id
+                    }
+                }
+        return None
+
+    def _scan_cameras(self) -> List[Dict]:
+        """
+        并发探测所有本地摄像头索引和已配置的网络摄像头，整体耗时约为单个探测的超时时间
+        探测线程为守护线程：VideoCapture打开无法取消，超时的探测在后台结束，下次扫描时跳过仍未结束的源
+        """
+        sources: List[Union[int, str]] = list(range(self.detect_max_index))
+        sources.extend(self._get_configured_camera_urls())
         
-        # 尝试使用OpenCV检测摄像头
-        for i in range(1):  # 检查前10个索引
+        results: Dict[Union[int, str], Dict] = {}
+        results_lock = threading.Lock()
+        
+        def probe(source):
             try:
-                # On macOS, be more careful with camera initialization
-                print(f"Attempting to detect camera at index {i}...")
-                cap = cv2.VideoCapture(i)
-                
-                # Give it a moment to initialize
-                time.sleep(0.5)
-                
-                if cap.isOpened():
-                    print(f"Camera {i} detected and opened successfully")
-                    # 获取摄像头信息
-                    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                    fps = int(cap.get(cv2.CAP_PROP_FPS))
-                    
-                    # 读取一帧以确认摄像头工作正常
-                    ret, frame = cap.read()
-                    if ret:
-                        print(f"Successfully read frame from camera {i}")
-                        detected_cameras.append({
-                            'device_id': i,
-                            'name': f'Camera {i}',
-                            'type': 'camera',
-                            'model': 'USB Camera',
-                            'status': 'online',
-                            'config': {
-                                'resolution': f'{width}x{height}',
-                                'fps': fps,
-                                'format': 'MJPEG',
-                                'source': f'device:{i}'
-                            }
-                        })
-                    else:
-                        print(f"Failed to read frame from camera {i}")
-                else:
-                    print(f"Camera {i} couldn't be opened")
-                
-                # Properly release the camera
-                cap.release()
-                time.sleep(0.5)  # Give it time to properly close
-                
+                info = self._probe_source(source)
+                if info:
+                    with results_lock:
+                        results[source] = info
             except Exception as e:
-                logger.error(f"Error detecting camera at index {i}: {str(e)}")
-                print(f"Exception while detecting camera {i}: {str(e)}")
-                
+                logger.error(f"Error detecting camera at {source}: {str(e)}")
+            finally:
+                with self._detect_lock:
+                    self._pending_probes.discard(source)
+        
+        threads = []
+        for source in sources:
+            info = self._get_open_camera_info(source)
+            if info:
+                results[source] = info
+                continue
+            with self._detect_lock:
+                if source in self._pending_probes:
+                    logger.warning(f"视频源 {source} 的上一次探测尚未结束，跳过")
+                    continue
+                self._pending_probes.add(source)
+            thread = threading.Thread(target=probe, args=(source,), name=f"camera-probe-{source}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        
+        deadline = time.time() + self.probe_timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.time()))
+        timed_out = sum(1 for thread in threads if thread.is_alive())
+        if timed_out:
+            logger.warning(f"{timed_out} 个视频源探测超时 ({self.probe_timeout}s)")
+        
+        with results_lock:
+            # 按探测源的顺序返回，本地摄像头在前
+            return [results[source] for source in sources if source in results]
+
+    def _refresh_detected_cameras(self) -> List[Dict]:
+        """执行一次扫描并更新缓存，同一时间只进行一次扫描"""
+        with self._detect_scan_lock:
+            detected_cameras = self._scan_cameras()
+            with self._detect_lock:
+                self._detected_cameras = detected_cameras
+                self._detected_at = time.time()
+                self._detect_refreshing = False
+            return detected_cameras
+
+    def _start_detection_refresh(self) -> None:
+        """在后台刷新摄像头检测缓存"""
+        with self._detect_lock:
+            if self._detect_refreshing:
+                return
+            self._detect_refreshing = True
+        
+        def refresh():
+            try:
+                self._refresh_detected_cameras()
+            except Exception as e:
+                logger.error(f"后台刷新摄像头检测结果出错: {str(e)}")
+                with self._detect_lock:
+                    self._detect_refreshing = False
+        
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def detect_cameras(self, refresh: bool = False) -> List[Dict]:
+        """
+        检测系统中可用的摄像头
+        结果会被缓存：缓存过期时立即返回旧结果并在后台刷新；没有缓存或refresh=True时同步扫描
+        """
+        with self._detect_lock:
+            cached, detected_at = self._detected_cameras, self._detected_at
+        
+        if cached is not None and not refresh:
+            if time.time() - detected_at > self.detect_cache_ttl:
+                self._start_detection_refresh()
+            detected_cameras = list(cached)
+        else:
+            detected_cameras = self._refresh_detected_cameras()
+        
         # If no cameras detected, try with direct system commands on macOS
         if not detected_cameras and platform.system() == 'Darwin':
             try:
@@ -600,194 +2252,373 @@ class CameraService:
                 
         return detected_cameras
     
-    def open_camera(self, camera_id: str, device_id: Union[int, str]) -> bool:
+    def open_camera(self, camera_id: str, device_id: Union[int, str], config: Optional[Dict] = None) -> bool:
         """
         打开摄像头
         camera_id: 系统内部摄像头ID
         device_id: 设备ID（可以是本地摄像头索引或URL字符串）
+        config: 设备配置（Device.config），提供分辨率、帧率、ROI等采集设置，为None时按视频源从设备表中查找
+        打开过程（等待设备初始化、测试读取、更新设备状态）在摄像头注册表锁之外进行，
+        期间摄像头处于connecting（首次打开）或reconnecting（重新连接）状态，不阻塞其它摄像头；
+        同一摄像头的并发打开请求按摄像头串行执行
         """
         logger.info(f"尝试打开摄像头: {camera_id}, 设备ID: {device_id}, 系统: {platform.system()}")
         
+        with self._get_open_lock(camera_id):
+            old_cap = None
+            with self._cameras_lock:
+                camera = self._cameras.get(camera_id)
+                if camera is not None:
+                    # 检查现有摄像头是否仍然可用
+                    if camera.is_open():
+                        logger.info(f"摄像头 {camera_id} 已经打开")
+                        return True
+                    # 尝试重新打开，沿用已登记的设备ID
+                    logger.warning(f"摄像头 {camera_id} 连接已断开，尝试重新连接")
+                    device_id = camera.device_id
+                    old_cap, camera.cap = camera.cap, None
+                    self._set_camera_status(camera, 'reconnecting')
+                else:
+                    camera = CameraInfo(device_id, None, status='connecting')
+                    self._cameras[camera_id] = camera
+            
+            # 首次打开时加载采集设置，重新连接时沿用已有设置（显式传入配置时更新）
+            if config is not None or camera.capture_settings is None:
+                camera.capture_settings = CaptureSettings.from_config(
+                    config if config is not None else self._load_device_config(device_id)
+                )
+            
+            # 确保关闭现有实例
+            if old_cap is not None:
+                try:
+                    old_cap.release()
+                except Exception as e:
+                    logger.error(f"关闭现有摄像头时出错: {str(e)}")
+            
+            result = self._connect_camera(camera_id, camera, device_id)
+            if result is False:
+                with self._cameras_lock:
+                    if self._cameras.get(camera_id) is camera:
+                        if camera.status == 'reconnecting' and camera.is_streaming:
+                            # 摄像头仍在流式传输，交给监督器按退避策略继续重连
+                            self.supervisor.request_reconnect(camera_id)
+                        else:
+                            camera.is_streaming = False
+                            del self._cameras[camera_id]
+            return bool(result)
+
+    def _connect_camera(self, camera_id: str, camera: CameraInfo, device_id: Union[int, str]) -> Optional[bool]:
+        """
+        在_cameras_lock之外创建视频源，并安装到摄像头条目上，调用方需持有该摄像头的打开锁
+        返回True表示成功，False表示无法打开，None表示期间摄像头已被关闭
+        """
+        try:
+            cap, source_type = self._create_capture(device_id, camera.capture_settings)
+        except Exception as e:
+            logger.exception(f"打开摄像头 {device_id} 出错: {str(e)}")
+            cap, source_type = None, camera.source_type
+        
         with self._cameras_lock:
-            if camera_id in self._cameras:
-                # 检查现有摄像头是否仍然可用
-                cap = self._cameras[camera_id].cap
-                if cap.isOpened():
-                    logger.info(f"摄像头 {camera_id} 已经打开")
+            if self._cameras.get(camera_id) is not camera:
+                # 打开期间摄像头已被关闭
+                logger.info(f"摄像头 {camera_id} 在打开期间被关闭")
+                if cap is not None:
+                    cap.release()
+                return None
+            if cap is None:
+                camera.last_error = "无法打开摄像头"
+                return False
+            camera.cap = cap
+            camera.source_type = source_type
+            self._set_camera_status(camera, 'online')
+            camera.last_error = None
+        
+        logger.info(f"成功打开摄像头 {device_id}")
+        return True
+
+    def _reopen_camera(self, camera_id: str) -> Optional[bool]:
+        """
+        由重连监督器调用，重新打开处于reconnecting状态的摄像头
+        返回True表示成功，False表示失败（监督器退避后重试），None表示摄像头已被关闭
+        """
+        with self._get_open_lock(camera_id):
+            with self._cameras_lock:
+                camera = self._cameras.get(camera_id)
+                if camera is None or camera.closed:
+                    return None
+                if camera.is_open():
+                    # 已被其它请求重新打开
                     return True
-                else:
-                    # 尝试重新打开
-                    logger.warning(f"摄像头 {camera_id} 连接已断开，尝试重新连接")
-                    # 确保关闭现有实例
-                    try:
-                        cap.release()
-                    except Exception as e:
-                        logger.error(f"关闭现有摄像头时出错: {str(e)}")
+                self._set_camera_status(camera, 'reconnecting')
+                device_id = camera.device_id
+            
+            logger.info(f"尝试重连摄像头 {camera_id}")
+            return self._connect_camera(camera_id, camera, device_id)
+
+    def _set_camera_status(self, camera: CameraInfo, status: str) -> None:
+        """设置摄像头连接状态，仅在状态变化时发布给设备状态写入器"""
+        if camera.status != status:
+            camera.status = status
+            self.status_writer.publish(camera.device_id, status)
+
+    def _get_open_lock(self, camera_id: str) -> threading.Lock:
+        """获取（必要时创建）摄像头的打开锁，用于串行化同一摄像头的打开/重连"""
+        with self._open_locks_lock:
+            lock = self._open_locks.get(camera_id)
+            if lock is None:
+                lock = threading.Lock()
+                self._open_locks[camera_id] = lock
+            return lock
+
+    def _create_capture(self, device_id: Union[int, str],
+                        settings: Optional[CaptureSettings] = None) -> Tuple[Optional[cv2.VideoCapture], str]:
+        """
+        创建并配置视频源，读取测试帧确认可用，返回(cap, 源类型)，失败时cap为None
+        包含设备初始化等待和重试，耗时较长，不能在持有_cameras_lock时调用
+        """
+        settings = settings or CaptureSettings()
+        source_type = "local"
+        logger.info(f"尝试打开摄像头 {device_id}")
+        
+        if settings.passthrough and settings.has_transform:
+            logger.warning(f"摄像头 {device_id} 配置了ROI/旋转/颜色转换，无法直通转发MJPEG，使用解码采集")
+        elif settings.passthrough and not is_replay_source(device_id):
+            # 直通采集只转发JPEG数据，开销很小，不需要子进程采集
+            cap, source_type = self._create_passthrough_capture(device_id, settings)
+            if cap is not None:
+                return cap, source_type
+            logger.warning(f"摄像头 {device_id} 不支持MJPEG直通，回退到解码采集")
+        
+        # 处理不同类型的设备ID
+        if self.capture_mode == 'process':
+            # 子进程采集：打开视频源和读取帧都在子进程中完成
+            is_local = isinstance(device_id, int) or device_id.isdigit()
+            cap = SharedMemoryCapture(int(device_id) if is_local else device_id, slots=self.shm_slots)
+            source_type = "local" if is_local else ("replay" if is_replay_source(device_id) else "external")
+        elif is_replay_source(device_id):
+            # 回放视频文件(file://)或图片文件夹(dir://)，帧率和循环由URL参数指定
+            logger.info(f"打开回放源: {device_id}")
+            cap = ReplayCapture(device_id)
+            source_type = "replay"
+        elif isinstance(device_id, int) or (isinstance(device_id, str) and device_id.isdigit()):
+            # 本地摄像头
+            numeric_id = int(device_id)
+            
+            # 在macOS上，添加额外的摄像头初始化参数
+            if platform.system() == 'Darwin':
+                logger.info(f"在macOS上打开摄像头: {numeric_id}")
+                # 确保环境变量设置正确
+                os.environ['OPENCV_AVFOUNDATION_SKIP_AUTH'] = '1'
+                
+                # 先清除可能存在的相同索引摄像头实例
+                try:
+                    dummy_cap = cv2.VideoCapture(numeric_id, cv2.CAP_AVFOUNDATION)
+                    dummy_cap.release()
+                    time.sleep(0.5)  # 给系统一些时间释放资源
+                except Exception as e:
+                    logger.warning(f"预清理摄像头时出错: {str(e)}")
                     
-            try:
-                logger.info(f"尝试打开摄像头 {device_id}")
+                # 使用明确的后端
+                cap = cv2.VideoCapture(numeric_id, cv2.CAP_AVFOUNDATION)
+                source_type = "local"
                 
-                # 处理不同类型的设备ID
-                if isinstance(device_id, int) or (isinstance(device_id, str) and device_id.isdigit()):
-                    # 本地摄像头
+                # 增加初始化延迟
+                time.sleep(1.5)  # 在macOS上等待更长时间
+            else:
+                cap = cv2.VideoCapture(numeric_id)
+                source_type = "local"
+                time.sleep(0.5)
+        elif isinstance(device_id, str):
+            # URL类型摄像头
+            if device_id.startswith(("rtsp://", "http://", "https://")):
+                logger.info(f"打开网络摄像头: {device_id}")
+                cap = cv2.VideoCapture(device_id)
+                source_type = "external"
+                time.sleep(0.5)
+            else:
+                # 尝试作为本地摄像头索引
+                try:
                     numeric_id = int(device_id)
+                    logger.info(f"将字符串 {device_id} 转换为数字索引: {numeric_id}")
                     
-                    # 在macOS上，添加额外的摄像头初始化参数
                     if platform.system() == 'Darwin':
-                        logger.info(f"在macOS上打开摄像头: {numeric_id}")
-                        # 确保环境变量设置正确
-                        os.environ['OPENCV_AVFOUNDATION_SKIP_AUTH'] = '1'
-                        
-                        # 先清除可能存在的相同索引摄像头实例
-                        try:
-                            dummy_cap = cv2.VideoCapture(numeric_id, cv2.CAP_AVFOUNDATION)
-                            dummy_cap.release()
-                            time.sleep(0.5)  # 给系统一些时间释放资源
-                        except Exception as e:
-                            logger.warning(f"预清理摄像头时出错: {str(e)}")
-                            
-                        # 使用明确的后端
                         cap = cv2.VideoCapture(numeric_id, cv2.CAP_AVFOUNDATION)
-                        source_type = "local"
-                        
-                        # 增加初始化延迟
-                        time.sleep(1.5)  # 在macOS上等待更长时间
+                        time.sleep(1.5)
                     else:
                         cap = cv2.VideoCapture(numeric_id)
-                        source_type = "local"
                         time.sleep(0.5)
-                elif isinstance(device_id, str):
-                    # URL类型摄像头
-                    if device_id.startswith(("rtsp://", "http://", "https://")):
-                        logger.info(f"打开网络摄像头: {device_id}")
-                        cap = cv2.VideoCapture(device_id)
-                        source_type = "external"
-                        time.sleep(0.5)
-                    else:
-                        # 尝试作为本地摄像头索引
-                        try:
-                            numeric_id = int(device_id)
-                            logger.info(f"将字符串 {device_id} 转换为数字索引: {numeric_id}")
-                            
-                            if platform.system() == 'Darwin':
-                                cap = cv2.VideoCapture(numeric_id, cv2.CAP_AVFOUNDATION)
-                                time.sleep(1.5)
-                            else:
-                                cap = cv2.VideoCapture(numeric_id)
-                                time.sleep(0.5)
-                            source_type = "local"
-                        except ValueError:
-                            raise ValueError(f"无效的设备ID格式: {device_id}")
-                else:
-                    raise ValueError(f"无效的设备ID类型: {type(device_id)}")
-                
-                # 检查摄像头是否打开
-                if not cap.isOpened():
-                    logger.error(f"无法打开摄像头 {device_id}")
-                    
-                    # 在macOS上尝试特殊方法
-                    if platform.system() == 'Darwin' and (isinstance(device_id, int) or 
-                                                        (isinstance(device_id, str) and device_id.isdigit())):
-                        logger.info("在macOS上尝试交替的摄像头初始化方法")
-                        try:
-                            # 尝试不同的捕获标志
-                            cap = cv2.VideoCapture(int(device_id))  # 不带特殊标志
-                            time.sleep(1.0)
-                            if not cap.isOpened():
-                                logger.warning("尝试默认后端失败，尝试其他后端")
-                                cap = cv2.VideoCapture(int(device_id), cv2.CAP_ANY)
-                                time.sleep(1.0)
-                        except Exception as e:
-                            logger.error(f"交替初始化方法出错: {str(e)}")
-                    
-                    if not cap.isOpened():
-                        return False
-                
-                # 设置摄像头参数
-                logger.info(f"摄像头 {device_id} 已打开，配置参数")
-                
-                # 尝试设置各种属性
-                try:
-                    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 减少缓冲区大小
-                except Exception as e:
-                    logger.warning(f"设置缓冲区大小失败: {str(e)}")
-                    
-                try:
-                    cap.set(cv2.CAP_PROP_FPS, 30)  # 设置帧率
-                except Exception as e:
-                    logger.warning(f"设置帧率失败: {str(e)}")
-                    
-                # 尝试设置分辨率
+                    source_type = "local"
+                except ValueError:
+                    raise ValueError(f"无效的设备ID格式: {device_id}")
+        else:
+            raise ValueError(f"无效的设备ID类型: {type(device_id)}")
+        
+        # 检查摄像头是否打开
+        if not cap.isOpened():
+            logger.error(f"无法打开摄像头 {device_id}")
+            
+            # 在macOS上尝试特殊方法
+            if self.capture_mode == 'thread' and platform.system() == 'Darwin' and (isinstance(device_id, int) or 
+                                                (isinstance(device_id, str) and device_id.isdigit())):
+                logger.info("在macOS上尝试交替的摄像头初始化方法")
                 try:
-                    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-                    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-                except Exception as e:
-                    logger.warning(f"设置分辨率失败: {str(e)}")
-                
-                # 读取一帧以确认摄像头工作正常
-                retry_count = 0
-                max_retries = 5  # 增加重试次数
-                while retry_count < max_retries:
-                    logger.info(f"尝试从摄像头 {device_id} 读取测试帧 ({retry_count+1}/{max_retries})")
-                    ret, _ = cap.read()
-                    if ret:
-                        logger.info(f"成功从摄像头 {device_id} 读取测试帧")
-                        break
-                    retry_count += 1
-                    time.sleep(0.2)  # 增加重试间隔
-                
-                if not ret:
-                    logger.error(f"摄像头 {device_id} 无法读取帧，最后尝试重置")
-                    # 最后尝试重置
-                    try:
-                        cap.release()
-                        time.sleep(1.0)
-                        if platform.system() == 'Darwin':
-                            cap = cv2.VideoCapture(int(device_id) if isinstance(device_id, str) and device_id.isdigit() else device_id, 
-                                                 cv2.CAP_AVFOUNDATION)
-                        else:
-                            cap = cv2.VideoCapture(int(device_id) if isinstance(device_id, str) and device_id.isdigit() else device_id)
+                    # 尝试不同的捕获标志
+                    cap = cv2.VideoCapture(int(device_id))  # 不带特殊标志
+                    time.sleep(1.0)
+                    if not cap.isOpened():
+                        logger.warning("尝试默认后端失败，尝试其他后端")
+                        cap = cv2.VideoCapture(int(device_id), cv2.CAP_ANY)
                         time.sleep(1.0)
-                        ret, _ = cap.read()
-                        if not ret:
-                            logger.error(f"重置后仍然无法读取帧，放弃尝试")
-                            cap.release()
-                            return False
-                    except Exception as e:
-                        logger.error(f"最后重置尝试失败: {str(e)}")
-                        return False
-                    
-                logger.info(f"成功打开摄像头 {device_id}")
-                self._cameras[camera_id] = CameraInfo(device_id, cap, source_type=source_type)
-                
-                # 尝试更新对应设备的状态
-                try:
-                    from .settings import SettingsService
-                    from ..models.base import SessionLocal
-                    db = SessionLocal()
-                    settings_service = SettingsService(db)
-                    
-                    # 查找设备ID
-                    devices = settings_service.get_devices()
-                    for device in devices:
-                        if device.type == 'camera':
-                            source = device.config.get('source') if device.config else None
-                            if source:
-                                if (source == f'device:{device_id}' or 
-                                    (source.startswith(('rtsp://', 'http://')) and source == device_id)):
-                                    settings_service.update_device_status(device.id, 'online')
-                                    logger.info(f"已更新设备ID {device.id} ({device.name}) 状态为online")
-                                    break
-                    
-                    db.close()
                 except Exception as e:
-                    logger.error(f"尝试更新设备状态时出错: {str(e)}")
-                
-                return True
+                    logger.error(f"交替初始化方法出错: {str(e)}")
+            
+            if not cap.isOpened():
+                return None, source_type
+        
+        if source_type == "replay":
+            # 回放源的帧率和分辨率由URL参数和源文件决定，不设置摄像头参数
+            ret, _ = cap.read()
+            if not ret:
+                logger.error(f"回放源 {device_id} 无法读取帧")
+                cap.release()
+                return None, source_type
+            return cap, source_type
+        
+        # 设置摄像头参数
+        logger.info(f"摄像头 {device_id} 已打开，配置参数")
+        
+        # 尝试设置各种属性
+        try:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 减少缓冲区大小
+        except Exception as e:
+            logger.warning(f"设置缓冲区大小失败: {str(e)}")
+            
+        try:
+            if settings.fps > 0:
+                cap.set(cv2.CAP_PROP_FPS, settings.fps)  # 设置帧率
+        except Exception as e:
+            logger.warning(f"设置帧率失败: {str(e)}")
+            
+        # 尝试设置分辨率
+        try:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, settings.width)
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, settings.height)
+        except Exception as e:
+            logger.warning(f"设置分辨率失败: {str(e)}")
+        
+        # 读取一帧以确认摄像头工作正常
+        retry_count = 0
+        max_retries = 5  # 增加重试次数
+        while retry_count < max_retries:
+            logger.info(f"尝试从摄像头 {device_id} 读取测试帧 ({retry_count+1}/{max_retries})")
+            ret, _ = cap.read()
+            if ret:
+                logger.info(f"成功从摄像头 {device_id} 读取测试帧")
+                break
+            retry_count += 1
+            time.sleep(0.2)  # 增加重试间隔
+        
+        if not ret:
+            logger.error(f"摄像头 {device_id} 无法读取帧，最后尝试重置")
+            # 最后尝试重置
+            try:
+                cap.release()
+                time.sleep(1.0)
+                if self.capture_mode == 'process':
+                    cap = SharedMemoryCapture(cap.source, slots=self.shm_slots)
+                elif platform.system() == 'Darwin':
+                    cap = cv2.VideoCapture(int(device_id) if isinstance(device_id, str) and device_id.isdigit() else device_id, 
+                                         cv2.CAP_AVFOUNDATION)
+                else:
+                    cap = cv2.VideoCapture(int(device_id) if isinstance(device_id, str) and device_id.isdigit() else device_id)
+                time.sleep(1.0)
+                ret, _ = cap.read()
+                if not ret:
+                    logger.error(f"重置后仍然无法读取帧，放弃尝试")
+                    cap.release()
+                    return None, source_type
             except Exception as e:
-                logger.exception(f"打开摄像头 {device_id} 出错: {str(e)}")
-                return False
-    
+                logger.error(f"最后重置尝试失败: {str(e)}")
+                return None, source_type
+            
+        return cap, source_type
+
+    def _create_passthrough_capture(self, device_id: Union[int, str],
+                                    settings: CaptureSettings) -> Tuple[Optional[PassthroughCapture], str]:
+        """
+        创建直通采集视频源：本地摄像头以MJPEG格式输出原始JPEG字节，HTTP源按MJPEG流读取
+        读取测试帧确认视频源确实输出JPEG数据，否则返回(None, 源类型)由调用方回退到解码采集
+        """
+        if isinstance(device_id, str) and device_id.startswith(("http://", "https://")):
+            logger.info(f"以直通模式打开MJPEG流: {device_id}")
+            cap = HttpMjpegCapture(device_id)
+            source_type = "external"
+        elif isinstance(device_id, int) or (isinstance(device_id, str) and device_id.isdigit()):
+            logger.info(f"以MJPEG直通模式打开本地摄像头: {device_id}")
+            if platform.system() == 'Darwin':
+                raw_cap = cv2.VideoCapture(int(device_id), cv2.CAP_AVFOUNDATION)
+            else:
+                raw_cap = cv2.VideoCapture(int(device_id))
+            try:
+                raw_cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                raw_cap.set(cv2.CAP_PROP_FRAME_WIDTH, settings.width)
+                raw_cap.set(cv2.CAP_PROP_FRAME_HEIGHT, settings.height)
+                if settings.fps > 0:
+                    raw_cap.set(cv2.CAP_PROP_FPS, settings.fps)
+            except Exception as e:
+                logger.warning(f"设置摄像头参数失败: {str(e)}")
+            cap = MjpegPassthroughCapture(raw_cap)
+            source_type = "local"
+        else:
+            # RTSP等需要解封装的流无法直通
+            return None, "external"
+        
+        if not cap.isOpened():
+            cap.release()
+            return None, source_type
+        for _ in range(5):
+            ret, _ = cap.read_jpeg()
+            if ret:
+                return cap, source_type
+            if not cap.isOpened():
+                break
+            time.sleep(0.2)
+        cap.release()
+        return None, source_type
+
+    def _load_device_config(self, device_id: Union[int, str]) -> Optional[Dict]:
+        """按视频源查找摄像头设备的配置，找不到或查询失败时返回None"""
+        key = DeviceStatusWriter.source_key(device_id)
+        try:
+            from ..models import Device
+            from ..models.base import SessionLocal
+            db = SessionLocal()
+            try:
+                for (config,) in db.query(Device.config).filter(Device.type == 'camera'):
+                    source = config.get('source') if config else None
+                    if source and DeviceStatusWriter.source_key(source) == key:
+                        return config
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"查找摄像头 {device_id} 的设备配置出错: {str(e)}")
+        return None
+
+    def update_capture_settings(self, source: Union[int, str], config: Optional[Dict]) -> int:
+        """
+        设备配置变更后更新使用该视频源的摄像头的采集设置，返回更新的摄像头数
+        ROI、旋转和颜色转换从下一帧开始生效，分辨率和帧率在摄像头重新打开时生效
+        """
+        key = DeviceStatusWriter.source_key(source)
+        settings = CaptureSettings.from_config(config)
+        updated = 0
+        with self._cameras_lock:
+            for camera in self._cameras.values():
+                if DeviceStatusWriter.source_key(camera.device_id) == key:
+                    camera.capture_settings = settings
+                    updated += 1
+        return updated
+
     def close_camera(self, camera_id: str) -> bool:
         """
         关闭指定ID的摄像头
@@ -795,18 +2626,19 @@ class CameraService:
         with self._cameras_lock:
             if camera_id not in self._cameras:
                 return False
-                
-            if self._cameras[camera_id].is_streaming:
-                self.stop_stream(camera_id)
-                
-            try:
-                cap = self._cameras[camera_id].cap
-                cap.release()
-                del self._cameras[camera_id]
-                return True
-            except Exception as e:
-                logger.error(f"Error closing camera {camera_id}: {str(e)}")
-                return False
+            
+        try:
+            # 在锁外等待流线程退出，流线程退出时释放cap
+            thread = self._force_cleanup_camera(camera_id)
+            if thread is not None:
+                thread.join(timeout=1.0)
+            self.frame_buffer.clear_frames(camera_id)
+            self._remove_metrics(camera_id)
+            self._clear_snapshot_cache(camera_id)
+            return True
+        except Exception as e:
+            logger.error(f"Error closing camera {camera_id}: {str(e)}")
+            return False
     
     def start_stream(self, camera_id: str) -> bool:
         """
@@ -821,9 +2653,12 @@ class CameraService:
                 return True
                 
             camera.is_streaming = True
+            if self.frame_pool_enabled and camera.frame_pool is None:
+                camera.frame_pool = FramePool(self.frame_pool_size)
             camera.thread = threading.Thread(
                 target=self._stream_thread, 
-                args=(camera_id,),
+                args=(camera_id, camera),
+                name=f"camera-stream-{camera_id}",
                 daemon=True
             )
             camera.thread.start()
@@ -842,10 +2677,12 @@ class CameraService:
                 return True
                 
             camera.is_streaming = False
-            if camera.thread:
-                camera.thread.join(timeout=1.0)
-                camera.thread = None
-            return True
+            thread = camera.thread
+        
+        # 在锁外等待流线程退出，避免阻塞其它摄像头
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout=1.0)
+        return True
     
     def is_frame_valid(self, frame_data: bytes) -> bool:
         """检查帧数据是否有效"""
@@ -887,13 +2724,217 @@ class CameraService:
             logger.error(f"验证帧有效性时出错: {str(e)}")
             return False
             
+    def validate_raw_frame(self, frame: Optional[np.ndarray]) -> bool:
+        """
+        在采集阶段校验原始图像是否有效
+        只在编码前对每帧执行一次，结果随帧一起存入缓存
+        """
+        if frame is None or not isinstance(frame, np.ndarray) or frame.size == 0:
+            logger.warning("采集到的帧为空")
+            return False
+            
+        # 检查图像尺寸是否合理
+        if frame.ndim < 2 or frame.shape[0] < 10 or frame.shape[1] < 10:
+            logger.warning(f"图像尺寸异常小: {frame.shape}")
+            return False
+            
+        # 检查图像是否全黑或全白，抽样计算均值以降低开销
+        mean_value = float(np.mean(frame[::8, ::8]))
+        if mean_value < 5 or mean_value > 250:
+            logger.debug(f"图像可能是全黑或全白 (平均值: {mean_value:.1f})")
+            # 这可能不是致命错误，只是一个提示
+            
+        return True
+
+    def _get_frame_condition(self, key: str) -> Condition:
+        """获取（必要时创建）指定摄像头或处理流的帧通知条件变量"""
+        with self._frame_conditions_lock:
+            condition = self._frame_conditions.get(key)
+            if condition is None:
+                condition = Condition()
+                self._frame_conditions[key] = condition
+            return condition
+
+    def _register_variant(self, key: str, variant: Optional[Tuple[int, int]]) -> None:
+        """登记客户端请求的帧变体，发布新帧时会预先编码"""
+        with self._variant_refs_lock:
+            refs = self._variant_refs.setdefault(key, {})
+            refs[variant] = refs.get(variant, 0) + 1
+
+    def _unregister_variant(self, key: str, variant: Optional[Tuple[int, int]]) -> None:
+        """注销客户端请求的帧变体"""
+        with self._variant_refs_lock:
+            refs = self._variant_refs.get(key)
+            if not refs or variant not in refs:
+                return
+            refs[variant] -= 1
+            if refs[variant] <= 0:
+                del refs[variant]
+            if not refs:
+                del self._variant_refs[key]
+
+    def _get_variants(self, key: str) -> List[Optional[Tuple[int, int]]]:
+        """获取摄像头（或处理流）当前有客户端请求的帧变体"""
+        with self._variant_refs_lock:
+            return list(self._variant_refs.get(key, ()))
+
+    def record_stage(self, key: str, stage: str, seconds: float) -> None:
+        """记录摄像头（或处理流）某一阶段的耗时"""
+        if not self.metrics_enabled:
+            return
+        metrics = self._metrics.get(key)
+        if metrics is None:
+            with self._metrics_lock:
+                metrics = self._metrics.setdefault(key, StageMetrics())
+        metrics.record(stage, seconds)
+
+    def record_delivery(self, key: str, capture_time: float) -> float:
+        """记录帧从采集到开始发送给客户端的延迟，返回发送开始时刻（perf_counter）"""
+        if capture_time:
+            self.record_stage(key, 'delivery', time.time() - capture_time)
+        return time.perf_counter()
+
+    def _remove_metrics(self, key: str) -> None:
+        with self._metrics_lock:
+            self._metrics.pop(key, None)
+
+    def get_metrics(self, camera_id: str, reset: bool = False) -> Dict:
+        """
+        获取摄像头及其各处理流的阶段耗时直方图
+        reset为True时在读取后清空，便于按时间段观察
+        """
+        with self._streams_lock:
+            streams = {
+                stream_key: stream for stream_key, stream in self._processed_streams.items()
+                if stream.camera_id == camera_id
+            }
+        with self._metrics_lock:
+            camera_metrics = self._metrics.get(camera_id)
+            stream_metrics = {key: self._metrics.get(key) for key in streams}
+        
+        result = {
+            'camera_id': camera_id,
+            'enabled': self.metrics_enabled,
+            'camera': camera_metrics.snapshot() if camera_metrics else None,
+            'processed_streams': {}
+        }
+        for key, metrics in stream_metrics.items():
+            stream = streams[key]
+            result['processed_streams'][key] = {
+                'operation_id': stream.operation_id,
+                'operation_type': stream.operation_type,
+                **(metrics.snapshot() if metrics else {'stages': {}})
+            }
+        if reset:
+            for metrics in (camera_metrics, *stream_metrics.values()):
+                if metrics:
+                    metrics.reset()
+        return result
+
+    def _publish_frame(self, camera_id: str, image: Optional[np.ndarray], valid: bool = True,
+                       width: int = 0, height: int = 0, timestamp: Optional[float] = None,
+                       jpeg: Optional[bytes] = None) -> int:
+        """
+        发布摄像头新帧：写入帧缓存并唤醒所有等待该摄像头的客户端，返回帧序号
+        在唤醒客户端前由发布线程编码客户端请求的各个变体，每帧每种变体只编码一次
+        直通采集时发布摄像头自身的JPEG数据，原始尺寸的客户端直接转发，不解码也不重新编码
+        """
+        seq = self.frame_buffer.update_frame(camera_id, image, valid, width, height, timestamp, jpeg)
+        if valid:
+            for variant in self._get_variants(camera_id):
+                self.frame_buffer.get_frame_since(camera_id, seq - 1, variant)
+        self._notify_frame(camera_id)
+        return seq
+
+    def _notify_frame(self, key: str) -> None:
+        """唤醒等待指定摄像头或处理流新帧的同步与异步客户端"""
+        condition = self._get_frame_condition(key)
+        with condition:
+            condition.notify_all()
+        self._async_notifier.notify(key)
+
+    def wait_for_frame(self, camera_id: str, last_seq: int, timeout: float = 1.0,
+                       variant: Optional[Tuple[int, int]] = None) -> Tuple[int, bytes]:
+        """
+        阻塞等待摄像头发布序号大于last_seq的新帧，可指定缩放/质量变体
+        返回(序号, 帧数据)，超时或无新帧时返回(last_seq, b'')
+        """
+        self._wait_for_sequence(camera_id, last_seq, timeout)
+        return self.frame_buffer.get_frame_since(camera_id, last_seq, variant)
+
+    def wait_for_image(self, camera_id: str, last_seq: int, timeout: float = 1.0) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        阻塞等待摄像头发布序号大于last_seq的新帧，返回只读BGR图像而非JPEG数据
+        返回(序号, 图像)，超时或无新帧时返回(last_seq, None)
+        """
+        self._wait_for_sequence(camera_id, last_seq, timeout)
+        return self.frame_buffer.get_image_since(camera_id, last_seq)
+
+    def _wait_for_sequence(self, camera_id: str, last_seq: int, timeout: float) -> None:
+        """在摄像头的条件变量上等待，直到出现序号大于last_seq的帧或超时"""
+        condition = self._get_frame_condition(camera_id)
+        with condition:
+            condition.wait_for(lambda: self.frame_buffer.get_sequence(camera_id) > last_seq, timeout)
+
+    def _publish_processed_frame(self, stream_key: str, frame: bytes, capture_time: Optional[float] = None,
+                                 metadata: Optional[Dict] = None) -> int:
+        """发布处理流新帧：写入处理帧缓存并唤醒该处理流的所有客户端，返回帧序号"""
+        seq = self.frame_buffer.update_processed_frame(stream_key, frame, capture_time, metadata)
+        for variant in self._get_variants(stream_key):
+            if variant is not None:
+                self.frame_buffer.get_processed_frame_since(stream_key, seq - 1, variant)
+        self._notify_frame(stream_key)
+        return seq
+
+    def wait_for_processed_frame(self, stream_key: str, last_seq: int, timeout: float = 1.0,
+                                 variant: Optional[Tuple[int, int]] = None) -> Tuple[int, bytes]:
+        """
+        阻塞等待处理流发布序号大于last_seq的新帧，可指定缩放/质量变体
+        返回(序号, 帧数据)，超时或无新帧时返回(last_seq, b'')
+        """
+        condition = self._get_frame_condition(stream_key)
+        with condition:
+            condition.wait_for(
+                lambda: self.frame_buffer.get_processed_sequence(stream_key) > last_seq, timeout
+            )
+        return self.frame_buffer.get_processed_frame_since(stream_key, last_seq, variant)
+
+    async def wait_for_frame_async(self, camera_id: str, last_seq: int, timeout: float = 1.0,
+                                   variant: Optional[Tuple[int, int]] = None) -> Tuple[int, bytes]:
+        """
+        wait_for_frame的异步版本，在事件循环中等待新帧，不占用线程
+        返回(序号, 帧数据)，超时或无新帧时返回(last_seq, b'')
+        """
+        # 先登记再检查序号，避免检查与登记之间发布的帧被漏掉
+        future = self._async_notifier.get_future(camera_id)
+        if self.frame_buffer.get_sequence(camera_id) <= last_seq:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.frame_buffer.get_frame_since(camera_id, last_seq, variant)
+
+    async def wait_for_processed_frame_async(self, stream_key: str, last_seq: int, timeout: float = 1.0,
+                                             variant: Optional[Tuple[int, int]] = None) -> Tuple[int, bytes]:
+        """
+        wait_for_processed_frame的异步版本，在事件循环中等待处理流新帧，不占用线程
+        返回(序号, 帧数据)，超时或无新帧时返回(last_seq, b'')
+        """
+        future = self._async_notifier.get_future(stream_key)
+        if self.frame_buffer.get_processed_sequence(stream_key) <= last_seq:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.frame_buffer.get_processed_frame_since(stream_key, last_seq, variant)
+
     def get_frame(self, camera_id: str) -> Tuple[bool, bytes]:
         """
         获取摄像头的当前帧
         """
-        # 首先尝试从缓存获取
+        # 首先尝试从缓存获取（有效性已在采集阶段校验）
         success, frame = self.frame_buffer.get_frame(camera_id)
-        if success and self.is_frame_valid(frame):
+        if success:
             return True, frame
 
         # 如果缓存中没有或缓存帧无效，检查摄像头状态
@@ -902,125 +2943,250 @@ class CameraService:
                 return False, b''
             
             camera_info = self._cameras[camera_id]
-            if camera_info.last_error:
+            if camera_info.last_error or not camera_info.is_open():
                 return False, b''
-            
-            # 如果摄像头正常但缓存中没有找到帧，尝试直接读取一帧
-            try:
-                if camera_info.cap.isOpened():
-                    # 直接从摄像头读取一帧
-                    ret, frame = camera_info.cap.read()
-                    if ret and frame is not None:
-                        # 编码为JPEG
-                        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                        jpg_bytes = buffer.tobytes()
-                        
-                        # 验证编码后的帧
-                        if not self.is_frame_valid(jpg_bytes):
-                            logger.warning(f"从摄像头 {camera_id} 直接读取的帧无效")
-                            return False, b''
-                        
-                        # 更新帧缓存
-                        self.frame_buffer.update_frame(camera_id, jpg_bytes)
-                        
-                        logger.info(f"直接从摄像头读取帧作为应急措施: {camera_id}")
-                        return True, jpg_bytes
-            except Exception as e:
-                logger.error(f"直接读取摄像头帧出错: {str(e)}")
+            cap = camera_info.cap
+            thread = camera_info.thread
+        
+        # 流线程在运行时只有它可以读取cap（直接读取会与其并发读取同一个视频源，或读取正在被释放的cap），
+        # 等待它发布下一帧
+        if thread is not None and thread.is_alive():
+            self._wait_for_sequence(camera_id, self.frame_buffer.get_sequence(camera_id), timeout=1.0)
+            return self.frame_buffer.get_frame(camera_id)
+        
+        # 如果摄像头正常但没有流线程，尝试直接读取一帧（在锁外读取，不阻塞其它摄像头）
+        try:
+            ret, frame = cap.read()
+            if ret and frame is not None:
+                # 编码前校验原始图像
+                if not self.validate_raw_frame(frame):
+                    logger.warning(f"从摄像头 {camera_id} 直接读取的帧无效")
+                    return False, b''
+                
+                # 更新帧缓存并通知等待的客户端，JPEG在读取时按需编码
+                self._publish_frame(camera_id, frame, True, frame.shape[1], frame.shape[0])
+                
+                logger.info(f"直接从摄像头读取帧作为应急措施: {camera_id}")
+                return self.frame_buffer.get_frame(camera_id)
+        except Exception as e:
+            logger.error(f"直接读取摄像头帧出错: {str(e)}")
 
         return False, b''
+
+    def get_buffered_frame(self, camera_id: str, seq: Optional[int] = None,
+                           at: Optional[float] = None) -> Optional[Tuple[BufferedFrame, bytes]]:
+        """
+        从帧历史中获取一帧及其JPEG数据
+        seq: 按帧序号获取；at: 获取该时刻（Unix时间戳）的帧；都未指定时返回最新帧
+        没有客户端和处理流时采集线程只按CAMERA_IDLE_RETRIEVE_INTERVAL间隔取帧，历史帧相应变稀疏
+        """
+        if seq is not None:
+            frames = self.frame_buffer.get_frames_since(camera_id, seq - 1)
+            frame = frames[0] if frames and frames[0].seq == seq else None
+        elif at is not None:
+            frame = self.frame_buffer.get_frame_at(camera_id, at)
+        else:
+            frame = self.frame_buffer.get_latest(camera_id)
+        
+        if frame is None or not frame.valid:
+            return None
+        return frame, self.frame_buffer.get_frame_jpeg(camera_id, frame)
+
+    def get_image(self, camera_id: str) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        获取摄像头当前帧的只读BGR图像，供处理和快照直接使用，避免JPEG编解码往返
+        """
+        success, image = self.frame_buffer.get_image(camera_id)
+        if success:
+            return True, image
+        
+        # 缓存中没有可用帧时，复用get_frame的直接读取应急逻辑
+        success, _ = self.get_frame(camera_id)
+        if not success:
+            return False, None
+        return self.frame_buffer.get_image(camera_id)
     
-    def _stream_thread(self, camera_id: str):
+    def _get_pacer(self, settings: Optional[CaptureSettings], pacer: Optional[FramePacer]) -> Optional[FramePacer]:
+        """
+        返回采集线程应使用的节拍器：同步组的摄像头使用组内共享的节拍器（帧率取第一个加入的摄像头），
+        其它摄像头沿用线程自己的节拍器，帧率变化时重新创建；帧率为0时不限速
+        """
+        settings = settings or CaptureSettings()
+        if settings.sync_group:
+            with self._sync_pacers_lock:
+                group_pacer = self._sync_pacers.get(settings.sync_group)
+                if group_pacer is None and settings.fps > 0:
+                    group_pacer = FramePacer(settings.fps)
+                    self._sync_pacers[settings.sync_group] = group_pacer
+                return group_pacer
+        if settings.fps <= 0:
+            return None
+        if pacer is not None and pacer.fps == settings.fps:
+            with self._sync_pacers_lock:
+                # 摄像头离开同步组后不再使用组内的节拍器
+                if pacer not in self._sync_pacers.values():
+                    return pacer
+        return FramePacer(settings.fps)
+
+    def _refresh_streamed_cameras(self) -> None:
+        """处理流增删后重新统计有处理流的摄像头"""
+        with self._streams_lock:
+            self._streamed_cameras = frozenset(stream.camera_id for stream in self._processed_streams.values())
+
+    def _frame_wanted(self, camera_id: str, camera: CameraInfo, last_retrieve: float) -> bool:
+        """
+        判断刚grab的帧是否需要取出（解码）：有原始流客户端或处理流，或距上次取帧超过空闲取帧间隔
+        每次grab都会调用，只读取计数和集合，不获取锁
+        """
+        return (camera.clients > 0 or camera_id in self._streamed_cameras
+                or time.monotonic() - last_retrieve >= self.idle_retrieve_interval)
+
+    def _stream_thread(self, camera_id: str, camera: CameraInfo):
         """
         后台线程，持续从摄像头读取帧
+        camera为启动该线程时的摄像头条目，条目被移除或替换后线程退出
         """
         try:
             logger.info(f"摄像头 {camera_id} 流线程已启动")
             consecutive_errors = 0
             max_consecutive_errors = 5
             last_success_time = time.time()
+            pacer: Optional[FramePacer] = None
+            last_tick = -1
+            last_retrieve = 0.0
             
             while True:
                 # 检查是否应该停止流
                 camera_info = None
                 with self._cameras_lock:
-                    if camera_id not in self._cameras or not self._cameras[camera_id].is_streaming:
+                    if self._cameras.get(camera_id) is not camera or not camera.is_streaming:
                         logger.info(f"摄像头 {camera_id} 流线程停止")
                         break
-                    camera_info = self._cameras[camera_id]
+                    camera_info = camera
                 
                 if camera_info:
                     try:
                         cap = camera_info.cap
+                        if cap is None:
+                            # 正在由其它线程重新连接，等待连接完成
+                            time.sleep(0.1)
+                            continue
                         
-                        if not cap.isOpened():
-                            logger.error(f"摄像头 {camera_id} 已断开连接")
-                            with self._cameras_lock:
-                                if camera_id in self._cameras:
-                                    self._cameras[camera_id].last_error = "摄像头已断开连接"
-                                    self._cameras[camera_id].is_streaming = False
+                        if isinstance(cap, ReplayCapture) and cap.finished:
+                            # 不循环的回放源播放结束，停止流而不是重连
+                            logger.info(f"摄像头 {camera_id} 回放结束，停止流")
+                            camera_info.is_streaming = False
+                            self._set_camera_status(camera_info, 'finished')
                             break
                         
-                        # 尝试多次读取帧以提高可靠性
+                        if not cap.isOpened():
+                            logger.error(f"摄像头 {camera_id} 已断开连接，交给监督器重连")
+                            self._begin_reconnect(camera_id, camera)
+                            continue
+                        
+                        # 按单调时钟节拍等待下一次采集（同步组的摄像头在同一节拍上grab）；
+                        # 回放源（包括子进程中的回放）在grab时按自身帧率节拍，不再额外等待
+                        if camera_info.source_type != 'replay':
+                            pacer = self._get_pacer(camera_info.capture_settings, pacer)
+                            if pacer is not None:
+                                last_tick = pacer.wait(last_tick)
+                        
+                        # 先grab跟上视频源，只有帧需要被消费时才retrieve（解码）；尝试多次以提高可靠性
+                        # 直通采集取出视频源自身的JPEG数据，不解码
+                        passthrough = isinstance(cap, PassthroughCapture)
+                        retrieve = cap.retrieve_jpeg if passthrough else cap.retrieve
+                        # 解码（子进程采集时从共享内存复制）到预分配的缓冲区；直通采集没有像素，不使用缓冲池
+                        pool = None if passthrough else camera_info.frame_pool
                         ret, frame = False, None
+                        skipped = False
                         retry_count = 0
+                        read_started = time.perf_counter()
                         while not ret and retry_count < 3:
-                            ret, frame = cap.read()
+                            ret = cap.grab()
                             if ret:
+                                if not self._frame_wanted(camera_id, camera_info, last_retrieve):
+                                    skipped = True
+                                    break
+                                buffer = pool.acquire() if pool is not None else None
+                                ret, frame = retrieve(buffer) if buffer is not None else retrieve()
+                                if ret and pool is not None and frame is not None:
+                                    pool.record(frame, buffer)
+                                del buffer
+                            if ret or (isinstance(cap, ReplayCapture) and cap.finished):
                                 break
                             retry_count += 1
                             logger.warning(f"摄像头 {camera_id} 读取帧尝试 {retry_count}/3 失败")
                             time.sleep(0.05)  # 短暂等待后重试
                         
+                        if not ret and isinstance(cap, ReplayCapture) and cap.finished:
+                            continue
+                        
+                        if skipped:
+                            # 没有消费者需要这一帧：只grab保持视频源缓冲区为最新，不解码
+                            consecutive_errors = 0
+                            last_success_time = time.time()
+                            camera_info.last_error = None
+                            self._set_camera_status(camera_info, 'online')
+                            continue
+                        
                         if not ret:
                             consecutive_errors += 1
                             current_time = time.time()
+                            if camera_info.status == 'online':
+                                self._set_camera_status(camera_info, 'degraded')
+
                             logger.error(f"摄像头 {camera_id} 无法读取帧 ({consecutive_errors}/{max_consecutive_errors}), 上次成功: {current_time - last_success_time:.1f}秒前")
                             
                             if consecutive_errors >= max_consecutive_errors:
-                                logger.error(f"摄像头 {camera_id} 连续读取帧失败达到上限，尝试重置摄像头")
-                                with self._cameras_lock:
-                                    if camera_id in self._cameras:
-                                        # 尝试重置摄像头
-                                        device_id = self._cameras[camera_id].device_id
-                                        source_type = self._cameras[camera_id].source_type
-                                        self._force_cleanup_camera(camera_id)
-                                        time.sleep(0.5)
-                                        
-                                        # 在macOS上可能需要额外延迟
-                                        if platform.system() == 'Darwin':
-                                            time.sleep(1.0)
-                                            
-                                        # 重新打开摄像头
-                                        if self.open_camera(camera_id, device_id):
-                                            logger.info(f"摄像头 {camera_id} 已重置并重新打开")
-                                            self.start_stream(camera_id)
-                                            return  # 退出当前线程，新的流线程会接管
-                                        else:
-                                            logger.error(f"摄像头 {camera_id} 无法重置")
-                                            break
+                                logger.error(f"摄像头 {camera_id} 连续读取帧失败达到上限，交给监督器重连")
+                                self._begin_reconnect(camera_id, camera)
+                                consecutive_errors = 0
+                                continue
                             
-                            with self._cameras_lock:
-                                if camera_id in self._cameras:
-                                    self._cameras[camera_id].last_error = "摄像头无法读取帧"
+                            camera_info.last_error = "摄像头无法读取帧"
                             time.sleep(0.1)
                             continue
                         
                         # 成功读取帧，重置错误计数
+                        self.record_stage(camera_id, 'capture', time.perf_counter() - read_started)
                         consecutive_errors = 0
                         last_success_time = time.time()
+                        last_retrieve = time.monotonic()
                         
-                        # 编码为JPEG
-                        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                        jpg_bytes = buffer.tobytes()
+                        # 在编码和缓存之前应用设备配置的ROI裁剪、旋转和颜色转换，下游都使用较小的帧
+                        settings = camera_info.capture_settings
+                        if passthrough and settings is not None and settings.has_transform:
+                            # 直通采集期间配置了变换，改为解码后处理
+                            passthrough = False
+                            frame = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+                        
+                        if passthrough:
+                            # 直接发布摄像头的JPEG数据，尺寸从JPEG头部读取，像素在处理流或快照需要时才解码
+                            width, height = jpeg_dimensions(frame) or (0, 0)
+                            frame_valid = width >= 10 and height >= 10
+                            self._publish_frame(camera_id, None, frame_valid, width, height, jpeg=frame)
+                            camera_info.last_error = None
+                            self._set_camera_status(camera_info, 'online')
+                            continue
                         
-                        # 更新帧缓存
-                        self.frame_buffer.update_frame(camera_id, jpg_bytes)
+                        if settings is not None and settings.has_transform:
+                            preprocess_started = time.perf_counter()
+                            frame = settings.apply(frame)
+                            self.record_stage(camera_id, 'preprocess', time.perf_counter() - preprocess_started)
+                        
+                        # 校验一次原始图像，结果随帧存入缓存
+                        frame_valid = self.validate_raw_frame(frame)
+                        height, width = frame.shape[:2] if frame_valid else (0, 0)
+                        
+                        # 发布原始图像，唤醒等待该摄像头的客户端
+                        # JPEG仅在客户端请求时才编码：有原始流客户端时由采集线程在发布时完成编码，避免在事件循环中编码
+                        # 回放源和子进程采集提供帧自身的时间戳
+                        timestamp = cap.get_timestamp() if isinstance(cap, (ReplayCapture, SharedMemoryCapture)) else None
+                        self._publish_frame(camera_id, frame if frame_valid else None, frame_valid, width, height, timestamp)
                         
                         # 更新摄像头状态
-                        with self._cameras_lock:
-                            if camera_id in self._cameras:
-                                self._cameras[camera_id].last_error = None
+                        camera_info.last_error = None
+                        self._set_camera_status(camera_info, 'online')
                                 
                     except Exception as e:
                         consecutive_errors += 1
@@ -1028,133 +3194,184 @@ class CameraService:
                         
                         # 如果连续错误过多，尝试重置
                         if consecutive_errors >= max_consecutive_errors:
-                            with self._cameras_lock:
-                                if camera_id in self._cameras:
-                                    logger.error(f"摄像头 {camera_id} 连续错误过多，重置流")
-                                    device_id = self._cameras[camera_id].device_id
-                                    self._force_cleanup_camera(camera_id)
-                                    time.sleep(0.5)
-                                    if self.open_camera(camera_id, device_id):
-                                        self.start_stream(camera_id)
-                                        return  # 退出当前线程，新的流线程会接管
+                            logger.error(f"摄像头 {camera_id} 连续错误过多，交给监督器重连")
+                            self._begin_reconnect(camera_id, camera)
+                            consecutive_errors = 0
+                            continue
                         
-                        with self._cameras_lock:
-                            if camera_id in self._cameras:
-                                self._cameras[camera_id].last_error = str(e)
+                        self._set_camera_status(camera_info, 'degraded')
+                        camera_info.last_error = str(e)
                         time.sleep(0.1)
                 
-                # 控制帧率 (约30FPS)
-                time.sleep(0.03)
-                
         except Exception as e:
             logger.exception(f"摄像头 {camera_id} 流线程崩溃: {str(e)}")
             with self._cameras_lock:
                 if camera_id in self._cameras:
                     self._cameras[camera_id].is_streaming = False
                     self._cameras[camera_id].last_error = str(e)
+        finally:
+            self._on_stream_thread_exit(camera_id, camera)
 
-    def get_mjpeg_frame_generator(self, camera_id: str):
+    def _on_stream_thread_exit(self, camera_id: str, camera: CameraInfo) -> None:
+        """流线程退出：摄像头已被移除时由流线程释放cap，保证释放不与读取并发"""
+        with self._cameras_lock:
+            if camera.thread is threading.current_thread():
+                camera.thread = None
+            if not camera.closed:
+                return
+            cap, camera.cap = camera.cap, None
+        if cap is not None:
+            try:
+                cap.release()
+            except Exception as e:
+                logger.error(f"释放摄像头 {camera_id} 出错: {str(e)}")
+
+    def _begin_reconnect(self, camera_id: str, camera: CameraInfo) -> None:
+        """
+        由流线程调用：释放失效的连接，将摄像头标记为reconnecting并交给重连监督器
+        摄像头条目（客户端数、处理流）保持不变，流线程在重连完成前等待新的连接
+        """
+        with self._cameras_lock:
+            if self._cameras.get(camera_id) is not camera:
+                return
+            old_cap, camera.cap = camera.cap, None
+            self._set_camera_status(camera, 'reconnecting')
+            camera.last_error = "摄像头连接失效，等待重连"
+        
+        # 流线程是唯一的读取方，在此释放不会与读取并发
+        if old_cap is not None:
+            try:
+                old_cap.release()
+            except Exception as e:
+                logger.error(f"关闭摄像头 {camera_id} 原有连接时出错: {str(e)}")
+        self.supervisor.request_reconnect(camera_id)
+
+    def _count_viewers(self, camera_id: str) -> int:
+        """统计摄像头当前的观看客户端数（原始流与处理流合计），需持有_cameras_lock"""
+        count = self._cameras[camera_id].clients if camera_id in self._cameras else 0
+        with self._streams_lock:
+            for stream in self._processed_streams.values():
+                if stream.camera_id == camera_id:
+                    count += stream.clients
+        return count
+
+    def can_accept_viewer(self, camera_id: str) -> bool:
+        """检查摄像头是否还能接受新的观看客户端"""
+        with self._cameras_lock:
+            return self._count_viewers(camera_id) < self.max_clients_per_camera
+
+    def _add_camera_client(self, camera_id: str) -> Optional[str]:
+        """登记原始流客户端并确保摄像头在流式传输，失败时返回错误信息"""
+        with self._cameras_lock:
+            if camera_id not in self._cameras:
+                return "Camera not found"
+            if self._count_viewers(camera_id) >= self.max_clients_per_camera:
+                logger.warning(f"Camera {camera_id} reached max clients ({self.max_clients_per_camera})")
+                return "Too many viewers for this camera"
+            
+            camera = self._cameras[camera_id]
+            camera.clients += 1
+            
+            # 如果摄像头尚未流式传输，则启动流
+            if not camera.is_streaming and not self.start_stream(camera_id):
+                camera.clients = max(0, camera.clients - 1)
+                return "Failed to start stream"
+        return None
+
+    def _remove_camera_client(self, camera_id: str, client_id: str) -> None:
+        """注销原始流客户端"""
+        try:
+            with self._cameras_lock:
+                if camera_id in self._cameras:
+                    # 确保计数不为负
+                    self._cameras[camera_id].clients = max(0, self._cameras[camera_id].clients - 1)
+                    clients_left = self._cameras[camera_id].clients
+                    logger.info(f"Client {client_id} disconnected from camera {camera_id}, {clients_left} clients left")
+        except Exception as e:
+            logger.error(f"Error when closing camera {camera_id}: {str(e)}")
+
+    def get_mjpeg_frame_generator(self, camera_id: str, width: Optional[int] = None,
+                                  quality: Optional[int] = None):
         """
         返回MJPEG流的帧生成器
+        width/quality: 可选的缩放宽度和JPEG质量，请求相同变体的客户端共享同一份编码结果
         """
         boundary = "frame"
-        client_id = None
+        client_id = f"client_{time.time()}_{id(threading.current_thread())}"
         
         # 增加客户端计数，使用短暂的锁
         try:
-            with self._cameras_lock:
-                if camera_id not in self._cameras:
-                    yield (
-                        f"--{boundary}\r\n"
-                        "Content-Type: image/jpeg\r\n\r\n".encode() + b"Camera not found" + b"\r\n"
-                    )
-                    return
-                
-                # 生成唯一的客户端ID，用于跟踪
-                client_id = f"client_{time.time()}_{id(threading.current_thread())}"
-                logger.info(f"New stream client {client_id} for camera {camera_id}")
-                
-                self._cameras[camera_id].clients += 1
-                
-                # 如果摄像头尚未流式传输，则启动流
-                if not self._cameras[camera_id].is_streaming:
-                    if not self.start_stream(camera_id):
-                        yield (
-                            f"--{boundary}\r\n"
-                            "Content-Type: image/jpeg\r\n\r\n".encode() + b"Failed to start stream" + b"\r\n"
-                        )
-                        return
+            error = self._add_camera_client(camera_id)
         except Exception as e:
             logger.error(f"Error when starting stream for camera {camera_id}: {str(e)}")
+            error = f"Stream error: {str(e)}"
+        if error:
             yield (
                 f"--{boundary}\r\n"
-                "Content-Type: image/jpeg\r\n\r\n".encode() + f"Stream error: {str(e)}".encode() + b"\r\n"
+                "Content-Type: image/jpeg\r\n\r\n".encode() + error.encode() + b"\r\n"
             )
             return
+        logger.info(f"New stream client {client_id} for camera {camera_id}")
+        variant = self.frame_buffer.normalize_variant(width, quality)
+        self._register_variant(camera_id, variant)
         
         # 记录开始时间，用于长时间无响应的情况
         start_time = time.time()
         frame_count = 0
         last_frame_time = time.time()
+        last_seq = 0
         
         try:
-            # 发送流式帧
+            # 发送流式帧：阻塞等待新帧发布，每个新帧只发送一次
             while True:
+                last_seq, frame_data = self.wait_for_frame(camera_id, last_seq, timeout=1.0, variant=variant)
                 current_time = time.time()
                 
-                # 检查是否长时间无结果 (超过30秒无帧)
-                if current_time - start_time > 30.0 and frame_count == 0:
-                    logger.error(f"Camera {camera_id} stream timeout - no frames for 30 seconds")
-                    break
-                
-                # 检查是否超过5秒没有新帧
-                if frame_count > 0 and current_time - last_frame_time > 5.0:
-                    logger.warning(f"Camera {camera_id} stream stalled - no frames for 5 seconds")
-                    # 检查摄像头状态
+                if not frame_data:
+                    # 检查是否长时间无结果 (超过30秒无帧)
+                    if current_time - start_time > 30.0 and frame_count == 0:
+                        logger.error(f"Camera {camera_id} stream timeout - no frames for 30 seconds")
+                        break
+                    
+                    # 检查摄像头是否仍在流式传输，使用短暂的锁
                     with self._cameras_lock:
-                        if camera_id in self._cameras and not self._cameras[camera_id].is_streaming:
-                            logger.info(f"Camera {camera_id} stream was stopped, restarting")
+                        if camera_id not in self._cameras:
+                            logger.info(f"Camera {camera_id} stream stopped for client {client_id}")
+                            break
+                        
+                        # 检查是否超过5秒没有新帧
+                        if (frame_count > 0 and current_time - last_frame_time > 5.0
+                                and not self._cameras[camera_id].is_streaming):
+                            logger.warning(f"Camera {camera_id} stream stalled - no frames for 5 seconds, restarting")
                             self.start_stream(camera_id)
-                
-                # 尝试获取帧，不获取锁
-                success, frame_data = self.get_frame(camera_id)
-                if not success:
+                    
                     # 发送空白帧或错误信息
                     yield (
                         f"--{boundary}\r\n"
                         "Content-Type: image/jpeg\r\n\r\n".encode() + b"No frame available" + b"\r\n"
                     )
-                    time.sleep(0.1)
                     continue
                 
                 # 更新最后帧时间
-                last_frame_time = time.time()
+                last_frame_time = current_time
                 
-                # 构造MJPEG帧并返回
+                # 构造MJPEG帧并返回，X-Sequence/X-Timestamp为帧序号和采集时间，供客户端统计端到端延迟
+                capture_time = self.frame_buffer.get_capture_time(camera_id, last_seq)
+                send_started = self.record_delivery(camera_id, capture_time)
                 yield (
                     f"--{boundary}\r\n"
                     f"Content-Type: image/jpeg\r\n"
+                    f"X-Sequence: {last_seq}\r\n"
+                    f"X-Timestamp: {capture_time:.6f}\r\n"
                     f"Content-Length: {len(frame_data)}\r\n\r\n".encode() + frame_data + b"\r\n"
                 )
+                self.record_stage(camera_id, 'send', time.perf_counter() - send_started)
                 
                 # 更新帧计数
                 frame_count += 1
                 if frame_count % 100 == 0:
                     fps = frame_count / (current_time - start_time)
                     logger.info(f"Camera {camera_id} streaming at {fps:.1f} FPS to client {client_id}")
-                
-                # 检查摄像头是否仍在流式传输，使用短暂的锁
-                is_running = True
-                with self._cameras_lock:
-                    if camera_id not in self._cameras or not self._cameras[camera_id].is_streaming:
-                        is_running = False
-                
-                if not is_running:
-                    logger.info(f"Camera {camera_id} stream stopped for client {client_id}")
-                    break
-                
-                # 控制帧率
-                time.sleep(0.03)  # 约30FPS
         
         except GeneratorExit:
             # 正常关闭流
@@ -1163,21 +3380,82 @@ class CameraService:
             # 流处理出错
             logger.error(f"Error in camera {camera_id} stream for client {client_id}: {str(e)}")
         finally:
-            # 流结束，减少客户端计数，使用短暂的锁
-            try:
-                with self._cameras_lock:
-                    if camera_id in self._cameras:
-                        self._cameras[camera_id].clients -= 1
-                        clients_left = self._cameras[camera_id].clients
-                        
-                        # 如果没有客户端，确保计数不为负
-                        if clients_left < 0:
-                            self._cameras[camera_id].clients = 0
-                            clients_left = 0
-                            
-                        logger.info(f"Client {client_id} disconnected from camera {camera_id}, {clients_left} clients left")
-            except Exception as e:
-                logger.error(f"Error when closing camera {camera_id}: {str(e)}")
+            # 流结束，减少客户端计数，使用短暂的锁
+            self._unregister_variant(camera_id, variant)
+            self._remove_camera_client(camera_id, client_id)
+
+    async def get_async_mjpeg_frame_generator(self, camera_id: str, width: Optional[int] = None,
+                                              quality: Optional[int] = None):
+        """
+        返回MJPEG流的异步帧生成器
+        在事件循环中等待采集线程发布的新帧，每个观看客户端不占用线程池线程
+        width/quality: 可选的缩放宽度和JPEG质量，请求的变体由采集线程在发布帧时编码
+        """
+        boundary = "frame"
+        client_id = f"client_{time.time()}_{id(asyncio.current_task())}"
+        
+        try:
+            # 启动摄像头流可能需要打开设备，放到线程中执行
+            error = await asyncio.to_thread(self._add_camera_client, camera_id)
+        except Exception as e:
+            logger.error(f"Error when starting stream for camera {camera_id}: {str(e)}")
+            error = f"Stream error: {str(e)}"
+        if error:
+            yield self._create_error_frame(boundary, error)
+            return
+        logger.info(f"New async stream client {client_id} for camera {camera_id}")
+        variant = self.frame_buffer.normalize_variant(width, quality)
+        self._register_variant(camera_id, variant)
+        
+        start_time = time.time()
+        frame_count = 0
+        last_frame_time = time.time()
+        last_seq = 0
+        
+        try:
+            while True:
+                last_seq, frame_data = await self.wait_for_frame_async(camera_id, last_seq, timeout=1.0, variant=variant)
+                current_time = time.time()
+                
+                if not frame_data:
+                    # 检查是否长时间无结果 (超过30秒无帧)
+                    if current_time - start_time > 30.0 and frame_count == 0:
+                        logger.error(f"Camera {camera_id} stream timeout - no frames for 30 seconds")
+                        break
+                    
+                    # 检查是否超过5秒没有新帧，重启摄像头流可能阻塞，放到线程中执行
+                    stalled = frame_count > 0 and current_time - last_frame_time > 5.0
+                    if not await asyncio.to_thread(self._check_camera_source, camera_id, stalled):
+                        logger.info(f"Camera {camera_id} stream stopped for client {client_id}")
+                        break
+                    
+                    yield (
+                        f"--{boundary}\r\n"
+                        "Content-Type: image/jpeg\r\n\r\n".encode() + b"No frame available" + b"\r\n"
+                    )
+                    continue
+                
+                last_frame_time = current_time
+                capture_time = self.frame_buffer.get_capture_time(camera_id, last_seq)
+                send_started = self.record_delivery(camera_id, capture_time)
+                yield (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: image/jpeg\r\n"
+                    f"X-Sequence: {last_seq}\r\n"
+                    f"X-Timestamp: {capture_time:.6f}\r\n"
+                    f"Content-Length: {len(frame_data)}\r\n\r\n".encode() + frame_data + b"\r\n"
+                )
+                self.record_stage(camera_id, 'send', time.perf_counter() - send_started)
+                
+                frame_count += 1
+                if frame_count % 100 == 0:
+                    fps = frame_count / (current_time - start_time)
+                    logger.info(f"Camera {camera_id} streaming at {fps:.1f} FPS to async client {client_id}")
+        except Exception as e:
+            logger.error(f"Error in camera {camera_id} stream for client {client_id}: {str(e)}")
+        finally:
+            self._unregister_variant(camera_id, variant)
+            self._remove_camera_client(camera_id, client_id)
 
     def get_camera_status(self, camera_id: str) -> dict:
         """获取摄像头状态信息"""
@@ -1190,83 +3468,73 @@ class CameraService:
             
             camera = self._cameras[camera_id]
             
+            if camera.is_connecting():
+                status = {
+                    "status": "connecting",
+                    "state": camera.status,
+                    "message": camera.last_error or "Camera connecting"
+                }
+                reconnect = self.supervisor.get_stats(camera_id)
+                if reconnect:
+                    status["reconnect"] = reconnect
+                return status
+            
             if camera.last_error:
                 return {
                     "status": "error",
+                    "state": camera.status,
                     "message": camera.last_error
                 }
             
             if camera.is_streaming:
-                return {
+                status = {
                     "status": "online",
+                    "state": camera.status,
                     "message": "Camera streaming",
                     "clients": camera.clients
                 }
+                reconnect = self.supervisor.get_stats(camera_id)
+                if reconnect:
+                    status["reconnect"] = reconnect
+                if camera.capture_settings is not None:
+                    status["capture_settings"] = camera.capture_settings.to_dict()
+                if camera.frame_pool is not None:
+                    status["frame_pool"] = camera.frame_pool.get_stats()
+                variants = self._get_variants(camera_id)
+                if variants:
+                    # 当前客户端请求的帧变体，宽度为0表示原始宽度
+                    status["variants"] = [
+                        {"width": v[0], "quality": v[1]} if v else
+                        {"width": 0, "quality": self.frame_buffer.jpeg_quality}
+                        for v in variants
+                    ]
+                frame_info = self.frame_buffer.get_frame_info(camera_id)
+                processed_streams = self.get_processed_stream_stats(camera_id)
+                if processed_streams:
+                    status["processed_streams"] = processed_streams
+                if frame_info:
+                    status["frame"] = {
+                        "seq": frame_info['seq'],
+                        "valid": frame_info['valid'],
+                        "width": frame_info['width'],
+                        "height": frame_info['height'],
+                        "age": time.time() - frame_info['timestamp']
+                    }
+                return status
             
             return {
                 "status": "online",
                 "message": "Camera connected but not streaming"
             }
 
-    def _monitor_camera_status(self):
-        """监控所有摄像头的状态并更新数据库"""
-        while True:
-            try:
-                # 获取数据库会话
-                from ..models.base import SessionLocal
-                from .settings import SettingsService
-                
-                db = SessionLocal()
-                settings_service = SettingsService(db)
-                
-                # 获取所有摄像头设备
-                camera_devices = settings_service.get_devices(type="camera")
-                device_map = {}
-                
-                # 创建设备ID到设备的映射
-                for device in camera_devices:
-                    if device.config and 'source' in device.config:
-                        source = device.config['source']
-                        if source.startswith('device:'):
-                            device_id = source.split(':')[1]
-                            camera_id = f"camera_{device_id}"
-                            device_map[camera_id] = device
-                
-                # 复制摄像头状态信息，减少锁的持有时间
-                camera_statuses = {}
-                try:
-                    with self._cameras_lock:
-                        for camera_id, camera in self._cameras.items():
-                            # 仅复制我们需要的信息
-                            camera_statuses[camera_id] = {
-                                'is_opened': camera.cap.isOpened(),
-                                'last_error': camera.last_error
-                            }
-                except Exception as e:
-                    logger.error(f"获取摄像头状态时发生错误: {str(e)}")
-                    time.sleep(5)  # 出错时短暂等待后继续
-                    continue
-                
-                # 锁外处理状态更新
-                for camera_id, status_info in camera_statuses.items():
-                    if camera_id in device_map:
-                        device = device_map[camera_id]
-                        status = "online" if status_info['is_opened'] and not status_info['last_error'] else "error"
-                        
-                        # 如果状态与设备状态不同，更新设备状态
-                        if device.status != status:
-                            try:
-                                settings_service.update_device_status(device.id, status)
-                                logger.info(f"更新设备 {device.name} 状态为 {status}")
-                            except Exception as e:
-                                logger.error(f"更新设备 {device.name} 状态时出错: {str(e)}")
-                
-                db.close()
-            except Exception as e:
-                logger.error(f"监控摄像头状态出错: {str(e)}")
-            
-            # 每10秒检查一次
-            time.sleep(10)
+    def get_processed_stream_stats(self, camera_id: str) -> Dict[str, Dict]:
+        """获取摄像头所有处理流的统计信息（帧率、丢帧数、采集到输出延迟等）"""
+        with self._streams_lock:
+            return {
+                stream_key: stream.get_stats()
+                for stream_key, stream in self._processed_streams.items()
+                if stream.camera_id == camera_id
+            }
 
     def get_frame_processor(self, db: Session) -> 'FrameProcessor':
         """获取或创建帧处理器实例"""
@@ -1276,8 +3544,18 @@ class CameraService:
                 self._frame_processors[db_id] = FrameProcessor(db)
             return self._frame_processors[db_id]
 
-    def apply_operation_to_frame(self, frame: bytes, operation_id: int, operation_type: str, db: Session) -> bytes:
-        """对单帧应用操作并返回处理后的帧"""
+    def _to_jpeg(self, frame: Union[bytes, np.ndarray]) -> bytes:
+        """将图像按原始帧质量编码为JPEG，已是JPEG数据时原样返回"""
+        if isinstance(frame, np.ndarray):
+            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.frame_buffer.jpeg_quality])
+            return buffer.tobytes()
+        return frame
+
+    def apply_operation_to_frame(self, frame: Union[bytes, np.ndarray], operation_id: int, operation_type: str, db: Session) -> bytes:
+        """
+        对单帧应用操作并返回处理后的JPEG帧
+        frame 可以是JPEG数据，也可以是get_image返回的BGR图像（省去一次解码）
+        """
         try:
             # 验证输入
             if frame is None or len(frame) == 0:
@@ -1287,23 +3565,23 @@ class CameraService:
             # 验证操作类型
             if operation_type not in ['operation', 'pipeline']:
                 logger.error(f"无效的操作类型: {operation_type}")
-                return frame
+                return self._to_jpeg(frame)
                 
             # 验证操作ID
             if not isinstance(operation_id, int) or operation_id <= 0:
                 logger.error(f"无效的操作ID: {operation_id}")
-                return frame
+                return self._to_jpeg(frame)
             
             # 获取框架处理器
             processor = self.get_frame_processor(db)
             if processor is None:
                 logger.error(f"无法获取帧处理器")
-                return frame
+                return self._to_jpeg(frame)
                 
             # 更新最后使用时间
             processor.last_used = time.time()
             
-            logger.info(f"应用{operation_type} (ID: {operation_id})到帧 ({len(frame)}字节)")
+            logger.info(f"应用{operation_type} (ID: {operation_id})到帧")
                 
             # 处理帧
             try:
@@ -1312,23 +3590,72 @@ class CameraService:
                 # 验证结果
                 if processed_frame is None or len(processed_frame) == 0:
                     logger.warning(f"处理后的帧无效，返回原始帧")
-                    return frame
+                    return self._to_jpeg(frame)
                     
                 logger.info(f"成功处理帧: {len(processed_frame)}字节")
                 return processed_frame
             except Exception as e:
                 logger.error(f"处理帧时出错: {str(e)}")
-                return frame
+                return self._to_jpeg(frame)
         except Exception as e:
             logger.exception(f"应用操作到帧时发生错误: {str(e)}")
-            return frame
+            return self._to_jpeg(frame)
+
+    def get_processed_snapshot(self, camera_id: str, operation_id: int, operation_type: str,
+                               db: Session) -> Tuple[bytes, Dict]:
+        """
+        获取处理后的快照，返回(JPEG, 元数据)，失败时JPEG为b''
+        同一操作的处理流正在运行且有未过期的处理帧时直接返回该帧，不再处理；
+        否则对最新原始帧处理一次，并按源帧序号缓存结果，源帧未更新时的重复请求直接复用
+        元数据: source（stream/cache/processed）、seq（源帧序号，stream时为处理帧序号）、capture_time（源帧采集时间）
+        """
+        stream_key = self.get_processed_stream_key(camera_id, operation_id, operation_type)
+        processed = self.frame_buffer.get_latest_processed(stream_key)
+        if processed is not None:
+            return processed.frame, {
+                'source': 'stream',
+                'seq': processed.seq,
+                'capture_time': processed.capture_time
+            }
+        
+        _, frame = self.frame_buffer.get_latest_since(camera_id, 0)
+        if frame is None:
+            # 缓存中没有可用帧时，复用get_image的直接读取应急逻辑
+            self.get_image(camera_id)
+            _, frame = self.frame_buffer.get_latest_since(camera_id, 0)
+            if frame is None:
+                return b'', {}
+        
+        with self._snapshot_cache_lock:
+            cached = self._snapshot_cache.get(stream_key)
+        if cached is not None and cached[1] == frame.seq:
+            return cached[3], {'source': 'cache', 'seq': frame.seq, 'capture_time': cached[2]}
+        
+        decode_scale = self.get_frame_processor(db).get_decode_scale(operation_id, operation_type)
+        image = self.frame_buffer.get_scaled_image(camera_id, frame, decode_scale)
+        processed_frame = self.apply_operation_to_frame(image, operation_id, operation_type, db)
+        if not processed_frame:
+            return b'', {}
+        with self._snapshot_cache_lock:
+            self._snapshot_cache[stream_key] = (camera_id, frame.seq, frame.timestamp, processed_frame)
+        return processed_frame, {'source': 'processed', 'seq': frame.seq, 'capture_time': frame.timestamp}
+
+    def _clear_snapshot_cache(self, camera_id: str) -> None:
+        with self._snapshot_cache_lock:
+            for key in [k for k, v in self._snapshot_cache.items() if v[0] == camera_id]:
+                del self._snapshot_cache[key]
 
     def get_processed_stream_key(self, camera_id: str, operation_id: int, operation_type: str) -> str:
         """生成处理流的唯一键值"""
         return f"{camera_id}_{operation_type}_{operation_id}"
     
-    def start_processed_stream(self, camera_id: str, operation_id: int, operation_type: str, db: Session) -> bool:
-        """启动处理后的摄像头流"""
+    def start_processed_stream(self, camera_id: str, operation_id: int, operation_type: str, db: Session,
+                               backpressure: str = 'latest', queue_size: int = 2) -> bool:
+        """
+        启动处理后的摄像头流
+        backpressure: 背压策略，'latest'(默认，只处理最新帧) 或 'queue'(按顺序处理，最多积压queue_size帧)
+        已存在的处理流会被重用，其背压策略保持不变
+        """
         stream_key = self.get_processed_stream_key(camera_id, operation_id, operation_type)
         logger.info(f"尝试启动处理流: {stream_key}")
         
@@ -1342,11 +3669,16 @@ class CameraService:
             if not isinstance(operation_id, int) or operation_id <= 0:
                 logger.error(f"无效的操作ID: {operation_id}")
                 return False
+            
+            # 检查背压策略是否有效
+            if backpressure not in ProcessedStream.BACKPRESSURE_POLICIES or queue_size < 1:
+                logger.error(f"无效的背压策略: {backpressure}, 队列长度: {queue_size}")
+                return False
                 
             # 先检查并清理可能存在的无效流
             if stream_key in self._processed_streams:
                 old_stream = self._processed_streams[stream_key]
-                if not old_stream.is_streaming or old_stream.clients <= 0:
+                if not old_stream.is_streaming or old_stream.idle:
                     logger.info(f"清理已存在的无效流: {stream_key}")
                     self._force_cleanup_stream(stream_key)
                 else:
@@ -1359,7 +3691,7 @@ class CameraService:
                 return False
 
             camera = self._cameras[camera_id]
-            if not camera.cap.isOpened():
+            if not camera.is_alive():
                 logger.error(f"摄像头 {camera_id} 未正确打开")
                 self._force_cleanup_camera(camera_id)
                 return False
@@ -1373,6 +3705,7 @@ class CameraService:
 
             # 创建新的处理流
             try:
+                decode_scale = 1
                 # 检查操作存在性
                 if operation_type == "operation":
                     # 验证操作是否存在
@@ -1382,6 +3715,7 @@ class CameraService:
                     if not operation:
                         logger.error(f"未找到指定的操作 (ID: {operation_id})")
                         return False
+                    decode_scale = FrameProcessor.get_input_decode_scale(operation.input_params)
                 elif operation_type == "pipeline":
                     # 验证流水线是否存在
                     from .pipeline import PipelineService
@@ -1390,15 +3724,53 @@ class CameraService:
                     if not pipeline:
                         logger.error(f"未找到指定的流水线 (ID: {operation_id})")
                         return False
+                    decode_scale = FrameProcessor.get_input_decode_scale(pipeline.input_params)
                 
-                # 创建处理流实例
-                self._processed_streams[stream_key] = ProcessedStream(camera_id, operation_id, operation_type, db)
+                # 创建处理流实例，处理流在后台线程中使用独占的数据库会话
+                from ..models.base import SessionLocal
+                change_gate = (ChangeGate(self.change_gate_threshold, self.change_gate_max_staleness)
+                               if self.change_gate_enabled else None)
+                stream = ProcessedStream(camera_id, operation_id, operation_type, SessionLocal(),
+                                         backpressure=backpressure, queue_size=queue_size,
+                                         change_gate=change_gate, decode_scale=decode_scale)
+                # 重新创建的处理流继续承担已有的巡检任务
+                job = self._inspection_jobs.get(stream_key)
+                if job is not None:
+                    self._bind_inspection_job(stream, job)
+                self._processed_streams[stream_key] = stream
+                self._refresh_streamed_cameras()
+                
+                # 启动处理工作线程，每帧只处理一次并发布给所有客户端
+                stream.thread = threading.Thread(
+                    target=self._processed_stream_thread,
+                    args=(stream_key, stream),
+                    name=f"processed-stream-{stream_key}",
+                    daemon=True
+                )
+                stream.thread.start()
                 logger.info(f"成功启动处理流: {stream_key}")
                 return True
             except Exception as e:
                 logger.error(f"创建处理流失败: {str(e)}")
                 return False
 
+    def get_or_create_processed_stream(self, camera_id: str, operation_id: int, operation_type: str, db: Session,
+                                       backpressure: str = 'latest',
+                                       queue_size: int = 2) -> Optional[ProcessedStream]:
+        """
+        获取处理流，不存在时启动，启动失败时返回None
+        已存在的处理流（即使暂时没有客户端）直接返回，其背压策略保持不变
+        """
+        stream_key = self.get_processed_stream_key(camera_id, operation_id, operation_type)
+        with self._streams_lock:
+            stream = self._processed_streams.get(stream_key)
+            if stream is None:
+                if not self.start_processed_stream(camera_id, operation_id, operation_type, db,
+                                                   backpressure, queue_size):
+                    return None
+                stream = self._processed_streams.get(stream_key)
+            return stream
+
     def stop_processed_stream(self, camera_id: str, operation_id: int, operation_type: str) -> bool:
         """停止处理后的摄像头流"""
         stream_key = self.get_processed_stream_key(camera_id, operation_id, operation_type)
@@ -1410,6 +3782,10 @@ class CameraService:
                 logger.warning(f"找不到要停止的处理流: {stream_key}")
                 return False
             
+            if self._processed_streams[stream_key].job is not None:
+                logger.warning(f"处理流 {stream_key} 属于巡检任务，需通过停止巡检任务来停止")
+                return False
+            
             try:
                 # 获取并清理现有流
                 stream = self._processed_streams[stream_key]
@@ -1425,6 +3801,7 @@ class CameraService:
                 
                 # 删除处理流
                 del self._processed_streams[stream_key]
+                self._refresh_streamed_cameras()
                 logger.info(f"已停止处理流: {stream_key}")
                 return True
             except Exception as e:
@@ -1439,174 +3816,578 @@ class CameraService:
                     logger.error(f"强制清理处理流 {stream_key} 时出错: {str(cleanup_err)}")
                     return False
 
-    def get_processed_mjpeg_frame_generator(self, camera_id: str, operation_id: int, operation_type: str, db: Session):
-        """返回处理后MJPEG流的帧生成器"""
-        boundary = "processedframe"
-        stream_key = self.get_processed_stream_key(camera_id, operation_id, operation_type)
-        client_id = f"client_{time.time()}_{id(threading.current_thread())}"
-        processed_stream = None
-        frame_processor = self.get_frame_processor(db)
-        frame_interval = 0.03
-        last_stats_time = time.time()
-        error_count = 0
-        max_errors = 5
+    def stop_processed_streams(self, camera_id: str) -> int:
+        """停止摄像头的所有处理流（巡检任务的处理流除外），返回停止的数量"""
+        with self._streams_lock:
+            streams_to_stop = [(stream.operation_id, stream.operation_type)
+                               for stream in self._processed_streams.values()
+                               if stream.camera_id == camera_id and stream.job is None]
+        
+        stopped = 0
+        for operation_id, operation_type in streams_to_stop:
+            if self.stop_processed_stream(camera_id, operation_id, operation_type):
+                stopped += 1
+        return stopped
+
+    def _bind_inspection_job(self, stream: ProcessedStream, job: Optional[InspectionJob]) -> None:
+        """将巡检任务绑定到处理流（job为None时解绑），并按触发策略设置画面变化门控"""
+        stream.job = job
+        if (job is not None and job.trigger == 'change') or self.change_gate_enabled:
+            if stream.change_gate is None:
+                stream.change_gate = ChangeGate(self.change_gate_threshold, self.change_gate_max_staleness)
+        else:
+            stream.change_gate = None
 
+    def _attach_inspection_job(self, job: InspectionJob) -> bool:
+        """
+        确保巡检任务的处理流在运行并绑定该任务，处理流不存在或已停止时重新启动
+        重新启动涉及数据库查询和摄像头流启动，调用方不能持有摄像头或处理流注册表锁
+        """
+        with self._streams_lock:
+            stream = self._processed_streams.get(job.job_id)
+            if stream is not None and stream.is_streaming:
+                self._bind_inspection_job(stream, job)
+                return True
+        # 新建的处理流在start_processed_stream中绑定任务（任务仍登记时）
+        from ..models.base import SessionLocal
+        db = SessionLocal()
         try:
-            with self._cameras_lock:
-                # 检查摄像头状态
-                if camera_id not in self._cameras:
-                    yield self._create_error_frame(boundary, "Camera not found")
-                    return
-
-                camera = self._cameras[camera_id]
-                if not camera.cap.isOpened():
-                    logger.error(f"Camera {camera_id} is not properly opened")
-                    self._force_cleanup_camera(camera_id)
-                    yield self._create_error_frame(boundary, "Camera is not properly opened")
-                    return
-
-                # 启动或获取处理流
-                if stream_key not in self._processed_streams:
-                    if not self.start_processed_stream(camera_id, operation_id, operation_type, db):
-                        yield self._create_error_frame(boundary, "Failed to start processed stream")
-                        return
-                
-                processed_stream = self._processed_streams[stream_key]
-                processed_stream.increment_clients()
-                logger.info(f"New processed stream client {client_id} for camera {camera_id}")
+            return self.start_processed_stream(job.camera_id, job.operation_id, job.operation_type, db,
+                                               job.backpressure, job.queue_size)
+        finally:
+            db.close()
 
-        except Exception as e:
-            logger.error(f"Error initializing processed stream: {str(e)}")
-            yield self._create_error_frame(boundary, f"Stream initialization error: {str(e)}")
-            return
+    def start_inspection_job(self, camera_id: str, operation_id: int, operation_type: str,
+                             trigger: str = 'continuous', interval: float = 1.0,
+                             backpressure: str = 'latest', queue_size: int = 2,
+                             device_id: Optional[int] = None) -> Tuple[Optional[InspectionJob], Optional[str]]:
+        """
+        启动巡检任务，任务已存在时更新其触发策略，失败时返回错误信息
+        已有观看客户端的同键处理流直接绑定为任务的处理流，其背压策略保持不变
+        """
+        if trigger not in InspectionJob.TRIGGERS:
+            return None, f"Invalid trigger: {trigger}"
+        if trigger == 'interval' and interval <= 0:
+            return None, f"Invalid interval: {interval}"
+        job_id = self.get_processed_stream_key(camera_id, operation_id, operation_type)
+        with self._cameras_lock:
+            if camera_id not in self._cameras:
+                return None, "Camera not found"
+        
+        with self._streams_lock:
+            job = self._inspection_jobs.get(job_id)
+            created = job is None
+            if created:
+                job = InspectionJob(job_id, camera_id, operation_id, operation_type, trigger, interval,
+                                    backpressure, queue_size, self.inspection_max_results, device_id)
+                self._inspection_jobs[job_id] = job
+            else:
+                job.trigger, job.interval = trigger, interval
+                if device_id is not None:
+                    job.device_id = device_id
+        
+        # 在锁外启动或绑定处理流
+        if not self._attach_inspection_job(job):
+            if created:
+                with self._streams_lock:
+                    if self._inspection_jobs.get(job_id) is job:
+                        del self._inspection_jobs[job_id]
+            return None, "Failed to start processed stream"
+        logger.info(f"巡检任务 {job_id} 已{'启动' if created else '更新'}，触发策略: {trigger}")
+        return job, None
+
+    def stop_inspection_job(self, job_id: str) -> bool:
+        """停止巡检任务，其处理流仍有观看客户端时继续为客户端运行"""
+        with self._streams_lock:
+            job = self._inspection_jobs.pop(job_id, None)
+            if job is None:
+                return False
+            job.stop()
+            stream = self._processed_streams.get(job_id)
+            if stream is not None and stream.job is job:
+                self._bind_inspection_job(stream, None)
+                if stream.idle:
+                    self._force_cleanup_stream(job_id)
+            logger.info(f"巡检任务 {job_id} 已停止，共处理 {job.processed} 帧")
+            return True
+
+    def get_inspection_job(self, job_id: str) -> Optional[InspectionJob]:
+        with self._streams_lock:
+            return self._inspection_jobs.get(job_id)
+
+    def get_inspection_jobs(self, camera_id: Optional[str] = None) -> List[Dict]:
+        """获取巡检任务的状态，running表示其处理流正在运行"""
+        with self._streams_lock:
+            jobs = []
+            for job_id, job in self._inspection_jobs.items():
+                if camera_id is not None and job.camera_id != camera_id:
+                    continue
+                stream = self._processed_streams.get(job_id)
+                stats = job.get_stats()
+                stats['running'] = stream is not None and stream.is_streaming
+                stats['viewers'] = stream.clients if stream is not None else 0
+                jobs.append(stats)
+            return jobs
+
+    def get_camera_device_id(self, camera_id: str, db: Session) -> Optional[int]:
+        """按视频源查找摄像头对应的设备ID，没有匹配的设备时返回None"""
+        with self._cameras_lock:
+            camera = self._cameras.get(camera_id)
+            if camera is None:
+                return None
+            key = DeviceStatusWriter.source_key(camera.device_id)
+        from ..models import Device
+        for device_id, config in db.query(Device.id, Device.config).filter(Device.type == 'camera'):
+            source = config.get('source') if config else None
+            if source and DeviceStatusWriter.source_key(source) == key:
+                return device_id
+        return None
+
+    def start_device_inspections(self, camera_id: str, config: Optional[Dict],
+                                 device_id: Optional[int] = None) -> int:
+        """
+        按设备配置的inspection项启动巡检任务，返回启动的任务数
+        inspection可以是单个任务或任务列表，每项包含operation_id，可选operation_type、trigger、interval、
+        backpressure、queue_size，enabled为false时跳过
+        """
+        inspections = (config or {}).get('inspection')
+        if isinstance(inspections, dict):
+            inspections = [inspections]
+        if not isinstance(inspections, list):
+            return 0
+        
+        started = 0
+        for item in inspections:
+            if not isinstance(item, dict) or not item.get('enabled', True):
+                continue
+            try:
+                job, error = self.start_inspection_job(
+                    camera_id,
+                    int(item['operation_id']),
+                    item.get('operation_type', 'operation'),
+                    item.get('trigger', 'continuous'),
+                    float(item.get('interval', 1.0)),
+                    item.get('backpressure', 'latest'),
+                    int(item.get('queue_size', 2)),
+                    device_id
+                )
+            except (KeyError, TypeError, ValueError):
+                logger.error(f"摄像头 {camera_id} 的巡检配置无效: {item}")
+                continue
+            if error:
+                logger.error(f"摄像头 {camera_id} 的巡检任务启动失败: {error}")
+            else:
+                started += 1
+        return started
 
+    def _select_stream_frame(self, stream: ProcessedStream, last_seq: int) -> Tuple[int, Optional[BufferedFrame], int]:
+        """
+        按处理流的背压策略选择下一帧要处理的源帧
+        返回(新的last_seq, 选中的帧或None, 被跳过的源帧数)
+        """
+        camera_id = stream.camera_id
+        if stream.backpressure == 'queue':
+            # 按顺序处理，积压超过queue_size时丢弃最旧的帧；已被环形缓冲区覆盖的帧同样计为丢弃
+            pending = self.frame_buffer.get_frames_since(camera_id, last_seq)
+            if len(pending) > stream.queue_size:
+                pending = pending[-stream.queue_size:]
+            for frame in pending:
+                if frame.valid and (frame.image is not None or frame.frame):
+                    return frame.seq, frame, frame.seq - last_seq - 1
+            latest_seq = pending[-1].seq if pending else last_seq
+            return latest_seq, None, 0
+        
+        # latest：只取最新帧，处理期间到达的其它帧全部跳过
+        seq, frame = self.frame_buffer.get_latest_since(camera_id, last_seq)
+        if frame is None or (frame.image is None and not frame.frame):
+            return seq, None, 0
+        return seq, frame, seq - last_seq - 1
+
+    def _processed_stream_thread(self, stream_key: str, stream: ProcessedStream):
+        """
+        处理流后台工作线程
+        等待摄像头新帧，每帧只处理一次，并将结果发布给该处理流的所有客户端
+        """
+        camera_id = stream.camera_id
+        frame_processor = FrameProcessor(stream.db_session)
+        last_seq = 0
+        last_stats_time = time.time()
+        
         try:
-            last_process_time = 0
-            while processed_stream and processed_stream.is_streaming:
-                try:
-                    current_time = time.time()
-                    
-                    # 检查摄像头状态
+            logger.info(f"处理流 {stream_key} 工作线程已启动，背压策略: {stream.backpressure}")
+            while not stream.stopped:
+                self._wait_for_sequence(camera_id, last_seq, timeout=1.0)
+                if stream.stopped:
+                    break
+                
+                # 按背压策略选择下一帧，并记录被跳过的帧
+                new_seq, frame, dropped = self._select_stream_frame(stream, last_seq)
+                if last_seq > 0:
+                    stream.record_dropped(dropped)
+                last_seq = new_seq
+                
+                if frame is None:
+                    # 摄像头被关闭时停止处理流
                     with self._cameras_lock:
-                        if camera_id not in self._cameras or not self._cameras[camera_id].cap.isOpened():
-                            logger.error(f"Camera {camera_id} became invalid")
+                        if camera_id not in self._cameras:
+                            logger.warning(f"处理流 {stream_key} 的摄像头 {camera_id} 已关闭，停止处理")
+                            stream.last_error = "摄像头已关闭"
                             break
-
-                    # 获取和处理帧
-                    success, frame_data = self.get_frame(camera_id)
-                    if not success or not frame_data:
-                        error_count += 1
-                        logger.warning(f"摄像头 {camera_id} 获取帧失败 ({error_count}/{max_errors})")
-                        
-                        # 尝试等待一会儿再重试
-                        if error_count < max_errors:
-                            # 如果摄像头未流式传输，尝试重启
-                            with self._cameras_lock:
-                                if camera_id in self._cameras and not self._cameras[camera_id].is_streaming:
-                                    logger.info(f"摄像头 {camera_id} 流停止，尝试重启")
-                                    self.start_stream(camera_id)
-                            
-                            # 生成错误帧
-                            yield self._create_error_frame(boundary, f"等待摄像头帧... ({error_count}/{max_errors})")
-                            time.sleep(0.2)  # 稍长的等待时间
-                            continue
-                        else:
-                            logger.error(f"摄像头 {camera_id} 获取帧失败次数过多")
-                            
-                            # 如果太多错误，创建一个特殊的错误图像
-                            err_msg = "摄像头连续获取帧失败，请检查摄像头连接和权限"
-                            yield self._create_error_frame(boundary, err_msg)
-                            
-                            # 尝试重置摄像头
-                            with self._cameras_lock:
-                                if camera_id in self._cameras:
-                                    device_id = self._cameras[camera_id].device_id
-                                    if not self._cameras[camera_id].is_streaming:
-                                        logger.info(f"尝试重新启动摄像头 {camera_id} 流")
-                                        self.start_stream(camera_id)
-                                    
-                            # 重置错误计数并继续尝试
-                            error_count = 0
-                            time.sleep(1.0)  # 较长时间等待
+                    continue
+                
+                job = stream.job
+                if job is not None and not job.should_trigger(time.monotonic()):
+                    continue
+                
+                process_start = time.time()
+                self.record_stage(stream_key, 'queue', process_start - frame.timestamp)
+                
+                # 按操作声明的比例取得输入图像：缩小已解码的帧，直通采集的帧直接缩小解码，同一帧各处理流共享
+                image = self.frame_buffer.get_scaled_image(camera_id, frame, stream.decode_scale)
+                if image is None:
+                    continue
+                
+                # 画面未变化时复用上一次的处理结果，不运行操作/流水线
+                change_gate = stream.change_gate
+                if change_gate is not None:
+                    gate_start = time.perf_counter()
+                    should_process = change_gate.should_process(
+                        image, process_start, force=stream.last_frame is None
+                    )
+                    self.record_stage(stream_key, 'gate', time.perf_counter() - gate_start)
+                    if not should_process:
+                        if self.frame_buffer.repeat_processed_frame(stream_key, frame.timestamp):
+                            lag_frames = self.frame_buffer.get_sequence(camera_id) - frame.seq
+                            stream.update_frame(stream.last_frame, frame.timestamp,
+                                                time.time() - process_start, lag_frames)
+                            self._notify_frame(stream_key)
                             continue
+                        # 处理帧缓存已被清理，没有可复用的结果，照常处理并作为新的比较基准
+                        change_gate.reset()
+                
+                # 直接处理缓存中的图像，无需解码；失败时回退到原始帧
+                timings = {} if self.metrics_enabled else None
+                outputs = {}
+                try:
+                    processed_frame = frame_processor.process_frame(
+                        image,
+                        stream.operation_id,
+                        stream.operation_type,
+                        timings,
+                        outputs
+                    )
+                    if not processed_frame:
+                        logger.warning(f"处理后的帧无效，使用原始帧作为替代")
+                        processed_frame = self.frame_buffer.get_frame_jpeg(camera_id, frame)
+                    stream.last_error = None
+                except Exception as e:
+                    logger.error(f"处理帧时发生错误: {str(e)}，使用原始帧")
+                    stream.last_error = str(e)
+                    processed_frame = self.frame_buffer.get_frame_jpeg(camera_id, frame)
+                processing_time = time.time() - process_start
+                if timings:
+                    for stage, seconds in timings.items():
+                        self.record_stage(stream_key, stage, seconds)
+                
+                if not processed_frame:
+                    continue
+                
+                # 更新处理流状态（延迟、落后帧数），并发布给所有客户端
+                lag_frames = self.frame_buffer.get_sequence(camera_id) - frame.seq
+                stream.update_frame(processed_frame, frame.timestamp, processing_time, lag_frames)
+                seq = self._publish_processed_frame(stream_key, processed_frame, frame.timestamp, outputs or None)
+                # 巡检任务的结果通道：每次实际处理发布一条结果，frame_seq为处理帧缓存中对应的帧序号
+                if job is not None:
+                    job.publish_result(seq, frame.timestamp, outputs, processing_time, stream.last_error)
+                
+                current_time = time.time()
+                if current_time - last_stats_time >= 10.0:
+                    stats = stream.get_stats()
+                    logger.info(
+                        f"Processed stream stats - stream: {stream_key}, "
+                        f"fps: {stats['fps']:.1f}, "
+                        f"clients: {stats['clients']}, "
+                        f"dropped: {stats['dropped_frames']}, "
+                        f"latency: {stats['latency_ms']['avg']:.0f}ms"
+                    )
+                    last_stats_time = current_time
+        except Exception as e:
+            logger.exception(f"处理流 {stream_key} 工作线程崩溃: {str(e)}")
+            stream.last_error = str(e)
+        finally:
+            stream.is_streaming = False
+            stream.close_session()
+            # 唤醒仍在等待的客户端，使其及时退出
+            self._notify_frame(stream_key)
+            logger.info(f"处理流 {stream_key} 工作线程已停止")
 
-                    # 重置错误计数
-                    error_count = 0
-
-                    # 处理帧
-                    try:
-                        processed_frame = frame_processor.process_frame(
-                            frame_data,
-                            processed_stream.operation_id,
-                            processed_stream.operation_type
-                        )
-                        
-                        # 检查处理后的帧是否为空或无效
-                        if not processed_frame or len(processed_frame) == 0:
-                            logger.warning(f"处理后的帧无效，使用原始帧作为替代")
-                            processed_frame = frame_data
-                    except Exception as e:
-                        logger.error(f"处理帧时发生错误: {str(e)}，使用原始帧")
-                        processed_frame = frame_data
+    def _add_processed_stream_client(self, camera_id: str, operation_id: int, operation_type: str,
+                                     db: Session, backpressure: str = 'latest',
+                                     queue_size: int = 2) -> Tuple[Optional[ProcessedStream], Optional[str]]:
+        """登记处理流客户端，必要时启动处理流，失败时返回错误信息"""
+        with self._cameras_lock:
+            # 检查摄像头状态
+            if camera_id not in self._cameras:
+                return None, "Camera not found"
 
-                    # 更新处理流状态和缓存
-                    processed_stream.update_frame(processed_frame)
-                    self.frame_buffer.update_processed_frame(stream_key, processed_frame)
+            camera = self._cameras[camera_id]
+            if not camera.is_alive():
+                logger.error(f"Camera {camera_id} is not properly opened")
+                self._force_cleanup_camera(camera_id)
+                return None, "Camera is not properly opened"
+            
+            if self._count_viewers(camera_id) >= self.max_clients_per_camera:
+                logger.warning(f"Camera {camera_id} reached max clients ({self.max_clients_per_camera})")
+                return None, "Too many viewers for this camera"
 
-                    # 发送处理后的帧
-                    yield (
-                        f"--{boundary}\r\n"
-                        f"Content-Type: image/jpeg\r\n"
-                        f"Content-Length: {len(processed_frame)}\r\n\r\n".encode() + processed_frame + b"\r\n"
-                    )
+            # 启动或获取处理流
+            with self._streams_lock:
+                processed_stream = self.get_or_create_processed_stream(camera_id, operation_id, operation_type, db,
+                                                                       backpressure, queue_size)
+                if processed_stream is None:
+                    return None, "Failed to start processed stream"
+                processed_stream.increment_clients()
+                return processed_stream, None
 
-                    # 更新统计信息和调整帧率
-                    if current_time - last_stats_time >= 1.0:
-                        stats = processed_stream.get_stats()
+    def _remove_processed_stream_client(self, stream_key: str, processed_stream: ProcessedStream, client_id: str) -> None:
+        """注销处理流客户端，最后一个客户端离开时停止处理流"""
+        try:
+            with self._streams_lock:
+                if stream_key in self._processed_streams:
+                    clients_left = processed_stream.decrement_clients()
+                    if processed_stream.idle:
+                        logger.info(f"No clients left for processed stream {stream_key}, stopping")
+                        self._force_cleanup_stream(stream_key)
+                    else:
                         logger.info(
-                            f"Stream stats - camera: {camera_id}, "
-                            f"client: {client_id}, "
-                            f"fps: {stats['fps']:.1f}, "
-                            f"clients: {stats['clients']}"
+                            f"Client {client_id} disconnected from processed stream {stream_key}, "
+                            f"{clients_left} clients left"
                         )
-                        
-                        if stats['fps'] > 35:
-                            frame_interval = min(0.05, frame_interval + 0.001)
-                        elif stats['fps'] < 25:
-                            frame_interval = max(0.01, frame_interval - 0.001)
-                        
-                        last_stats_time = current_time
+        except Exception as e:
+            logger.error(f"Error during stream cleanup: {str(e)}")
+            # 确保在出错时也能清理资源
+            self._force_cleanup_stream(stream_key)
 
-                    time.sleep(frame_interval)
+    def _check_camera_source(self, camera_id: str, restart: bool = False) -> bool:
+        """原始流等待超时时检查摄像头，restart为True且流已停止时尝试重启，摄像头已移除时返回False"""
+        with self._cameras_lock:
+            if camera_id not in self._cameras:
+                return False
+            if restart and not self._cameras[camera_id].is_streaming:
+                logger.warning(f"Camera {camera_id} stream stalled - no frames for 5 seconds, restarting")
+                self.start_stream(camera_id)
+        return True
 
-                except Exception as e:
-                    logger.error(f"Error processing frame: {str(e)}")
-                    error_count += 1
-                    if error_count >= max_errors:
+    def _check_processed_stream_source(self, camera_id: str) -> bool:
+        """处理流等待超时时检查摄像头，必要时重启摄像头流，摄像头失效时返回False"""
+        with self._cameras_lock:
+            if camera_id not in self._cameras or not self._cameras[camera_id].is_alive():
+                logger.error(f"Camera {camera_id} became invalid")
+                return False
+            if not self._cameras[camera_id].is_streaming:
+                logger.info(f"摄像头 {camera_id} 流停止，尝试重启")
+                self.start_stream(camera_id)
+        return True
+
+    def get_processed_mjpeg_frame_generator(self, camera_id: str, operation_id: int, operation_type: str, db: Session,
+                                            backpressure: str = 'latest', queue_size: int = 2,
+                                            width: Optional[int] = None, quality: Optional[int] = None):
+        """
+        返回处理后MJPEG流的帧生成器
+        处理由处理流的工作线程完成，客户端只读取并转发共享的处理结果（或其缩放/质量变体）
+        """
+        boundary = "processedframe"
+        stream_key = self.get_processed_stream_key(camera_id, operation_id, operation_type)
+        client_id = f"client_{time.time()}_{id(threading.current_thread())}"
+        wait_count = 0
+        max_waits = 5
+
+        try:
+            processed_stream, error = self._add_processed_stream_client(
+                camera_id, operation_id, operation_type, db, backpressure, queue_size
+            )
+        except Exception as e:
+            logger.error(f"Error initializing processed stream: {str(e)}")
+            processed_stream, error = None, f"Stream initialization error: {str(e)}"
+        if error:
+            yield self._create_error_frame(boundary, error)
+            return
+        logger.info(f"New processed stream client {client_id} for camera {camera_id}")
+        variant = self.frame_buffer.normalize_variant(width, quality)
+        self._register_variant(stream_key, variant)
+
+        try:
+            last_seq = 0
+            while processed_stream.is_streaming:
+                last_seq, processed_frame = self.wait_for_processed_frame(stream_key, last_seq, timeout=1.0,
+                                                                          variant=variant)
+                
+                if not processed_frame:
+                    if not processed_stream.is_streaming:
+                        break
+                    
+                    wait_count += 1
+                    logger.warning(f"处理流 {stream_key} 等待处理结果超时 ({wait_count}/{max_waits})")
+                    if not self._check_processed_stream_source(camera_id):
                         break
-                    time.sleep(0.1)
+                    
+                    if wait_count < max_waits:
+                        yield self._create_error_frame(boundary, f"等待摄像头帧... ({wait_count}/{max_waits})")
+                    else:
+                        yield self._create_error_frame(boundary, "摄像头连续获取帧失败，请检查摄像头连接和权限")
+                        wait_count = 0
+                    continue
+                
+                wait_count = 0
+                
+                # 发送处理后的帧，X-Timestamp为源帧的采集时间
+                capture_time = self.frame_buffer.get_capture_time(stream_key, last_seq, processed=True)
+                send_started = self.record_delivery(stream_key, capture_time)
+                yield (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: image/jpeg\r\n"
+                    f"X-Sequence: {last_seq}\r\n"
+                    f"X-Timestamp: {capture_time:.6f}\r\n"
+                    f"Content-Length: {len(processed_frame)}\r\n\r\n".encode() + processed_frame + b"\r\n"
+                )
+                self.record_stage(stream_key, 'send', time.perf_counter() - send_started)
 
         except GeneratorExit:
             logger.info(f"Processed stream closed normally for client {client_id}")
         except Exception as e:
             logger.error(f"Fatal error in processed stream for client {client_id}: {str(e)}")
         finally:
-            try:
-                with self._streams_lock:
-                    if stream_key in self._processed_streams:
-                        clients_left = processed_stream.decrement_clients()
-                        if clients_left <= 0:
-                            logger.info(f"No clients left for processed stream {stream_key}, stopping")
-                            self._force_cleanup_stream(stream_key)
-                        else:
-                            logger.info(
-                                f"Client {client_id} disconnected from processed stream {stream_key}, "
-                                f"{clients_left} clients left"
-                            )
-            except Exception as e:
-                logger.error(f"Error during stream cleanup: {str(e)}")
-                # 确保在出错时也能清理资源
-                self._force_cleanup_stream(stream_key)
+            self._unregister_variant(stream_key, variant)
+            self._remove_processed_stream_client(stream_key, processed_stream, client_id)
+
+    async def get_async_processed_mjpeg_frame_generator(self, camera_id: str, operation_id: int, operation_type: str,
+                                                        db: Session, backpressure: str = 'latest', queue_size: int = 2,
+                                                        width: Optional[int] = None, quality: Optional[int] = None):
+        """
+        返回处理后MJPEG流的异步帧生成器
+        在事件循环中等待处理流工作线程发布的结果，每个观看客户端不占用线程池线程
+        请求的缩放/质量变体由处理流工作线程在发布结果时编码
+        """
+        boundary = "processedframe"
+        stream_key = self.get_processed_stream_key(camera_id, operation_id, operation_type)
+        client_id = f"client_{time.time()}_{id(asyncio.current_task())}"
+        wait_count = 0
+        max_waits = 5
+
+        try:
+            # 启动处理流可能需要查询数据库，放到线程中执行
+            processed_stream, error = await asyncio.to_thread(
+                self._add_processed_stream_client, camera_id, operation_id, operation_type, db,
+                backpressure, queue_size
+            )
+        except Exception as e:
+            logger.error(f"Error initializing processed stream: {str(e)}")
+            processed_stream, error = None, f"Stream initialization error: {str(e)}"
+        if error:
+            yield self._create_error_frame(boundary, error)
+            return
+        logger.info(f"New async processed stream client {client_id} for camera {camera_id}")
+        variant = self.frame_buffer.normalize_variant(width, quality)
+        self._register_variant(stream_key, variant)
+
+        try:
+            last_seq = 0
+            while processed_stream.is_streaming:
+                last_seq, processed_frame = await self.wait_for_processed_frame_async(stream_key, last_seq, timeout=1.0,
+                                                                                      variant=variant)
+                
+                if not processed_frame:
+                    if not processed_stream.is_streaming:
+                        break
+                    
+                    wait_count += 1
+                    logger.warning(f"处理流 {stream_key} 等待处理结果超时 ({wait_count}/{max_waits})")
+                    if not await asyncio.to_thread(self._check_processed_stream_source, camera_id):
+                        break
+                    
+                    if wait_count < max_waits:
+                        yield self._create_error_frame(boundary, f"等待摄像头帧... ({wait_count}/{max_waits})")
+                    else:
+                        yield self._create_error_frame(boundary, "摄像头连续获取帧失败，请检查摄像头连接和权限")
+                        wait_count = 0
+                    continue
+                
+                wait_count = 0
+                capture_time = self.frame_buffer.get_capture_time(stream_key, last_seq, processed=True)
+                send_started = self.record_delivery(stream_key, capture_time)
+                yield (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: image/jpeg\r\n"
+                    f"X-Sequence: {last_seq}\r\n"
+                    f"X-Timestamp: {capture_time:.6f}\r\n"
+                    f"Content-Length: {len(processed_frame)}\r\n\r\n".encode() + processed_frame + b"\r\n"
+                )
+                self.record_stage(stream_key, 'send', time.perf_counter() - send_started)
+        except Exception as e:
+            logger.error(f"Fatal error in processed stream for client {client_id}: {str(e)}")
+        finally:
+            self._unregister_variant(stream_key, variant)
+            self._remove_processed_stream_client(stream_key, processed_stream, client_id)
+
+    async def get_async_frame_iterator(self, camera_id: str, operation_id: Optional[int] = None,
+                                       operation_type: str = 'operation', db: Optional[Session] = None,
+                                       backpressure: str = 'latest', queue_size: int = 2,
+                                       width: Optional[int] = None, quality: Optional[int] = None):
+        """
+        按需拉取的异步帧迭代器，产出 StreamFrame(序号, 采集时间, JPEG, 检测结果)
+        与MJPEG生成器不同，迭代器只在调用方请求下一帧时才等待并取最新帧，中间的帧直接跳过，
+        由调用方（如WebSocket在收到客户端确认后）控制节奏，服务端不为慢客户端积压帧
+        登记客户端失败时抛出RuntimeError；摄像头关闭、处理流停止或长时间无帧时结束
+        """
+        client_id = f"client_{time.time()}_{id(asyncio.current_task())}"
+        processed = operation_id is not None
+        key = self.get_processed_stream_key(camera_id, operation_id, operation_type) if processed else camera_id
+        processed_stream = None
+        
+        if processed:
+            processed_stream, error = await asyncio.to_thread(
+                self._add_processed_stream_client, camera_id, operation_id, operation_type, db,
+                backpressure, queue_size
+            )
+        else:
+            error = await asyncio.to_thread(self._add_camera_client, camera_id)
+        if error:
+            raise RuntimeError(error)
+        logger.info(f"New frame iterator client {client_id} for {key}")
+        variant = self.frame_buffer.normalize_variant(width, quality)
+        self._register_variant(key, variant)
+        
+        try:
+            last_seq = 0
+            last_frame_time = time.time()
+            while True:
+                if processed:
+                    if not processed_stream.is_streaming:
+                        break
+                    seq, frame = await self.wait_for_processed_frame_async(key, last_seq, timeout=1.0, variant=variant)
+                else:
+                    seq, frame = await self.wait_for_frame_async(key, last_seq, timeout=1.0, variant=variant)
+                last_seq = seq
+                
+                if not frame:
+                    if time.time() - last_frame_time > 30.0:
+                        logger.error(f"{key} 超过30秒没有新帧，结束帧迭代")
+                        break
+                    check = self._check_processed_stream_source if processed else self._check_camera_source
+                    if not await asyncio.to_thread(check, camera_id):
+                        break
+                    continue
+                
+                last_frame_time = time.time()
+                capture_time = self.frame_buffer.get_capture_time(key, seq, processed=processed)
+                detections = self.frame_buffer.get_processed_metadata(key, seq) if processed else None
+                yield StreamFrame(seq, capture_time, frame, detections)
+        finally:
+            self._unregister_variant(key, variant)
+            if processed:
+                self._remove_processed_stream_client(key, processed_stream, client_id)
+            else:
+                self._remove_camera_client(camera_id, client_id)
 
     def _create_error_frame(self, boundary: str, message: str) -> bytes:
         """创建包含错误信息的图像帧"""
@@ -1668,8 +4449,11 @@ class CameraService:
         """关闭所有摄像头并清理资源"""
         logger.info("正在关闭所有摄像头资源...")
         
-        # 停止所有处理流
-        with self._processed_streams_lock:
+        # 停止所有巡检任务和处理流
+        with self._streams_lock:
+            for job in self._inspection_jobs.values():
+                job.stop()
+            self._inspection_jobs.clear()
             for stream_key in list(self._processed_streams.keys()):
                 try:
                     stream = self._processed_streams[stream_key]
@@ -1678,28 +4462,26 @@ class CameraService:
                 except Exception as e:
                     logger.error(f"清理处理流 {stream_key} 失败: {str(e)}")
             self._processed_streams.clear()
+            self._refresh_streamed_cameras()
         
         # 停止所有摄像头流
         with self._cameras_lock:
-            for camera_id in list(self._cameras.keys()):
-                try:
-                    camera_info = self._cameras.get(camera_id)
-                    if camera_info:
-                        if camera_info.thread and camera_info.thread.is_alive():
-                            camera_info.is_streaming = False
-                            camera_info.thread.join(timeout=1.0)
-                            logger.info(f"已停止摄像头线程: {camera_id}")
-                        
-                        if camera_info.cap and camera_info.cap.isOpened():
-                            camera_info.cap.release()
-                            logger.info(f"已释放摄像头资源: {camera_id}")
-                except Exception as e:
-                    logger.error(f"关闭摄像头 {camera_id} 失败: {str(e)}")
-            self._cameras.clear()
+            camera_ids = list(self._cameras.keys())
+        threads = {}
+        for camera_id in camera_ids:
+            # 先停止所有摄像头，再在锁外统一等待流线程退出（流线程退出时释放摄像头）
+            thread = self._force_cleanup_camera(camera_id)
+            if thread is not None:
+                threads[camera_id] = thread
+        for camera_id, thread in threads.items():
+            thread.join(timeout=1.0)
+            if thread.is_alive():
+                logger.error(f"关闭摄像头 {camera_id} 失败: 流线程未能及时退出")
+            else:
+                logger.info(f"已停止摄像头线程并释放资源: {camera_id}")
         
         # 清空帧缓存
-        if self._frame_buffer:
-            self._frame_buffer.cleanup()
+        self.frame_buffer.cleanup()
             
         logger.info("所有摄像头资源已成功关闭")
 
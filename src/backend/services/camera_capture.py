@@ -0,0 +1,811 @@
+import cv2
+import logging
+import multiprocessing
+import os
+import platform
+import re
+import threading
+import time
+import urllib.request
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlparse
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 回放视频源的URL前缀：file:// 视频文件，dir:// 图片文件夹
+REPLAY_SCHEMES = ('file://', 'dir://')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def is_replay_source(source: Union[int, str]) -> bool:
+    return isinstance(source, str) and source.startswith(REPLAY_SCHEMES)
+
+
+class ReplayCapture:
+    """
+    回放视频文件或图片文件夹的视频源，接口与cv2.VideoCapture一致，用于无摄像头环境下的压测和回归测试
+    URL格式:
+      file:///path/to/video.mp4?fps=15&loop=1
+      dir:///path/to/images?fps=10&loop=0&cache=1
+    参数:
+      fps   回放帧率，默认使用视频文件自身的帧率（图片文件夹为30）
+      loop  播放结束后是否从头循环，默认1
+      cache 图片文件夹是否预先解码全部图片到内存，默认0（每帧读取时解码，与真实采集的解码开销相当）
+    按单调时钟节拍输出帧；第n帧的时间戳固定为 打开时间 + n / fps，不受读取抖动影响
+    读取落后于节拍时跳过错过节拍的源帧（与真实摄像头丢帧一致），时间戳始终对应实际输出的帧
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        parsed = urlparse(source)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        path = unquote(parsed.netloc + parsed.path)
+        if re.match(r'^/[A-Za-z]:[/\\]', path):
+            path = path[1:]  # Windows盘符路径，如 file:///C:/videos/line.mp4
+        self.path = path
+        self.is_directory = parsed.scheme == 'dir'
+        self.loop = params.get('loop', '1') not in ('0', 'false', 'no')
+        
+        self._cap: Optional[cv2.VideoCapture] = None
+        self._files: List[str] = []
+        self._cache: Optional[List[Optional[np.ndarray]]] = None
+        self._opened = False
+        self.finished = False  # 不循环的回放源已播放结束
+        self._index = -1  # 最近一次grab的帧在源中的位置
+        self._frame_count = 0  # 已播放的帧数（含循环和跳过的帧），用于计算时间戳
+        self._width = 0
+        self._height = 0
+        
+        native_fps = 0.0
+        if self.is_directory:
+            if os.path.isdir(path):
+                self._files = sorted(
+                    os.path.join(path, name) for name in os.listdir(path)
+                    if name.lower().endswith(IMAGE_EXTENSIONS)
+                )
+            if self._files:
+                first = cv2.imread(self._files[0], cv2.IMREAD_COLOR)
+                if first is not None:
+                    self._height, self._width = first.shape[:2]
+                    self._opened = True
+                    if params.get('cache', '0') not in ('0', 'false', 'no'):
+                        self._cache = [cv2.imread(f, cv2.IMREAD_COLOR) for f in self._files]
+        else:
+            self._cap = cv2.VideoCapture(path)
+            if self._cap.isOpened():
+                self._opened = True
+                native_fps = self._cap.get(cv2.CAP_PROP_FPS)
+                self._width = int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                self._height = int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        
+        try:
+            fps = float(params['fps']) if 'fps' in params else native_fps
+        except ValueError:
+            fps = native_fps
+        self.fps = fps if 0 < fps <= 1000 else 30.0
+        self._start_time = time.time()
+        self._start_clock = time.monotonic()
+        
+        if self._opened:
+            logger.info(f"回放源已打开: {path}，帧率 {self.fps}，循环: {self.loop}")
+        else:
+            logger.error(f"无法打开回放源: {path}")
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def _wait_for_next_frame(self) -> int:
+        """
+        按帧率节拍等待下一帧，返回需要前进的源帧数
+        落后超过一帧时跳过错过节拍的源帧以重新对齐节拍，不集中补帧
+        """
+        due = self._start_clock + self._frame_count / self.fps
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -1.0 / self.fps:
+            return 1 + int(-delay * self.fps)
+        return 1
+
+    def _next_index(self) -> bool:
+        """前进到下一帧在源中的位置，到达结尾且不循环时返回False"""
+        total = len(self._files)
+        if self._index + 1 < total:
+            self._index += 1
+            return True
+        if not self.loop:
+            return False
+        self._index = 0
+        return True
+
+    def _advance(self) -> bool:
+        """在源中前进一帧（视频文件只grab不解码），到达结尾且不循环或读取失败时返回False"""
+        if self.is_directory:
+            if not self._next_index():
+                self._opened = False
+                self.finished = True
+                return False
+        else:
+            if not self._cap.grab():
+                if not self.loop:
+                    self._opened = False
+                    self.finished = True
+                    return False
+                # 回到开头循环播放
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                if not self._cap.grab():
+                    self._opened = False
+                    return False
+                self._index = -1
+            self._index += 1
+        self._frame_count += 1
+        return True
+
+    def grab(self) -> bool:
+        if not self._opened:
+            return False
+        # 跳过的帧同样在源中前进并计入帧数，保证时间戳与retrieve取出的帧一致
+        for _ in range(self._wait_for_next_frame()):
+            if not self._advance():
+                return False
+        return True
+
+    def retrieve(self, image: Optional[np.ndarray] = None, flag: int = 0) -> Tuple[bool, Optional[np.ndarray]]:
+        if self._frame_count <= 0:
+            return False, None
+        if self.is_directory:
+            frame = self._cache[self._index] if self._cache is not None else None
+            if frame is None:
+                frame = cv2.imread(self._files[self._index], cv2.IMREAD_COLOR)
+            if frame is None:
+                return False, None
+            if image is not None and image.shape == frame.shape:
+                np.copyto(image, frame)
+                return True, image
+            return True, frame.copy() if self._cache is not None else frame
+        return self._cap.retrieve(image) if image is not None else self._cap.retrieve()
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get_timestamp(self) -> float:
+        """最近一次grab的帧的确定性时间戳：打开时间 + (帧序号 - 1) / fps"""
+        return self._start_time + max(0, self._frame_count - 1) / self.fps
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._height)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._index + 1)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            return max(0, self._frame_count - 1) * 1000.0 / self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self._files)) if self.is_directory else self._cap.get(prop)
+        return 0.0
+
+    def set(self, prop: int, value: float) -> bool:
+        """回放源的帧率和分辨率由URL参数和源文件决定，只支持跳转（CAP_PROP_POS_FRAMES）"""
+        if prop != cv2.CAP_PROP_POS_FRAMES or not self._opened:
+            return False
+        if self.is_directory:
+            self._index = int(value) - 1
+            return True
+        if self._cap.set(prop, value):
+            self._index = int(value) - 1
+            return True
+        return False
+
+    def release(self) -> None:
+        self._opened = False
+        self._cache = None
+        if self._cap is not None:
+            self._cap.release()
+
+
+# 帧起始（SOF）标记，其后依次为精度、高度、宽度
+_JPEG_SOF_MARKERS = frozenset((0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF))
+_standard_dht: Optional[bytes] = None
+
+
+def _scan_jpeg_header(data: bytes) -> Tuple[Optional[Tuple[int, int]], bool]:
+    """扫描JPEG头部直到扫描数据开始（SOS），返回((宽度, 高度)或None, 是否包含哈夫曼表)，不解码图像"""
+    size, has_dht = None, False
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None, False
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            break
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        if marker == 0xDA:
+            break
+        length = (data[i + 2] << 8) | data[i + 3]
+        if marker == 0xC4:
+            has_dht = True
+        elif marker in _JPEG_SOF_MARKERS and i + 9 <= len(data):
+            size = ((data[i + 7] << 8) | data[i + 8], (data[i + 5] << 8) | data[i + 6])
+        i += 2 + length
+    return size, has_dht
+
+
+def jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """从JPEG头部读取(宽度, 高度)，数据不是有效的JPEG时返回None"""
+    return _scan_jpeg_header(data)[0]
+
+
+def _get_standard_dht() -> bytes:
+    """JPEG标准哈夫曼表的DHT段，取自OpenCV以默认参数编码的图像"""
+    global _standard_dht
+    if _standard_dht is None:
+        _, buffer = cv2.imencode('.jpg', np.zeros((8, 8, 3), np.uint8))
+        data = buffer.tobytes()
+        segments = []
+        i = 2
+        while i + 4 <= len(data) and data[i + 1] != 0xDA:
+            length = (data[i + 2] << 8) | data[i + 3]
+            if data[i + 1] == 0xC4:
+                segments.append(data[i:i + 2 + length])
+            i += 2 + length
+        _standard_dht = b''.join(segments)
+    return _standard_dht
+
+
+def normalize_mjpeg_frame(data: bytes) -> bytes:
+    """
+    许多USB摄像头输出的MJPEG帧省略哈夫曼表（使用标准表），浏览器无法直接显示，
+    这类帧在SOI之后插入标准哈夫曼表；包含哈夫曼表的帧原样返回
+    """
+    size, has_dht = _scan_jpeg_header(data)
+    if size is None or has_dht:
+        return data
+    return data[:2] + _get_standard_dht() + data[2:]
+
+
+class PassthroughCapture:
+    """
+    直通采集视频源的基类：grab取得下一帧，retrieve_jpeg返回视频源自身编码的JPEG数据，不解码也不重新编码；
+    read/retrieve按cv2.VideoCapture接口解码为BGR图像，供需要像素的场景使用
+    """
+
+    def grab(self) -> bool:
+        raise NotImplementedError
+
+    def retrieve_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        raise NotImplementedError
+
+    def read_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve_jpeg()
+
+    def retrieve(self, image: Optional[np.ndarray] = None, flag: int = 0) -> Tuple[bool, Optional[np.ndarray]]:
+        ret, data = self.retrieve_jpeg()
+        if not ret:
+            return False, None
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+
+class MjpegPassthroughCapture(PassthroughCapture):
+    """
+    以MJPEG格式采集的本地摄像头：设置CAP_PROP_FOURCC为MJPG并关闭CAP_PROP_CONVERT_RGB后，
+    cv2.VideoCapture.retrieve返回摄像头输出的原始JPEG字节（一维uint8数组）而不是解码后的图像
+    后端不支持原始数据输出时retrieve_jpeg返回失败，由调用方回退到普通采集
+    """
+
+    def __init__(self, cap: cv2.VideoCapture):
+        self._cap = cap
+        self._cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+        self._cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+
+    def isOpened(self) -> bool:
+        return self._cap.isOpened()
+
+    def grab(self) -> bool:
+        return self._cap.grab()
+
+    def retrieve_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        ret, data = self._cap.retrieve()
+        if not ret or data is None or data.ndim == 3 or data.size < 4:
+            # 三维数组表示后端忽略了CONVERT_RGB，输出的仍是解码后的图像
+            return False, None
+        return True, normalize_mjpeg_frame(data.tobytes())
+
+    def get(self, prop: int) -> float:
+        return self._cap.get(prop)
+
+    def set(self, prop: int, value: float) -> bool:
+        return self._cap.set(prop, value)
+
+    def release(self) -> None:
+        self._cap.release()
+
+
+class HttpMjpegCapture(PassthroughCapture):
+    """
+    HTTP MJPEG流（multipart/x-mixed-replace）读取器，直接从HTTP响应中切分出每一帧的JPEG数据，
+    不经过OpenCV/FFmpeg解码；响应不是multipart流时视为无法打开，由调用方回退到cv2.VideoCapture
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self._response = None
+        self._boundary = b''
+        self._at_part = False  # 已读过分隔行（无Content-Length的分段以下一个分隔行结束）
+        self._width = 0
+        self._height = 0
+        self._fps = 0.0
+        self._last_read = 0.0
+        self._grabbed: Optional[bytes] = None
+        try:
+            response = urllib.request.urlopen(url, timeout=timeout)
+            content_type = response.headers.get('Content-Type', '')
+            match = re.search(r'boundary="?([^";]+)"?', content_type)
+            if not content_type.startswith('multipart/') or not match:
+                logger.warning(f"{url} 不是MJPEG流 (Content-Type: {content_type})")
+                response.close()
+                return
+            self._response = response
+            self._boundary = match.group(1).strip().strip('-').encode('latin-1')
+        except (OSError, ValueError) as e:
+            logger.error(f"打开MJPEG流 {url} 出错: {str(e)}")
+
+    def isOpened(self) -> bool:
+        return self._response is not None
+
+    def _is_boundary(self, line: bytes) -> bool:
+        return line.startswith(b'--') and line.strip().strip(b'-') == self._boundary
+
+    def _read_part(self) -> Optional[bytes]:
+        stream = self._response
+        # 跳到下一个分隔行
+        while not self._at_part:
+            line = stream.readline()
+            if not line:
+                return None
+            self._at_part = self._is_boundary(line)
+        self._at_part = False
+        
+        headers = {}
+        while True:
+            line = stream.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.partition(b':')
+            headers[name.strip().lower()] = value.strip()
+        
+        length = headers.get(b'content-length')
+        if length:
+            data = stream.read(int(length))
+            return data if len(data) == int(length) else None
+        
+        # 没有Content-Length时读到下一个分隔行为止
+        lines = []
+        while True:
+            line = stream.readline()
+            if not line:
+                return None
+            if self._is_boundary(line):
+                self._at_part = True
+                break
+            lines.append(line)
+        return b''.join(lines).rstrip(b'\r\n')
+
+    def grab(self) -> bool:
+        """读取下一帧的JPEG数据（HTTP流必须读出每一帧的数据），不解码"""
+        self._grabbed = None
+        if self._response is None:
+            return False
+        try:
+            data = self._read_part()
+        except (OSError, ValueError) as e:
+            logger.error(f"读取MJPEG流 {self.url} 出错: {str(e)}")
+            data = None
+        if data is None:
+            # 连接已断开，由上层重连
+            self.release()
+            return False
+        size = jpeg_dimensions(data)
+        if size is None:
+            return False
+        self._width, self._height = size
+        now = time.monotonic()
+        if self._last_read:
+            interval = now - self._last_read
+            if interval > 0:
+                # 按帧间隔平滑估计视频源帧率
+                self._fps = 1.0 / interval if not self._fps else self._fps * 0.9 + 0.1 / interval
+        self._last_read = now
+        self._grabbed = data
+        return True
+
+    def retrieve_jpeg(self) -> Tuple[bool, Optional[bytes]]:
+        if not self._grabbed:
+            return False, None
+        return True, normalize_mjpeg_frame(self._grabbed)
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._height)
+        if prop == cv2.CAP_PROP_FPS:
+            return self._fps
+        return 0.0
+
+    def set(self, prop: int, value: float) -> bool:
+        """HTTP MJPEG流的分辨率和帧率由摄像头自身配置决定"""
+        return False
+
+    def release(self) -> None:
+        response, self._response = self._response, None
+        if response is not None:
+            try:
+                response.close()
+            except OSError:
+                pass
+
+
+class SharedFrameRing:
+    """
+    位于共享内存中的帧环形缓冲区，由主进程创建，采集子进程写入
+    布局: 每个槽位一个头部 [seq, timestamp]（float64），随后是slots个连续的uint8图像
+    写入时先将槽位序号置0再写图像最后写序号，读取方按序号校验槽位未被覆盖
+    """
+    _ALIGN = 64
+
+    def __init__(self, shape: Tuple[int, ...], slots: int, name: Optional[str] = None):
+        self.shape = tuple(int(d) for d in shape)
+        self.slots = max(1, int(slots))
+        frame_bytes = int(np.prod(self.shape))
+        header_bytes = -(-self.slots * 16 // self._ALIGN) * self._ALIGN
+        create = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=create, size=header_bytes + self.slots * frame_bytes if create else 0
+        )
+        self.header = np.ndarray((self.slots, 2), dtype=np.float64, buffer=self.shm.buf)
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8,
+                                 buffer=self.shm.buf, offset=header_bytes)
+        if create:
+            self.header.fill(0)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def slot_index(self, seq: int) -> int:
+        return (seq - 1) % self.slots
+
+    def begin_write(self, seq: int) -> np.ndarray:
+        """标记槽位正在写入并返回该槽位的图像数组，供采集直接写入"""
+        index = self.slot_index(seq)
+        self.header[index, 0] = 0
+        return self.frames[index]
+
+    def end_write(self, seq: int, timestamp: float) -> None:
+        index = self.slot_index(seq)
+        self.header[index, 1] = timestamp
+        self.header[index, 0] = seq
+
+    def copy_out(self, seq: int, out: np.ndarray) -> Optional[float]:
+        """
+        将序号为seq的帧复制到out并返回其时间戳；槽位在复制前或复制过程中被子进程覆盖时返回None
+        帧视图从不离开本类，共享内存关闭后不会有数组继续引用已解除映射的内存
+        """
+        index = self.slot_index(seq)
+        if int(self.header[index, 0]) != seq:
+            return None
+        timestamp = float(self.header[index, 1])
+        np.copyto(out, self.frames[index])
+        # 子进程写入前会先把槽位序号置0，复制后序号未变说明复制期间槽位没有被覆盖
+        if int(self.header[index, 0]) != seq:
+            return None
+        return timestamp
+
+    def close(self) -> None:
+        """断开与共享内存的映射"""
+        # 先释放本对象持有的视图，否则mmap无法关闭
+        self.header = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+    def unlink(self) -> None:
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _open_source(source: Union[int, str]) -> Union[cv2.VideoCapture, ReplayCapture]:
+    """在采集子进程中打开视频源"""
+    if is_replay_source(source):
+        return ReplayCapture(source)
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, int) and platform.system() == 'Darwin':
+        return cv2.VideoCapture(source, cv2.CAP_AVFOUNDATION)
+    return cv2.VideoCapture(source)
+
+
+def _capture_process_main(source: Union[int, str], conn) -> None:
+    """
+    采集子进程入口：打开视频源并持续读取帧，直接写入主进程分配的共享内存槽位，
+    通过管道通知主进程新帧序号；帧尺寸变化时请求主进程重新分配共享内存，每种尺寸只请求一次，
+    在收到对应的ring消息之前丢弃该尺寸的帧
+    消息（子进程 -> 主进程）: ('opened', bool, props) / ('format', shape, props, reallocate) / ('frame', seq) / ('error', msg)
+    消息（主进程 -> 子进程）: ('ring', name, shape, slots) / ('set', prop, value) / ('stop',)
+    """
+    cap = _open_source(source)
+    opened = cap.isOpened()
+    conn.send(('opened', opened, _read_props(cap) if opened else {}))
+    if not opened:
+        conn.close()
+        return
+
+    ring: Optional[SharedFrameRing] = None
+    requested_shape: Optional[Tuple[int, ...]] = None  # 已请求但尚未收到共享内存的帧格式
+    reallocate = False  # 打开主进程分配的共享内存失败，下次请求时要求重新分配
+    target = frame = None
+    seq = 0
+    consecutive_failures = 0
+    try:
+        while True:
+            # 处理主进程的命令；关闭旧共享内存前先释放上一帧的槽位视图，否则映射无法关闭
+            target = frame = None
+            stop = False
+            attach_error = None
+            while conn.poll():
+                message = conn.recv()
+                if message[0] == 'stop':
+                    stop = True
+                elif message[0] == 'set':
+                    cap.set(message[1], message[2])
+                elif message[0] == 'ring':
+                    if ring is not None:
+                        ring.close()
+                        ring = None
+                    try:
+                        ring = SharedFrameRing(message[2], message[3], name=message[1])
+                        attach_error = None
+                    except OSError as e:
+                        # 主进程已用更新的共享内存替换了它时，后续的ring消息会带来新的共享内存
+                        attach_error = f"无法打开共享内存 {message[1]}: {str(e)}"
+                    requested_shape = None
+            if stop:
+                break
+            if attach_error and ring is None:
+                # 没有可用的共享内存，记录后要求主进程重新分配
+                conn.send(('error', attach_error))
+                reallocate = True
+
+            # 已有共享内存时直接解码到下一个槽位，避免额外拷贝
+            target = ring.begin_write(seq + 1) if ring is not None else None
+            ret, frame = cap.read(target) if target is not None else cap.read()
+            if not ret or frame is None:
+                consecutive_failures += 1
+                if consecutive_failures in (1, 10) or consecutive_failures % 100 == 0:
+                    conn.send(('error', f"读取帧失败 ({consecutive_failures})"))
+                time.sleep(0.05)
+                continue
+            consecutive_failures = 0
+
+            if ring is None or frame.shape != ring.shape or frame.dtype != np.uint8:
+                # 帧格式变化（首帧或分辨率切换），等待主进程分配新的共享内存，期间的帧丢弃
+                shape = tuple(frame.shape)
+                target = frame = None
+                if ring is not None:
+                    ring.close()
+                    ring = None
+                if shape != requested_shape:
+                    requested_shape = shape
+                    conn.send(('format', shape, _read_props(cap), reallocate))
+                    reallocate = False
+                continue
+
+            if target is None or frame is not target and not np.shares_memory(frame, target):
+                np.copyto(ring.begin_write(seq + 1), frame)
+            seq += 1
+            ring.end_write(seq, cap.get_timestamp() if isinstance(cap, ReplayCapture) else time.time())
+            conn.send(('frame', seq))
+    except (EOFError, BrokenPipeError, OSError):
+        # 主进程已退出或关闭了管道
+        pass
+    finally:
+        target = frame = None
+        cap.release()
+        if ring is not None:
+            ring.close()
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+
+def _read_props(cap: cv2.VideoCapture) -> Dict[int, float]:
+    return {
+        prop: cap.get(prop)
+        for prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT, cv2.CAP_PROP_FPS)
+    }
+
+
+class SharedMemoryCapture:
+    """
+    在子进程中采集的视频源，接口与cv2.VideoCapture一致（isOpened/read/grab/retrieve/set/get/release）
+    子进程独占摄像头并在自己的GIL下解码，帧经共享内存传给主进程，
+    使采集帧率不受主进程中处理流水线和Web请求的影响
+    retrieve()/read()把帧从共享内存复制到调用方的数组（通常是帧缓冲池的缓冲区）中返回，
+    不返回共享内存视图，因此子进程覆盖槽位、分辨率切换或release()都不会影响已发布的帧
+    """
+
+    def __init__(self, source: Union[int, str], slots: int = 32, open_timeout: float = 10.0):
+        self.source = source
+        self.slots = max(2, slots)
+        self._lock = threading.Lock()
+        self._ring: Optional[SharedFrameRing] = None
+        self._timestamp = 0.0  # 最近一次retrieve的帧的采集时间戳
+        self._props: Dict[int, float] = {}
+        self._latest_seq = 0
+        self._read_seq = 0
+        self._opened = False
+        self.last_error: Optional[str] = None
+
+        ctx = multiprocessing.get_context('spawn')
+        self._conn, child_conn = ctx.Pipe()
+        self._process = ctx.Process(
+            target=_capture_process_main, args=(source, child_conn),
+            name=f"camera-capture-{source}", daemon=True
+        )
+        self._process.start()
+        child_conn.close()
+
+        try:
+            if self._conn.poll(open_timeout):
+                message = self._conn.recv()
+                if message[0] == 'opened' and message[1]:
+                    self._opened = True
+                    self._props.update(message[2])
+        except (EOFError, OSError) as e:
+            logger.error(f"采集子进程 {source} 启动失败: {str(e)}")
+        if not self._opened:
+            logger.error(f"采集子进程无法打开视频源: {source}")
+            self.release()
+        else:
+            logger.info(f"视频源 {source} 已在采集子进程 (PID: {self._process.pid}) 中打开")
+
+    def isOpened(self) -> bool:
+        return self._opened and self._process.is_alive()
+
+    def _handle_message(self, message: Tuple[Any, ...]) -> None:
+        """处理子进程消息，需持有_lock"""
+        kind = message[0]
+        if kind == 'frame':
+            self._latest_seq = message[1]
+        elif kind == 'format':
+            shape, props = tuple(message[1]), message[2]
+            self._props.update(props)
+            if self._ring is not None and self._ring.shape == shape and not message[3]:
+                # 已为该格式分配了共享内存，子进程收到ring消息前的重复请求直接忽略
+                return
+            if self._ring is not None:
+                # 帧都是复制出去的，旧共享内存可以立即释放（子进程收到新的ring消息后自行关闭映射）
+                self._ring.unlink()
+                self._ring.close()
+            self._ring = SharedFrameRing(shape, self.slots)
+            self._latest_seq = self._read_seq = 0
+            self._conn.send(('ring', self._ring.name, shape, self.slots))
+            logger.info(f"视频源 {self.source} 帧格式 {shape}，已分配 {self.slots} 个共享内存槽位")
+        elif kind == 'error':
+            self.last_error = message[1]
+            logger.warning(f"采集子进程 {self.source}: {message[1]}")
+
+    def grab(self, timeout: float = 1.0) -> bool:
+        """等待子进程写入新帧，有新帧时返回True；多个新帧到达时只保留最新的一帧"""
+        if not self.isOpened():
+            return False
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            try:
+                while True:
+                    while self._conn.poll():
+                        self._handle_message(self._conn.recv())
+                    if self._ring is not None and self._latest_seq > self._read_seq:
+                        self._read_seq = self._latest_seq
+                        return True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._conn.poll(remaining):
+                        return False
+            except (EOFError, OSError) as e:
+                logger.error(f"采集子进程 {self.source} 已退出: {str(e)}")
+                self._opened = False
+                return False
+
+    def retrieve(self, image: Optional[np.ndarray] = None, flag: int = 0) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        将最近一次grab的帧从共享内存复制出来；传入形状相同的image时复制到该数组中，否则分配新数组
+        在锁内复制，保证复制期间共享内存不会被release()或分辨率切换释放
+        """
+        with self._lock:
+            ring = self._ring
+            if ring is None or self._read_seq <= 0:
+                return False, None
+            if image is None or image.shape != ring.shape or image.dtype != np.uint8:
+                image = np.empty(ring.shape, np.uint8)
+            timestamp = ring.copy_out(self._read_seq, image)
+            if timestamp is None:
+                # 读取太慢，槽位已被子进程覆盖
+                return False, None
+            self._timestamp = timestamp
+        return True, image
+
+    def read(self, image: Optional[np.ndarray] = None) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get_timestamp(self) -> float:
+        """返回最近一次retrieve的帧在子进程中的采集时间戳"""
+        return self._timestamp
+
+    def set(self, prop: int, value: float) -> bool:
+        if not self.isOpened():
+            return False
+        try:
+            self._conn.send(('set', prop, value))
+        except (BrokenPipeError, OSError):
+            return False
+        self._props[prop] = value
+        return True
+
+    def get(self, prop: int) -> float:
+        return self._props.get(prop, 0.0)
+
+    def release(self) -> None:
+        """停止采集子进程并释放共享内存"""
+        self._opened = False
+        try:
+            self._conn.send(('stop',))
+        except (BrokenPipeError, OSError):
+            pass
+        if self._process.is_alive():
+            self._process.join(timeout=2.0)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join(timeout=1.0)
+        with self._lock:
+            ring, self._ring = self._ring, None
+            if ring is not None:
+                ring.unlink()
+                ring.close()
+        try:
+            self._conn.close()
+        except OSError:
+            pass
@@ -10,6 +10,7 @@ import logging
 import base64
 import json
 import signal
+import time
 
 # 创建日志记录器
 logger = logging.getLogger(__name__)
@@ -47,6 +48,7 @@ class PipelineService:
         self.db = db
         self.cv_operation_service = CVOperationService(db)
         self.logs = []
+        self.node_timings = {}  # 节点ID -> {'name': 操作名称, 'seconds': 执行耗时}，每次执行流水线时重置
 
     def get_pipelines(self) -> List[Pipeline]:
         """获取所有管道"""
@@ -302,8 +304,9 @@ class PipelineService:
 
     def apply_pipeline(self, pipeline_id: int, input_params: Dict[str, Any], enable_log: bool = False, timeout: int = 30) -> Dict[str, Any]:
         """执行流水线处理"""
-        # 重置日志列表
+        # 重置日志列表和节点耗时
         self.logs = []
+        self.node_timings = {}
         try:
             # 获取流水线定义
             pipeline = self.get_pipeline(pipeline_id)
@@ -354,7 +357,8 @@ class PipelineService:
             
             return {
                 'outputParams': output_params,
-                'logs': self.logs if enable_log else None
+                'logs': self.logs if enable_log else None,
+                'timings': self.node_timings
             }
             
         except Exception as e:
@@ -575,7 +579,9 @@ class PipelineService:
                 # 调用 apply_operation 方法
                 if enable_log:
                     self._add_log(logs, "INFO", f"开始执行操作代码")
+                started = time.perf_counter()
                 result = self.cv_operation_service.apply_operation(operation_id, params)
+                self.node_timings[node_id] = {'name': operation.name, 'seconds': time.perf_counter() - started}
                 if enable_log:
                     self._add_log(logs, "SUCCESS", f"操作执行成功，输出: {list(result.keys()) if isinstance(result, dict) else '非字典结果'}")
                 
@@ -949,7 +955,9 @@ class PipelineService:
             # 使用 cv_operation_service 执行操作
             try:
                 # 调用 apply_operation 方法
+                started = time.perf_counter()
                 result = self.cv_operation_service.apply_operation(operation_id, params)
+                self.node_timings[node_id] = {'name': operation.name, 'seconds': time.perf_counter() - started}
                 
                 results[node_id] = NodeResult(
                     node_type=NodeType.OPERATION,
@@ -0,0 +1,85 @@
+"""
+采集线程帧缓冲池（FramePool）与帧缓存配合时的复用测试
+在项目根目录执行: python -m pytest src/backend/tests
+"""
+import gc
+
+import numpy as np
+
+from src.backend.services.camera import FrameBuffer, FramePool
+
+SHAPE = (48, 64, 3)
+
+
+class _Source:
+    """模拟视频源的retrieve：writes_into为True时像cv2一样写入给定的数组，否则每帧自行分配"""
+
+    def __init__(self, writes_into: bool = True):
+        self.writes_into = writes_into
+        self.count = 0
+
+    def retrieve(self, image=None):
+        self.count += 1
+        frame = np.full(SHAPE, self.count % 256, np.uint8)
+        if self.writes_into and image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+
+def _capture(pool, source, frame_buffer, count):
+    """按采集线程的方式取帧：租出缓冲区、retrieve、记录结果后发布到帧缓存"""
+    for _ in range(count):
+        buffer = pool.acquire()
+        ret, frame = source.retrieve(buffer) if buffer is not None else source.retrieve()
+        pool.record(frame, buffer)
+        del buffer
+        frame_buffer.update_frame('camera_test', frame, True, SHAPE[1], SHAPE[0])
+
+
+def test_pool_reuses_ring_buffers():
+    frame_buffer = FrameBuffer(max_size=8)
+    pool = FramePool(frame_buffer.max_size + 4)
+    _capture(pool, _Source(), frame_buffer, 200)
+
+    stats = pool.get_stats()
+    # 首帧用于确定帧格式，之后每帧都写入池中的缓冲区
+    assert stats['hits'] == 199
+    assert stats['misses'] == 0
+    # 帧缓存的槽位就是池中的缓冲区：只比帧缓存多一块正在写入的缓冲区，且不随帧数增长
+    assert stats['allocations'] == frame_buffer.max_size + 1
+    assert stats['size'] == frame_buffer.max_size + 1
+
+    # 帧缓存中的历史帧未被后续帧覆盖
+    frames = frame_buffer.get_frames_since('camera_test', 0)
+    assert [int(frame.image[0, 0, 0]) for frame in frames] == list(range(193, 201))
+
+
+def test_pool_keeps_buffers_held_by_consumers():
+    frame_buffer = FrameBuffer(max_size=4)
+    pool = FramePool(frame_buffer.max_size + 2)
+    source = _Source()
+    _capture(pool, source, frame_buffer, 10)
+    held = frame_buffer.get_latest('camera_test').image[8:16, 8:16]
+
+    _capture(pool, source, frame_buffer, 50)
+    assert int(held[0, 0, 0]) == 10
+    assert pool.get_stats()['allocations'] == frame_buffer.max_size + 2
+
+    del held
+    gc.collect()
+    _capture(pool, source, frame_buffer, 10)
+    assert pool.get_stats()['allocations'] == frame_buffer.max_size + 2
+
+
+def test_pool_stops_leasing_when_source_allocates():
+    frame_buffer = FrameBuffer(max_size=8)
+    pool = FramePool(frame_buffer.max_size + 4)
+    _capture(pool, _Source(writes_into=False), frame_buffer, 100)
+
+    stats = pool.get_stats()
+    assert stats['bypassed']
+    assert stats['size'] == 0
+    assert stats['hits'] == 0
+    assert stats['allocations'] <= pool.size
+    assert pool.acquire() is None
@@ -0,0 +1,51 @@
+"""
+回放视频源（ReplayCapture）的节拍与时间戳测试
+在项目根目录执行: python -m pytest src/backend/tests
+"""
+import time
+
+import cv2
+import numpy as np
+
+from src.backend.services.camera_capture import ReplayCapture
+
+FPS = 20
+FRAMES = 10
+
+
+def _open_replay(directory, loop=True):
+    for i in range(FRAMES):
+        cv2.imwrite(str(directory / f"{i:03d}.png"), np.full((24, 32, 3), i * 20, np.uint8))
+    return ReplayCapture(f"dir://{directory}?fps={FPS}&loop={int(loop)}")
+
+
+def _frame_number(cap, start):
+    """由确定性时间戳推算出的已播放帧序号，start为第一帧的时间戳"""
+    return round((cap.get_timestamp() - start) * FPS)
+
+
+def test_lagging_reader_skips_source_frames(tmp_path):
+    """读取落后于节拍时跳过源帧，取出的帧内容与时间戳对应的帧一致"""
+    cap = _open_replay(tmp_path)
+    assert cap.grab()
+    start = cap.get_timestamp()
+    time.sleep(0.33)
+
+    for _ in range(3):
+        assert cap.grab()
+        ok, frame = cap.retrieve()
+        assert ok
+        number = _frame_number(cap, start)
+        assert number >= 6
+        assert int(frame[0, 0, 0]) == (number % FRAMES) * 20
+        time.sleep(0.27)
+
+
+def test_skip_past_end_finishes(tmp_path):
+    """不循环的回放源在跳帧时到达结尾后结束"""
+    cap = _open_replay(tmp_path, loop=False)
+    assert cap.grab()
+    time.sleep(0.7)
+
+    assert not cap.grab()
+    assert cap.finished
@@ -0,0 +1,68 @@
+"""
+子进程采集（SharedMemoryCapture）的共享内存协商测试
+在项目根目录执行: python -m pytest src/backend/tests
+"""
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from src.backend.services.camera_capture import SharedMemoryCapture
+
+
+def _write_images(directory, sizes):
+    for i, (width, height) in enumerate(sizes):
+        cv2.imwrite(str(directory / f"{i:03d}.png"), np.full((height, width, 3), i * 20, np.uint8))
+    return f"dir://{directory}?fps=60&loop=1"
+
+
+def _grab_frames(cap, count):
+    frames = []
+    for _ in range(count):
+        if cap.grab():
+            ok, frame = cap.retrieve()
+            if ok:
+                frames.append(frame)
+    return frames
+
+
+@pytest.fixture
+def open_capture():
+    captures = []
+
+    def _open(source):
+        cap = SharedMemoryCapture(source, slots=4)
+        captures.append(cap)
+        return cap
+
+    yield _open
+    for cap in captures:
+        cap.release()
+
+
+def test_delayed_first_grab(tmp_path, open_capture):
+    """主进程迟迟不grab时，子进程只请求一次共享内存，不会因打开已释放的共享内存而退出"""
+    cap = open_capture(_write_images(tmp_path, [(160, 120)] * 10))
+    assert cap.isOpened()
+    time.sleep(0.5)
+
+    frames = _grab_frames(cap, 30)
+    assert len(frames) == 30
+    assert cap.isOpened()
+    assert all(frame.shape == (120, 160, 3) for frame in frames)
+
+
+def test_resolution_change(tmp_path, open_capture):
+    """帧尺寸变化时重新分配共享内存，两种尺寸的帧都能取到，取出的帧不引用共享内存"""
+    cap = open_capture(_write_images(tmp_path, [(160, 120)] * 5 + [(320, 240)] * 5))
+    time.sleep(0.5)
+
+    frames = _grab_frames(cap, 60)
+    assert len(frames) >= 50
+    assert cap.isOpened()
+    assert {frame.shape for frame in frames} == {(120, 160, 3), (240, 320, 3)}
+
+    cap.release()
+    # 释放共享内存后已取出的帧仍然可读
+    assert all(frame.mean() >= 0 for frame in frames)